@@ -2,7 +2,7 @@ from django.contrib import admin
 from .models import (
     SolanaUser, Coin, CoinDRCScore, 
     DeveloperScore, TraderScore, 
-    UserCoinHoldings, Trade
+    UserCoinHoldings, Trade, DeadLetterEvent
 )
 
 class SolanaUserAdmin(admin.ModelAdmin):
@@ -28,9 +28,20 @@ class SolanaUserAdmin(admin.ModelAdmin):
     readonly_fields = ('last_login',)
 
 admin.site.register(SolanaUser, SolanaUserAdmin)
-admin.site.register(Coin)
+
+class CoinAdmin(admin.ModelAdmin):
+    """Admin interface for Coin"""
+
+    list_display = ('address', 'name', 'ticker', 'creator', 'current_price', 'holders_count', 'market_cap')
+    search_fields = ('address', 'name', 'ticker')
+
+    # maintained by trade ingestion; saving the form never writes them
+    readonly_fields = tuple(sorted(Coin.DERIVED_FIELDS))
+
+admin.site.register(Coin, CoinAdmin)
 admin.site.register(DeveloperScore)
 admin.site.register(TraderScore)
 admin.site.register(CoinDRCScore)
 admin.site.register(UserCoinHoldings)
-admin.site.register(Trade)
\ No newline at end of file
+admin.site.register(Trade)
+admin.site.register(DeadLetterEvent)
@@ -2,7 +2,12 @@ from solana.rpc.websocket_api import connect, RpcTransactionLogsFilterMentions
 from solders.pubkey import Pubkey 
 import asyncio
 import logging
+import time
 from solders.rpc import responses
+from systems.utils.notifications import LogNotification, SubscriptionMap
+from systems.utils.backfill import Backfiller
+from systems.utils.fanin import SignatureFanIn
+from systems.utils.inbox import NotificationQueue
 
 # Configure logging
 logging.basicConfig(
@@ -11,43 +16,29 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-class SolanaEventListener: 
-    def __init__(self, rpc_ws_url, program_id, callback=None, commitment='confirmed',
-                 max_retries=10, retry_delay=5, auto_restart=True): 
-        """ 
-        Initialize the Solana event listener with auto-restart capability. 
-         
-        Args: 
-            rpc_ws_url (str): Solana WebSocket RPC URL 
-            program_id (str): The program ID to monitor for events 
-            callback (callable): Function to call when logs are received 
-            commitment (str): Commitment level (processed, confirmed, finalized)
-            max_retries (int): Maximum number of reconnection attempts (None for infinite)
-            retry_delay (int): Delay in seconds between retry attempts
-            auto_restart (bool): Whether to automatically restart on failure
-        """ 
-        self.rpc_ws_url = rpc_ws_url 
-        self.program_id = Pubkey.from_string(program_id) 
-        self.commitment = commitment 
-        self.callback = callback 
-        self.subscription_id = None 
+class EndpointConnection:
+    """One websocket endpoint and a program logs subscription per program on it"""
+    def __init__(self, rpc_ws_url, program_ids, commitment='confirmed'):
+        self.url = rpc_ws_url
+        self.program_ids = list(program_ids)
+        self.commitment = commitment
+        self.subscriptions = None
         self.ws_connection = None
-        self.max_retries = max_retries
-        self.retry_delay = retry_delay
-        self.auto_restart = auto_restart
-        self.should_run = False
         self.retry_count = 0
-         
+        self.last_message_at = None  # monotonic
+        self.down_since = None  # monotonic, while reconnecting
+        self.replaced = False  # swapped for a fresh connection while being read
+
     async def connect(self): 
         """Establish connection to Solana WebSocket endpoint""" 
         try:
-            self.ws_connection = await connect(self.rpc_ws_url) 
-            logger.info(f"Connected to Solana WebSocket at {self.rpc_ws_url}")
+            self.ws_connection = await connect(self.url) 
+            logger.info(f"Connected to Solana WebSocket at {self.url}")
             # Reset retry count on successful connection
             self.retry_count = 0
             return True
         except Exception as e:
-            logger.error(f"Connection failed: {e}")
+            logger.error(f"Connection to {self.url} failed: {e}")
             return False
          
     async def subscribe_program_logs(self): 
@@ -58,36 +49,147 @@ class SolanaEventListener:
                 return False
          
         try:
-            # Create a proper filter object for the program ID 
-            program_filter = RpcTransactionLogsFilterMentions(self.program_id) 
-             
-            # Subscribe to program logs 
-            subscription_id = await self.ws_connection.logs_subscribe( 
-                program_filter, 
-                self.commitment 
-            ) 
-            
-            self.subscription_id = subscription_id 
-            logger.info(f"Subscribed to logs for program {self.program_id}")
+            # every program is subscribed on this one connection; the node
+            # confirms each subscription in the message stream
+            self.subscriptions = SubscriptionMap(self.program_ids)
+            for program_id in self.program_ids:
+                program_filter = RpcTransactionLogsFilterMentions(program_id)
+                await self.ws_connection.logs_subscribe(program_filter, self.commitment)
+            logger.info(f"Subscribed to logs for {', '.join(map(str, self.program_ids))} on {self.url}")
+            self.last_message_at = time.monotonic()
             return True
         except Exception as e:
-            logger.error(f"Subscription failed: {e}")
+            logger.error(f"Subscription on {self.url} failed: {e}")
             return False
+
+    async def unsubscribe(self): 
+        """Unsubscribe from program logs""" 
+        if self.ws_connection and self.subscriptions: 
+            try:
+                for subscription_id in self.subscriptions.subscription_ids():
+                    await self.ws_connection.logs_unsubscribe(subscription_id) 
+                    logger.info(f"Unsubscribed from logs on {self.url} (ID: {subscription_id})") 
+            except Exception as e:
+                logger.warning(f"Error unsubscribing: {e}")
+            finally:
+                self.subscriptions = None 
+     
+    async def ping(self, timeout: float) -> bool:
+        """Round-trip a websocket ping; False if no pong comes back in time"""
+        ping = getattr(self.ws_connection, 'ping', None)
+        if ping is None:
+            return True
+        try:
+            pong = await ping()
+            await asyncio.wait_for(pong, timeout)
+            return True
+        except Exception as e:
+            logger.warning(f"Ping to {self.url} failed: {e!r}")
+            return False
+
+    def swap(self, replacement):
+        """Take over the replacement's socket and subscriptions, leaving it the old ones to close"""
+        self.ws_connection, replacement.ws_connection = replacement.ws_connection, self.ws_connection
+        self.subscriptions, replacement.subscriptions = replacement.subscriptions, self.subscriptions
+        self.last_message_at = replacement.last_message_at
+        self.replaced = True
+
+    async def close(self, unsubscribe=True): 
+        """Close WebSocket connection""" 
+        if unsubscribe and self.subscriptions: 
+            await self.unsubscribe() 
+         
+        if self.ws_connection: 
+            try:
+                await self.ws_connection.close() 
+                logger.info(f"WebSocket connection to {self.url} closed") 
+            except Exception as e:
+                logger.warning(f"Error closing connection: {e}")
+            finally:
+                self.ws_connection = None
+
+class SolanaEventListener: 
+    def __init__(self, rpc_ws_url, program_id, callback=None, commitment='confirmed',
+                 max_retries=10, retry_delay=5, auto_restart=True, archive=None,
+                 rpc_client=None, checkpoint=None, backfill_concurrency=8, signature_filter=None,
+                 queue=None, metrics=None, standby=False,
+                 heartbeat_interval=10, ping_timeout=5, idle_timeout=None): 
+        """ 
+        Initialize the Solana event listener with auto-restart capability. 
+         
+        Args: 
+            rpc_ws_url (str | list): Solana WebSocket RPC URL, or several to subscribe on at once
+            program_id (str | list): The program ID to monitor for events, or several to multiplex on each connection
+            callback (callable): Function to call when logs are received 
+            commitment (str): Commitment level (processed, confirmed, finalized)
+            max_retries (int): Maximum number of reconnection attempts per endpoint (None for infinite)
+            retry_delay (int): Delay in seconds between retry attempts
+            auto_restart (bool): Whether to automatically restart on failure
+            archive (ArchiveWriter): Optional archive every notification is appended to
+            rpc_client (SolanaRpcClient): HTTP RPC client used to backfill missed transactions
+            checkpoint (CheckpointStore | dict): Where the last committed slot/signature is kept, per program id when several
+            backfill_concurrency (int): Maximum getTransaction calls in flight while backfilling
+            signature_filter (SignatureFilter): Window of recently delivered signatures
+            queue (NotificationQueue): Buffer between the socket readers and the callback
+            metrics (ListenerMetrics): Optional metrics the listener reports to
+            standby (bool): Keep the subscriptions warm but hand nothing off until promote()
+            heartbeat_interval (float): Seconds between health checks of each connection (None to disable)
+            ping_timeout (float): Seconds to wait for a pong before the connection counts as dead
+            idle_timeout (float): Replace a connection that delivered nothing for this long (None to disable)
+        """ 
+        urls = [rpc_ws_url] if isinstance(rpc_ws_url, str) else list(rpc_ws_url)
+        self.rpc_ws_url = urls[0]
+        program_ids = [program_id] if isinstance(program_id, str) else list(program_id)
+        self.program_ids = [Pubkey.from_string(program) for program in program_ids]
+        self.program_id = self.program_ids[0]
+        self.commitment = commitment 
+        self.callback = callback 
+        self.endpoints = [EndpointConnection(url, self.program_ids, commitment) for url in urls]
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.auto_restart = auto_restart
+        self.should_run = False
+        self.archive = archive
+        self.rpc_client = rpc_client
+        if isinstance(checkpoint, dict):
+            self.checkpoints = dict(checkpoint)
+        else:
+            self.checkpoints = {str(self.program_id): checkpoint} if checkpoint else {}
+        self.backfill_concurrency = backfill_concurrency
+        # every endpoint sends its own copy, and backfills overlap the live stream;
+        # the first copy of a signature wins
+        self.fan_in = SignatureFanIn(seen=signature_filter)
+        self.live_endpoints = set()
+        self.backfill_lock = asyncio.Lock()
+        # sockets are read at wire speed; the callback drains this on its own task
+        self.queue = queue or NotificationQueue()
+        self.consumer = None
+        self.metrics = metrics
+        if metrics:
+            metrics.watch_inbox(self.queue)
+        # a standby reads its sockets but drops everything; promote() catches up
+        # from the shared checkpoint, while live notifications wait on the socket
+        self.active = not standby
+        self.caught_up = asyncio.Event()
+        self.caught_up.set()
+        self.standby_dropped = 0
+        self.heartbeat_interval = heartbeat_interval
+        self.ping_timeout = ping_timeout
+        self.idle_timeout = idle_timeout
+        self.watchers = []
     
-    async def process_messages(self):
-        """Process incoming messages from websocket"""
-        if not self.ws_connection:
+    async def process_messages(self, endpoint):
+        """Process incoming messages from one endpoint's websocket"""
+        connection, subscriptions = endpoint.ws_connection, endpoint.subscriptions
+        if not connection:
             return False
             
         try:
-            async for msg in self.ws_connection: 
+            async for msg in connection: 
                 if not self.should_run:
                     break
-                # Handle subscription response 
-                # Skip subscription confirmation (has `result` but no `method`)
-                if hasattr(msg, 'result') and not hasattr(msg, 'method'):
-                    return
-
+                if connection is endpoint.ws_connection:
+                    endpoint.last_message_at = time.monotonic()
                 # Extract notification payload depending on format
                 notifications = []
 
@@ -98,93 +200,307 @@ class SolanaEventListener:
                     notifications.append(msg)
 
                 for note in notifications:
-                    # Object-style (e.g., from `websockets` or `jsonrpcclient`)
-                    if hasattr(note, 'method') and note.method == "logsNotification":
-                        result = getattr(note.params, 'result', None)
-                        if result and self.callback:
-                            await self.callback(result.value)
-                    
-                    if type(note) == responses.LogsNotification:
-                        await self.callback(note.result.value)
-
-                    # Dict-style message (e.g., raw JSON from some WebSocket clients)
-                    elif isinstance(note, dict) and note.get("method") == "logsNotification":
-                        result = note.get("params", {}).get("result", {})
-                        if self.callback:
-                            await self.callback(result.get("value", {}))
+                    confirmation = self.parse_confirmation(note)
+                    if confirmation is not None:
+                        subscriptions.confirm(*confirmation)
+                        continue
+                    notification = self.parse_notification(note, subscriptions)
+                    if notification is not None:
+                        await self.deliver(notification, endpoint.url)
             
             return True
         except Exception as e:
-            logger.error(f"Error processing messages: {e}")
+            if connection is not endpoint.ws_connection:
+                return True  # the old socket of a replaced connection was closed
+            logger.error(f"Error processing messages from {endpoint.url}: {e}")
             import traceback
             traceback.print_exc()
             return False
 
+    async def deliver(self, notification: LogNotification, source: str = "backfill"):
+        """Queue a notification once, whichever endpoint or backfill it came from"""
+        if source != "backfill" and not self.caught_up.is_set():
+            await self.caught_up.wait()
+        if not self.active:
+            # not recorded as seen, so the backfill on promotion delivers it
+            self.standby_dropped += 1
+            return
+        if self.metrics:
+            self.metrics.notifications.inc(source=source)
+        if notification.signature and not self.fan_in.arrive(self.delivery_key(notification), source):
+            if self.metrics:
+                self.metrics.duplicates.inc()
+            return
+        await self.queue.put(notification)
+
+    def delivery_key(self, notification: LogNotification) -> str:
+        """A transaction that mentions several programs is delivered once per program"""
+        if len(self.program_ids) == 1:
+            return notification.signature
+        return f"{notification.program_id}:{notification.signature}"
+
+    async def process_queue(self):
+        """Feed queued notifications to the callback, in arrival order"""
+        while True:
+            notification = await self.queue.get()
+            try:
+                # queued before a demotion; the new leader backfills it
+                if self.active:
+                    await self.hand_off(notification)
+            except Exception as e:
+                logger.error(f"Callback failed for {notification.signature}: {e}")
+            finally:
+                await self.queue.task_done()
+
+    async def hand_off(self, notification: LogNotification):
+        if self.archive:
+            self.archive.write(notification)
+        # the callback only queues the decoded events; the checkpoint moves
+        # past the notification once the workers have committed all of them
+        checkpoint = self.checkpoints.get(notification.program_id or str(self.program_id))
+        if checkpoint:
+            notification.delivery = checkpoint.track(notification.slot, notification.signature)
+        try:
+            if self.callback:
+                await self.callback(notification)
+        finally:
+            if checkpoint:
+                notification.delivery.release()
+        if checkpoint:
+            await checkpoint.maybe_save()
+
+    def endpoint_stats(self) -> list:
+        """Arrival stats per endpoint, fastest first"""
+        return self.fan_in.summary()
+
+    async def backfill(self):
+        """Deliver everything each program emitted since its checkpoint"""
+        if not self.rpc_client:
+            return
+        for program_id, checkpoint in self.checkpoints.items():
+            if checkpoint.signature is None:
+                await checkpoint.load()
+            if checkpoint.signature is None:
+                logger.info(f"No checkpoint yet for {program_id}, nothing to backfill")
+                continue
+            backfiller = Backfiller(
+                self.rpc_client, program_id, self.deliver,
+                concurrency=self.backfill_concurrency, commitment=self.commitment,
+            )
+            count = await backfiller.run(checkpoint.signature)
+            logger.info(f"Backfilled {count} transactions of {program_id} since slot {checkpoint.slot}")
+
+    async def promote(self):
+        """
+        Become the active listener: resume from the checkpoints the previous
+        leader saved, backfill the gap, then let live notifications through.
+        """
+        self.caught_up.clear()
+        try:
+            self.active = True
+            # notifications dropped in standby must not count as seen
+            self.fan_in.seen.clear()
+            async with self.backfill_lock:
+                for checkpoint in self.checkpoints.values():
+                    await checkpoint.load()
+                await self.backfill()
+        finally:
+            self.caught_up.set()
+        logger.info(f"Listener promoted after dropping {self.standby_dropped} notifications in standby")
+
+    def demote(self):
+        """Stop handing anything off; the next leader resumes from the saved checkpoints"""
+        self.active = False
+        for checkpoint in self.checkpoints.values():
+            # never overwrite the new leader's progress with ours
+            checkpoint.forget()
+
+    @staticmethod
+    def parse_confirmation(note) -> tuple | None:
+        """(request id, subscription id) if the message confirms a subscription"""
+        if isinstance(note, dict):
+            if "method" not in note and isinstance(note.get("result"), int):
+                return note.get("id"), note["result"]
+            return None
+        if not hasattr(note, 'method') and isinstance(getattr(note, 'result', None), int):
+            return getattr(note, 'id', None), note.result
+        return None
+
+    @staticmethod
+    def parse_notification(note, subscriptions=None) -> LogNotification | None:
+        """Turn any of the websocket message formats into a LogNotification"""
+        if isinstance(note, responses.LogsNotification):
+            result = note.result
+            subscription = note.subscription
+        # Object-style (e.g., from `websockets` or `jsonrpcclient`)
+        elif hasattr(note, 'method') and note.method == "logsNotification":
+            result = getattr(note.params, 'result', None)
+            subscription = getattr(note.params, 'subscription', None)
+        # Dict-style message (e.g., raw JSON from some WebSocket clients)
+        elif isinstance(note, dict) and note.get("method") == "logsNotification":
+            params = note.get("params", {})
+            result = params.get("result", {})
+            value = result.get("value", {})
+            return LogNotification(
+                value.get("signature"),
+                result.get("context", {}).get("slot"),
+                value.get("logs", []),
+                value.get("err"),
+                program_id=subscriptions.program_for(params.get("subscription")) if subscriptions else None,
+            )
+        else:
+            return None
+
+        if result is None:
+            return None
+        value = result.value
+        return LogNotification(
+            value.signature, result.context.slot, value.logs, value.err,
+            program_id=subscriptions.program_for(subscription) if subscriptions else None,
+        )
+
     async def listen(self):
         """Main method to start the listener with auto-restart capability"""
         self.should_run = True
-        
+        if self.consumer is None:
+            self.consumer = asyncio.create_task(self.process_queue())
+        if self.heartbeat_interval and not self.watchers:
+            self.watchers = [asyncio.create_task(self.watch(endpoint)) for endpoint in self.endpoints]
+        await asyncio.gather(*(self.listen_endpoint(endpoint) for endpoint in self.endpoints))
+
+    async def listen_endpoint(self, endpoint):
+        """Keep one endpoint subscribed, reconnecting with exponential backoff"""
         while self.should_run:
             try:
-                # Connect and subscribe
-                subscription_success = await self.subscribe_program_logs()
-                if not subscription_success:
-                    raise Exception("Failed to subscribe to program logs")
+                # the watchdog already subscribed on a fresh connection, and it
+                # overlapped the old one, so there is no gap to fill either
+                swapped = endpoint.replaced
+                if swapped:
+                    endpoint.replaced = False
+                else:
+                    # Connect and subscribe
+                    subscription_success = await endpoint.subscribe_program_logs()
+                    if not subscription_success:
+                        raise Exception("Failed to subscribe to program logs")
+                    self.fan_in.endpoint(endpoint.url).connects += 1
+                    if self.metrics:
+                        self.metrics.connects.inc(endpoint=endpoint.url)
+                    if endpoint.down_since is not None:
+                        self.record_reconnect(endpoint, endpoint.down_since, "reconnect")
+                        endpoint.down_since = None
+
+                # Live notifications wait on the socket while the gap is filled,
+                # then anything the backfill already delivered is skipped.
+                # Nothing was missed if another endpoint stayed subscribed;
+                # a standby catches up when it is promoted instead.
+                async with self.backfill_lock:
+                    if not self.live_endpoints and self.active and not swapped:
+                        await self.backfill()
+                    self.live_endpoints.add(endpoint.url)
                 
                 # Process messages
-                processing_success = await self.process_messages()
+                try:
+                    processing_success = await self.process_messages(endpoint)
+                finally:
+                    self.live_endpoints.discard(endpoint.url)
+                if endpoint.replaced:
+                    continue
                 if not processing_success:
                     raise Exception("Message processing failed")
                 
             except Exception as e:
-                logger.error(f"Listener error: {e}")
+                logger.error(f"Listener error on {endpoint.url}: {e}")
+                if endpoint.down_since is None:
+                    endpoint.down_since = time.monotonic()
                 # Clean up existing connection
-                await self.close(unsubscribe=True)
+                await endpoint.close(unsubscribe=True)
                 
                 if not self.auto_restart:
                     logger.info("Auto-restart disabled. Exiting.")
                     break
                 
                 # Implement exponential backoff
-                self.retry_count += 1
-                if self.max_retries is not None and self.retry_count > self.max_retries:
-                    logger.error(f"Maximum retry attempts ({self.max_retries}) reached. Stopping.")
+                endpoint.retry_count += 1
+                if self.max_retries is not None and endpoint.retry_count > self.max_retries:
+                    logger.error(f"Maximum retry attempts ({self.max_retries}) reached for {endpoint.url}. Stopping.")
                     break
                     
-                backoff_time = min(self.retry_delay * (2 ** (self.retry_count - 1)), 60)  # Cap at 60 seconds
-                logger.info(f"Attempting to restart in {backoff_time} seconds (retry {self.retry_count}/{self.max_retries if self.max_retries else 'unlimited'})")
+                # the first retry is immediate; back off only if that fails too
+                backoff_time = 0 if endpoint.retry_count == 1 else min(self.retry_delay * (2 ** (endpoint.retry_count - 2)), 60)  # Cap at 60 seconds
+                logger.info(f"Attempting to restart {endpoint.url} in {backoff_time} seconds (retry {endpoint.retry_count}/{self.max_retries if self.max_retries else 'unlimited'})")
                 await asyncio.sleep(backoff_time)
             
+    async def watch(self, endpoint):
+        """
+        Heartbeat for one endpoint. A connection that misses a pong, or has been
+        silent for idle_timeout, is replaced before it is closed.
+        """
+        while self.should_run:
+            await asyncio.sleep(self.heartbeat_interval)
+            # only connections being read; the reconnect loop handles the rest
+            if endpoint.url not in self.live_endpoints or endpoint.replaced:
+                continue
+            if self.idle_timeout and time.monotonic() - endpoint.last_message_at > self.idle_timeout:
+                reason = "idle"
+            elif not await endpoint.ping(self.ping_timeout):
+                reason = "ping"
+            else:
+                continue
+            if self.metrics:
+                self.metrics.stale_connections.inc(endpoint=endpoint.url, reason=reason)
+            try:
+                await self.replace_connection(endpoint, reason)
+            except Exception as e:
+                logger.error(f"Replacing the connection to {endpoint.url} failed: {e}")
+
+    async def replace_connection(self, endpoint, reason: str):
+        """Make-before-break: subscribe on a new connection, then close the stale one"""
+        started = time.monotonic()
+        logger.warning(f"Connection to {endpoint.url} looks stale ({reason}), replacing it")
+        replacement = EndpointConnection(endpoint.url, self.program_ids, self.commitment)
+        if not await replacement.subscribe_program_logs():
+            await replacement.close(unsubscribe=False)
+            # the reader stops on the closed socket and the reconnect loop takes over
+            endpoint.down_since = started
+            await endpoint.close(unsubscribe=False)
+            return
+        endpoint.swap(replacement)
+        self.fan_in.endpoint(endpoint.url).connects += 1
+        if self.metrics:
+            self.metrics.connects.inc(endpoint=endpoint.url)
+        self.record_reconnect(endpoint, started, "replace")
+        # replacement now holds the stale socket; its reader ends once it is closed
+        try:
+            await asyncio.wait_for(replacement.close(), self.ping_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Stale connection to {endpoint.url} did not close cleanly")
+
+    def record_reconnect(self, endpoint, started: float, kind: str):
+        duration = time.monotonic() - started
+        logger.info(f"Resubscribed to {endpoint.url} in {duration:.3f}s ({kind})")
+        if self.metrics:
+            self.metrics.reconnect_seconds.observe(duration, endpoint=endpoint.url, kind=kind)
+
     async def stop(self):
         """Stop the listener gracefully"""
         logger.info("Stopping listener...")
         self.should_run = False
-        await self.close()
-        
-    async def unsubscribe(self): 
-        """Unsubscribe from program logs""" 
-        if self.ws_connection and self.subscription_id: 
-            try:
-                await self.ws_connection.logs_unsubscribe(self.subscription_id) 
-                logger.info(f"Unsubscribed from logs (ID: {self.subscription_id})") 
-            except Exception as e:
-                logger.warning(f"Error unsubscribing: {e}")
-            finally:
-                self.subscription_id = None 
-     
-    async def close(self, unsubscribe=True): 
-        """Close WebSocket connection""" 
-        if unsubscribe and self.subscription_id: 
-            await self.unsubscribe() 
-         
-        if self.ws_connection: 
-            try:
-                await self.ws_connection.close() 
-                logger.info("WebSocket connection closed") 
-            except Exception as e:
-                logger.warning(f"Error closing connection: {e}")
-            finally:
-                self.ws_connection = None
+        for watcher in self.watchers:
+            watcher.cancel()
+        self.watchers = []
+        for stats in self.endpoint_stats():
+            logger.info(f"Endpoint stats: {stats}")
+        logger.info(f"Signature filter: {self.fan_in.seen.stats()}")
+        await asyncio.gather(*(endpoint.close() for endpoint in self.endpoints))
+        # everything already read off the sockets is still handed to the callback
+        if self.consumer:
+            await self.queue.join()
+            self.consumer.cancel()
+            self.consumer = None
+        logger.info(f"Notification queue: {self.queue.stats()}")
+        self.queue.close()
+        if self.rpc_client:
+            await self.rpc_client.close()
 
 # Example usage:
 async def example_log_callback(log_data):
@@ -0,0 +1,98 @@
+import time
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from systems.models import Coin, Trade, SolanaUser
+from systems.utils.ingest import ingest_trades, bigint_to_decimal, get_transaction_type, SOL_DECIMALS
+
+class Rollback(Exception):
+    pass
+
+class Command(BaseCommand):
+    help = 'Compare per-trade save() and batched trade ingestion throughput (all writes are rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=2000, help='Number of synthetic trades per run')
+        parser.add_argument('--batch-size', type=int, default=100, help='Trades per batch for the batched run')
+        parser.add_argument('--users', type=int, default=50, help='Number of distinct traders')
+
+    def handle(self, *args, **options):
+        events = options['events']
+        batch_size = options['batch_size']
+
+        # Broadcasting goes through Redis; keep it out of both measurements.
+        with mock.patch('systems.signals.broadcast_trade_created'), \
+             mock.patch('systems.signals.broadcast_coin_created'), \
+             mock.patch('systems.utils.ingest.broadcast_trade_created'):
+            per_trade = self.run_isolated(self.ingest_one_by_one, events, options['users'])
+            batched = self.run_isolated(
+                lambda trades: self.ingest_batched(trades, batch_size), events, options['users']
+            )
+
+        self.stdout.write(f"per-trade save(): {events / per_trade:,.0f} events/sec ({per_trade:.2f}s)")
+        self.stdout.write(f"batched:          {events / batched:,.0f} events/sec ({batched:.2f}s, batch size {batch_size})")
+        self.stdout.write(self.style.SUCCESS(f"speedup: {per_trade / batched:.1f}x"))
+
+    def run_isolated(self, ingest, events, user_count) -> float:
+        """Run one ingestion strategy on fresh fixtures and roll everything back"""
+        elapsed = 0.0
+        try:
+            with transaction.atomic():
+                trades = self.make_fixtures(events, user_count)
+                start = time.perf_counter()
+                ingest(trades)
+                elapsed = time.perf_counter() - start
+                raise Rollback()
+        except Rollback:
+            pass
+        return elapsed
+
+    def make_fixtures(self, events, user_count) -> list:
+        users = [
+            SolanaUser.objects.create_user(wallet_address=f"BENCH{i:039d}")
+            for i in range(user_count)
+        ]
+        coin = Coin.objects.create(
+            address=f"BENCHCOIN{0:035d}",
+            name="Benchmark Coin",
+            ticker="BENCH",
+            creator=users[0],
+            total_supply=1000000,
+            image_url="https://example.com/bench.png",
+        )
+        return [
+            (f"BENCHSIG{i:080d}", {
+                "transfer_type": 0 if i % 4 else 1,
+                "mint_address": coin.address,
+                "user": users[i % user_count].wallet_address,
+                "sol_amount": 1_000_000,
+                "coin_amount": 5_000_000_000,
+            })
+            for i in range(events)
+        ]
+
+    def ingest_one_by_one(self, trades: list):
+        """
+        Lookups, an exists() check and a save() per trade, as the listener used
+        to write them. The save goes through today's post_save signal, which
+        applies holdings with the same upserts as a batch, so this measures
+        per-trade round trips rather than the original holdings code.
+        """
+        for signature, logs in trades:
+            user = SolanaUser.objects.get(wallet_address=logs["user"])
+            coin = Coin.objects.get(address=logs["mint_address"])
+            if not Trade.objects.filter(transaction_hash=signature).exists():
+                Trade(
+                    transaction_hash=signature,
+                    user=user,
+                    coin=coin,
+                    trade_type=get_transaction_type(logs["transfer_type"]),
+                    coin_amount=bigint_to_decimal(logs["coin_amount"], coin.decimals),
+                    sol_amount=bigint_to_decimal(logs["sol_amount"], SOL_DECIMALS),
+                ).save()
+
+    def ingest_batched(self, trades: list, batch_size: int):
+        for start in range(0, len(trades), batch_size):
+            ingest_trades(trades[start:start + batch_size])
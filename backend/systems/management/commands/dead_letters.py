@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.utils import timezone
+
+from ...models import DeadLetterEvent
+
+class Command(BaseCommand):
+    help = 'Inspect dead-lettered listener events and queue them for replay'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'ids',
+            nargs='*',
+            type=int,
+            help='Dead letters to act on (all of them if none are given)',
+        )
+        parser.add_argument(
+            '--show',
+            action='store_true',
+            help='Print the stored payload of each dead letter',
+        )
+        parser.add_argument(
+            '--exhausted',
+            action='store_true',
+            help='Only dead letters that have used up their automatic retries',
+        )
+        parser.add_argument(
+            '--replay',
+            action='store_true',
+            help='Reset the attempt count so the running listener retries them straight away',
+        )
+        parser.add_argument(
+            '--purge',
+            action='store_true',
+            help='Delete the dead letters instead',
+        )
+
+    def handle(self, *args, **options):
+        letters = DeadLetterEvent.objects.all()
+        if options['ids']:
+            letters = letters.filter(pk__in=options['ids'])
+        if options['exhausted']:
+            letters = letters.filter(next_retry_at__isnull=True)
+
+        if options['purge']:
+            deleted, _ = letters.delete()
+            self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} dead letters"))
+            return
+        if options['replay']:
+            queued = letters.update(attempts=0, next_retry_at=timezone.now())
+            self.stdout.write(self.style.SUCCESS(f"Queued {queued} dead letters for replay"))
+            return
+
+        for row in letters.values('reason').annotate(count=Count('id')).order_by('-count'):
+            self.stdout.write(f"{row['count']:>6}  {row['reason']}")
+        for letter in letters:
+            retry = letter.next_retry_at.isoformat() if letter.next_retry_at else "exhausted"
+            self.stdout.write(
+                f"#{letter.pk} {letter.event_type} {letter.signature} {letter.mint_address} "
+                f"attempts={letter.attempts} next={retry}"
+            )
+            if options['show']:
+                self.stdout.write(f"    {letter.payload}")
@@ -1,9 +1,8 @@
 from django.core.management.base import BaseCommand
-from django.utils import timezone
 from django.db.models import Count
 
 from ...models import (
-    SolanaUser, Coin, Trade,
+    SolanaUser, Coin,
     DeveloperScore, TraderScore, CoinDRCScore
 )
 
@@ -122,17 +121,7 @@ class Command(BaseCommand):
             coin_score.update_age()
             coin_score.update_holders_count()
             
-            # Calculate trade volume in last 24h
-            one_day_ago = timezone.now() - timezone.timedelta(hours=24)
-            recent_trades = Trade.objects.filter(
-                coin=coin,
-                created_at__gte=one_day_ago
-            )
-            
-            if recent_trades.exists():
-                volume = sum(t.sol_amount for t in recent_trades)
-                coin_score.trade_volume_24h = volume
-                coin_score.save(update_fields=['trade_volume_24h'])
+            # 24h volume is not stored on the score; Coin.rolling_volume() reads it from the candles
             
             # Set verified contract status based on coin model
             # coin_score.verified_contract = coin.contract_verified
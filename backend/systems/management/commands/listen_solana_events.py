@@ -1,245 +1,529 @@
 import asyncio
-from django.core.management.base import BaseCommand
+import logging
+from django.core.management.base import BaseCommand, CommandError
 from systems.listeners import SolanaEventListener
-from systems.models import Coin, Trade, SolanaUser
+from systems.models import Coin, SolanaUser
 from decimal import Decimal
-from systems.parser import TokenEventDecoder
-from django.db import OperationalError
-from asgiref.sync import sync_to_async
-import requests
-import aiohttp
+from systems.parser import load_idl_registry, DEFAULT_IDL_PATH
+from systems.utils.dispatcher import CoinDispatcher, CoinNotReady, TRADE_EVENTS
+from systems.utils.deadletter import DeadLetterRetrier, store_dead_letters, resolve_dead_letters
+from systems.utils.provisional import ProvisionalReconciler
+from systems.utils.archive import ArchiveWriter, replay_archive, parse_speed
+from systems.utils.backfill import SolanaRpcClient, CheckpointStore, http_url_for
+from systems.utils.metadata import MetadataEnricher, MetadataFetcher, metadata_fields
+from systems.utils.broadcast import broadcast_coin_updated
+from systems.utils.identity import IdentityCache
+from systems.utils.dedup import SignatureFilter
+from systems.utils.inbox import NotificationQueue, OVERFLOW_POLICIES
+from systems.utils.metrics import ListenerMetrics, MetricsServer
+from systems.utils.leader import LeaderElector
+from systems.utils.ingest import ingest_trades, rollback_provisional, bigint_to_decimal, get_transaction_type
 import time
 from django.db import connection, close_old_connections
+from django.db.models import F, Value
+
+DEFAULT_PROGRAM_ID = "A7sBBSngzEZTsCPCffHDbeXDJ54uJWkwdEsskmn2YBGo"
+
+logger = logging.getLogger(__name__)
 
 class Command(BaseCommand):
     help = 'Listen for Solana program events'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Maximum number of trades written per batch',
+        )
+        parser.add_argument(
+            '--batch-window',
+            type=float,
+            default=0.25,
+            help='Seconds to wait for more trades before flushing a batch',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Number of DB worker threads; events are spread across them by mint address',
+        )
+        parser.add_argument(
+            '--idl',
+            default=str(DEFAULT_IDL_PATH),
+            help='Anchor IDL of the program; every event in it gets a decoder',
+        )
+        parser.add_argument(
+            '--program',
+            action='append',
+            dest='programs',
+            metavar='PROGRAM_ID[=IDL]',
+            help='Program to follow, optionally with its own IDL (defaults to --idl); repeat to '
+                 'multiplex several programs on each connection',
+        )
+        parser.add_argument(
+            '--queue-size',
+            type=int,
+            default=1000,
+            help='Maximum number of events waiting on each worker queue',
+        )
+        parser.add_argument(
+            '--inbox-size',
+            type=int,
+            default=10000,
+            help='Maximum number of notifications read off the websocket and waiting to be processed',
+        )
+        parser.add_argument(
+            '--overflow',
+            choices=OVERFLOW_POLICIES,
+            default='block',
+            help='When the inbox is full: block reading the socket, spill to disk, or drop and log an error',
+        )
+        parser.add_argument(
+            '--spill-file',
+            help='File used by --overflow spill (a temporary file by default)',
+        )
+        parser.add_argument(
+            '--lease',
+            help='Run as one of several replicas: only the holder of this named lease writes, '
+                 'the others stay subscribed and take over when it expires',
+        )
+        parser.add_argument(
+            '--lease-ttl',
+            type=float,
+            default=10,
+            help='Seconds a lease lasts without renewal; a standby takes over within about this long',
+        )
+        parser.add_argument(
+            '--metrics-port',
+            type=int,
+            default=0,
+            help='Port of the Prometheus metrics endpoint, off by default; give each replica on a host its own',
+        )
+        parser.add_argument(
+            '--metrics-host',
+            default='127.0.0.1',
+            help='Address the metrics endpoint listens on',
+        )
+        parser.add_argument(
+            '--heartbeat-interval',
+            type=float,
+            default=10,
+            help='Seconds between websocket pings on each connection (0 disables the watchdog)',
+        )
+        parser.add_argument(
+            '--ping-timeout',
+            type=float,
+            default=5,
+            help='Seconds to wait for a pong before replacing the connection',
+        )
+        parser.add_argument(
+            '--idle-timeout',
+            type=float,
+            default=120,
+            help='Replace a connection that delivered no message for this many seconds (0 disables)',
+        )
+        parser.add_argument(
+            '--archive',
+            help='Append every raw notification to this file (gzip-compressed if it ends in .gz)',
+        )
+        parser.add_argument(
+            '--replay',
+            help='Replay an archive file through the event handlers instead of listening',
+        )
+        parser.add_argument(
+            '--ws-url',
+            action='append',
+            dest='ws_urls',
+            help='Websocket RPC endpoint to subscribe on; repeat to fan in from several providers',
+        )
+        parser.add_argument(
+            '--rpc-url',
+            help='HTTP RPC endpoint used to backfill missed transactions (defaults to the websocket host)',
+        )
+        parser.add_argument(
+            '--backfill-concurrency',
+            type=int,
+            default=8,
+            help='Maximum getTransaction requests in flight while backfilling after a reconnect',
+        )
+        parser.add_argument(
+            '--metadata-concurrency',
+            type=int,
+            default=8,
+            help='Number of coins whose IPFS metadata is fetched at the same time',
+        )
+        parser.add_argument(
+            '--pending-ttl',
+            type=float,
+            default=300,
+            help='Seconds an event may wait for its coin to be created before it is dead-lettered',
+        )
+        parser.add_argument(
+            '--provisional',
+            action='store_true',
+            help='Also subscribe at processed commitment and show trades as provisional until they confirm',
+        )
+        parser.add_argument(
+            '--confirm-timeout',
+            type=float,
+            default=60,
+            help='Seconds a provisional trade may wait for confirmation before it is rolled back',
+        )
+        parser.add_argument(
+            '--retry-concurrency',
+            type=int,
+            default=4,
+            help='Maximum dead-lettered events requeued per retry sweep (0 disables retries)',
+        )
+        parser.add_argument(
+            '--max-attempts',
+            type=int,
+            default=8,
+            help='Retries of a dead-lettered event before it is left for manual replay',
+        )
+        parser.add_argument(
+            '--speed',
+            default='max',
+            help='Replay speed: max, realtime or a multiplier such as 10x',
+        )
+
     def handle(self, *args, **options):
+        self.options = options
+        if options['replay']:
+            try:
+                parse_speed(options['speed'])  # fail fast on a bad value
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(f"Replaying {options['replay']}..."))
+            asyncio.run(self.run_replay())
+            return
         self.stdout.write(self.style.SUCCESS('Starting Solana event listener...'))
         asyncio.run(self.run_listener())
 
+    async def start_pipeline(self):
+        # wallets and mints already seen, shared by every DB worker
+        self.identities = IdentityCache()
+        # the listener drops redelivered signatures; trades that still turn out
+        # to be duplicates are counted here when the insert ignores them
+        self.seen = SignatureFilter(max_age=300)
+        # one compiled decoder per event in each program's Anchor IDL
+        self.programs = self.parse_programs(self.options['programs'] or [DEFAULT_PROGRAM_ID])
+        self.registries, loaded = {}, {}
+        for program_id, idl in self.programs.items():
+            if idl not in loaded:
+                loaded[idl] = load_idl_registry(idl)
+            self.registries[program_id] = loaded[idl]
+        # archived records are routed by their program; older ones that did
+        # not store it decode with the first program
+        self.registry = next(iter(self.registries.values()))
+        self.metrics = ListenerMetrics()
+
+        self.dispatcher = CoinDispatcher(
+            self.handle_event,
+            self.handle_trades,
+            workers=self.options['workers'],
+            queue_size=self.options['queue_size'],
+            batch_size=self.options['batch_size'],
+            batch_window=self.options['batch_window'],
+            dead_letter=store_dead_letters,
+            pending_ttl=self.options['pending_ttl'],
+            resolve_dead_letters=resolve_dead_letters,
+        )
+        self.metrics.watch_dispatcher(self.dispatcher)
+        await self.dispatcher.start()
+
+        # coins are written straight away; their metadata follows from IPFS
+        self.enricher = MetadataEnricher(
+            MetadataFetcher(), self.submit_metadata, concurrency=self.options['metadata_concurrency']
+        )
+        await self.enricher.start()
+
+    async def stop_pipeline(self):
+        # metadata is queued behind its coin, so the enricher drains first
+        await self.enricher.stop()
+        await self.dispatcher.stop()
+        self.stdout.write(f"Identity cache: {self.identities.stats()}")
+        self.stdout.write(f"Signature filter: {self.seen.stats()}")
+
+    async def run_replay(self):
+        """Feed an archive through process_event without a websocket"""
+        await self.start_pipeline()
+        start = time.perf_counter()
+        try:
+            count = await replay_archive(self.options['replay'], self.process_event, self.options['speed'])
+        finally:
+            await self.stop_pipeline()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Replayed {count} notifications in {elapsed:.2f}s ({count / max(elapsed, 1e-9):,.0f} notifications/sec)"
+        ))
+
+    def parse_programs(self, values: list) -> dict:
+        """['PROGRAM', 'PROGRAM=path/to/idl.json'] -> {program_id: idl path}"""
+        programs = {}
+        for value in values:
+            program_id, _, idl = value.partition('=')
+            programs[program_id] = idl or self.options['idl']
+        return programs
+
     async def run_listener(self):
         # Setup your event listener similar to the consumer code
-        rpc_ws_url = "wss://api.devnet.solana.com"
-        program_id = "A7sBBSngzEZTsCPCffHDbeXDJ54uJWkwdEsskmn2YBGo"#"443aQT61EYaeiqqdqGth95LYgfQkZF1BQbaJLZJ6i29w"
+        rpc_ws_urls = self.options['ws_urls'] or ["wss://api.devnet.solana.com"]
         
+        await self.start_pipeline()
+        program_ids = list(self.programs)
+        archive = ArchiveWriter(self.options['archive']) if self.options['archive'] else None
+        # the last committed slot/signature per program; the gap after it is backfilled on (re)connect
+        checkpoints = {program_id: CheckpointStore(program_id) for program_id in program_ids}
+        # with a lease, every replica keeps its sockets warm but only the leader writes
+        standby = bool(self.options['lease'])
+        rpc_client = SolanaRpcClient(self.options['rpc_url'] or http_url_for(rpc_ws_urls[0]))
+        # stale sockets are swapped for fresh ones before they are closed
+        heartbeat = {
+            'heartbeat_interval': self.options['heartbeat_interval'] or None,
+            'ping_timeout': self.options['ping_timeout'],
+            'idle_timeout': self.options['idle_timeout'] or None,
+        }
         listener = SolanaEventListener(
-            rpc_ws_url=rpc_ws_url,
-            program_id=program_id,
+            rpc_ws_url=rpc_ws_urls,
+            program_id=program_ids,
             callback=self.process_event,
             max_retries=None,  # Infinite retries
             retry_delay=3,
-            auto_restart=True
-        )
-        self.decoders = {}
-        self.decoders["CreateToken"] = TokenEventDecoder(
-            "TokenCreatedEvent", {
-                "token_name": "string",
-                "token_symbol": "string",
-                "token_uri": "string",
-                "mint_address": "pubkey",
-                "creator": "pubkey",
-                "decimals": "u8",
-            }
-        )
-        self.decoders["InitVault"] = TokenEventDecoder(
-            "InitVaultEvent", {
-                "mint_address": "pubkey",
-                "price_per_token": "u64",
-                "initial_supply": "u64",
-            }
-        )
-        trade_decoder = TokenEventDecoder(
-            "TokenTransferEvent", {
-                "transfer_type": "u8",
-                "mint_address": "pubkey",
-                "user": "pubkey",
-                "sol_amount": "u64",
-                "coin_amount": "u64",
-            }
-        )
-        self.decoders["BuyToken"] = trade_decoder
-        self.decoders["SellToken"] = trade_decoder
+            auto_restart=True,
+            archive=archive,
+            rpc_client=rpc_client,
+            checkpoint=checkpoints,
+            backfill_concurrency=self.options['backfill_concurrency'],
+            signature_filter=self.seen,
+            queue=self.inbox(),
+            metrics=self.metrics,
+            standby=standby,
+            **heartbeat,
+        )
+        listeners = [listener]
+        reconciler = None
+        if self.options['provisional']:
+            # trades show up as soon as they are processed; the confirmed
+            # listener promotes them and the reconciler rolls back the rest
+            listeners.append(SolanaEventListener(
+                rpc_ws_url=rpc_ws_urls,
+                program_id=program_ids,
+                callback=self.process_provisional,
+                commitment='processed',
+                max_retries=None,
+                retry_delay=3,
+                auto_restart=True,
+                queue=self.inbox(spill_suffix='.processed'),
+                standby=standby,
+                **heartbeat,
+            ))
+            reconciler = ProvisionalReconciler(self.dispatcher.submit, timeout=self.options['confirm_timeout'])
+        retrier = None
+        if self.options['retry_concurrency'] > 0:
+            # failed events go back through the workers with exponential
+            # backoff, only when their queue has room
+            retrier = DeadLetterRetrier(
+                self.dispatcher,
+                concurrency=self.options['retry_concurrency'],
+                max_attempts=self.options['max_attempts'],
+            )
+        # background writers that only the leader runs
+        writers = [task for task in (reconciler, retrier) if task]
+
+        async def lead():
+            await asyncio.gather(*(listener.promote() for listener in listeners))
+            for writer in writers:
+                writer.start()
+
+        async def step_down():
+            for listener in listeners:
+                listener.demote()
+            for writer in writers:
+                await writer.stop()
+
+        elector = None
+        if standby:
+            elector = LeaderElector(self.options['lease'], lead, step_down, ttl=self.options['lease_ttl'])
+            elector.start()
+        else:
+            for writer in writers:
+                writer.start()
+        metrics_server = slot_poller = None
+        if self.options['metrics_port']:
+            metrics_server = MetricsServer(
+                self.metrics.registry, host=self.options['metrics_host'], port=self.options['metrics_port']
+            )
+            try:
+                await metrics_server.start()
+                slot_poller = asyncio.create_task(self.metrics.poll_head_slot(rpc_client))
+            except OSError as e:
+                # ingestion does not depend on the endpoint, so it carries on without it
+                self.stderr.write(self.style.ERROR(
+                    f"{e}. Is another listener on this host using the port? Continuing without metrics."
+                ))
+                metrics_server = None
         
         try:
             # Start the listener with auto-restart enabled
-            await listener.listen()
+            await asyncio.gather(*(listener.listen() for listener in listeners))
         except KeyboardInterrupt:
             print("Keyboard interrupt received")
         finally:
             # Gracefully shut down
-            await listener.stop()
+            for listener in listeners:
+                await listener.stop()
+            for writer in writers:
+                await writer.stop()
+            if slot_poller:
+                slot_poller.cancel()
+            await self.stop_pipeline()
+            if metrics_server:
+                await metrics_server.stop()
+            # the workers have drained, so the checkpoints cover everything handed off
+            for checkpoint in checkpoints.values():
+                await checkpoint.save()
+            if archive:
+                archive.close()
+            # a standby takes over from the checkpoint just saved
+            if elector:
+                await elector.stop()
     
+    def inbox(self, spill_suffix=''):
+        spill_file = self.options['spill_file']
+        return NotificationQueue(
+            max_size=self.options['inbox_size'],
+            policy=self.options['overflow'],
+            spill_path=spill_file + spill_suffix if spill_file else None,
+        )
+
     async def process_event(self, event_data):
         # This handles both dict and dot-access objects
-        # check the type
         signature = getattr(event_data, 'signature', None)
         logs = getattr(event_data, 'logs', [])
-        print(logs)
-        event_type, currect_log = self.get_function_id(logs)
-        if event_type and signature:
-            if event_type == "CreateToken":
-                if event_type in self.decoders:
-                    for log in logs[currect_log:]:
-                        event = self.decoders[event_type].decode(log)
-                        if event:
-                            event = await self.get_metadata(event)
-                            await self.handle_coin_creation(signature, event)
-                            break
-            if event_type in ["SellToken", "BuyToken"]:
-                if event_type in self.decoders:
-                    for log in logs[currect_log:]:
-                        event = self.decoders[event_type].decode(log)
-                        if event:
-                            await self.handle_trade(signature, event)
-                            break
-            if event_type == "InitVault":
-                if event_type in self.decoders:
-                    for log in logs[currect_log:]:
-                        event = self.decoders[event_type].decode(log)
-                        if event:
-                            await self.handle_coin_initalization(signature, event)
-                            break
-
-    async def get_metadata(self, log: dict) -> dict:
-        try:
-            ipfuri: str = log.get("token_uri", "")
-            ipfs_hash = self.extract_ipfs_hash(ipfuri)
-
-            if not ipfs_hash:
-                print(f"Invalid IPFS URI: {ipfuri}")
-                return log
+        if not signature or getattr(event_data, 'err', None):
+            return  # failed transactions changed nothing on chain
+        registry = self.registries.get(getattr(event_data, 'program_id', None), self.registry)
+        started = time.perf_counter()
+        events = registry.decode_logs(logs)
+        self.metrics.decode_seconds.observe(time.perf_counter() - started)
+        # every event of the transaction, in the order it was emitted
+        for event_type, event in events:
+            event["slot"] = getattr(event_data, 'slot', None)
+            event["received_at"] = getattr(event_data, 'received_at', None)
+            # trades are bucketed by when they happened, even when applied late
+            event["block_time"] = getattr(event_data, 'block_time', None)
+            self.metrics.events.inc(event_type=event_type)
+            await self.dispatcher.submit(event_type, signature, event, getattr(event_data, 'delivery', None))
+            if event_type == "TokenCreatedEvent":
+                self.enricher.submit(event["mint_address"], event.get("token_uri", ""))
 
-            gateways = [
-                "https://ipfs.io/ipfs/",
-                "https://cloudflare-ipfs.com/ipfs/",
-                "https://gateway.pinata.cloud/ipfs/"
-            ]
+    async def process_provisional(self, event_data):
+        """Processed-commitment notifications: only trades, stored as provisional"""
+        if not event_data.signature or event_data.err:
+            return
+        registry = self.registries.get(event_data.program_id, self.registry)
+        for event_type, event in registry.decode_logs(event_data.logs):
+            if event_type in TRADE_EVENTS:
+                event["slot"] = event_data.slot
+                event["received_at"] = event_data.received_at
+                event["block_time"] = event_data.block_time
+                event["provisional"] = True
+                await self.dispatcher.submit(event_type, event_data.signature, event)
 
-            timeout = aiohttp.ClientTimeout(total=10)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                for gateway in gateways:
-                    url = f"{gateway}{ipfs_hash}"
-                    try:
-                        # print(f"Trying: {url}")
-                        async with session.get(url) as response:
-                            if response.status == 200:
-                                content = await response.json()
-                                log.update(content)
-                                return log  # Success
-                            else:
-                                print(f"Failed to fetch: {response.status}")
-                    except Exception as e:
-                        print(f"Error on {url}: {e}")
+    async def submit_metadata(self, mint_address: str, metadata: dict):
+        """Queue fetched metadata on the coin's worker, behind the coin itself"""
+        await self.dispatcher.submit("CoinMetadata", "", {"mint_address": mint_address, "metadata": metadata})
 
-        except Exception as e:
-            print(f"Unexpected error: {e}")
-        return log
+    def handle_event(self, event_type: str, signature: str, event: dict):
+        """
+        Runs on the coin's DB worker thread. Raises CoinNotReady when the coin
+        has not been created yet, so the worker parks the event; any other
+        exception dead-letters it.
+        """
+        started = time.perf_counter()
+        self.ensure_connection()
+        if event_type == "TokenCreatedEvent":
+            self.handle_coin_creation(signature, event)
+        elif event_type == "InitVaultEvent":
+            self.handle_coin_initalization(signature, event)
+        elif event_type == "CoinMetadata":
+            self.handle_coin_metadata(event)
+        elif event_type == "ProvisionalExpired":
+            rolled_back = rollback_provisional(event["signatures"])
+            if rolled_back:
+                logger.info(f"Rolled back {len(rolled_back)} unconfirmed trades on {event['mint_address']}")
+        else:
+            print(f"No handler for {event_type} ({signature}): {event}")
+            return
+        self.metrics.record_write(event_type, started, [event])
 
-    def extract_ipfs_hash(self, uri: str) -> str:
-        parts = uri.rstrip("/").split("/")
-        if parts:
-            return parts[-1]
-        return ""
-    
-    @sync_to_async(thread_sensitive=True)
     def handle_coin_creation(self, signature: str, logs: dict):
-        creator = self.custom_check(
-            lambda: SolanaUser.objects.get(wallet_address=logs["creator"]),
-            not_found_exception=SolanaUser.DoesNotExist
-        )
+        if logs["mint_address"] in self.identities.resolve_coins([logs["mint_address"]]):
+            return
+        creator = self.identities.resolve_users([logs["creator"]]).get(logs["creator"])
+        if creator is None:
+            raise SolanaUser.DoesNotExist(f"Unknown creator {logs['creator']}")
 
-        try:
-            self.ensure_connection()
-            if not Coin.objects.filter(address=logs["mint_address"]).exists() and creator:
-                attributes = logs.get('attributes') or {}
-                new_coin = Coin(
-                    address=logs["mint_address"],
-                    name=logs["token_name"],
-                    ticker=logs["token_symbol"],
-                    creator=creator,
-                    total_supply=Decimal("1000000.0"),
-                    image_url=logs.get("image", ""),
-                    current_price=Decimal("1.0"),
-                    description=logs.get("description", None),
-                    discord=attributes.get("discord"),
-                    website=attributes.get("website"),
-                    twitter=attributes.get("twitter"),
-                    decimals = logs["decimals"],
-                )
-                new_coin.save()
-                print(f"Created new coin with address: {logs['mint_address']}")
-        except Exception as e:
-            print(f"Error while saving coin: {e}")
+        attributes = logs.get('attributes') or {}
+        new_coin = Coin(
+            address=logs["mint_address"],
+            name=logs["token_name"],
+            ticker=logs["token_symbol"],
+            creator=creator,
+            total_supply=Decimal("1000000.0"),
+            image_url=logs.get("image", ""),
+            description=logs.get("description", None),
+            discord=attributes.get("discord"),
+            website=attributes.get("website"),
+            twitter=attributes.get("twitter"),
+            decimals = logs["decimals"],
+        )
+        new_coin.save()
+        self.identities.remember_coin(new_coin)
+        print(f"Created new coin with address: {logs['mint_address']}")
     
-    @sync_to_async(thread_sensitive=True)
     def handle_coin_initalization(self, signature: str, logs: dict):
-        coin:Coin = self.custom_check(
-            lambda: Coin.objects.get(address=logs["mint_address"]),
-            not_found_exception=Coin.DoesNotExist
-        )
-        coin.total_supply = self.bigint_to_float(logs["initial_supply"], coin.decimals)
-        coin.price_per_token = logs["price_per_token"]
-        try:
-            self.ensure_connection()
-            coin.save()
-            print(f"Initailized coin with address: {logs['mint_address']}")
-        except Exception as e:
-            print(f"Error while saving coin: {e}")
-
-    @sync_to_async(thread_sensitive=True)
-    def handle_trade(self, signature, logs):
-        """Handle coin creation event"""
-        tradeuser = self.custom_check(
-            lambda: SolanaUser.objects.get(wallet_address=logs["user"]),
-            not_found_exception=SolanaUser.DoesNotExist
+        coin = self.identities.resolve_coins([logs["mint_address"]]).get(logs["mint_address"])
+        if coin is None:
+            raise CoinNotReady(logs["mint_address"])
+        total_supply = self.bigint_to_float(logs["initial_supply"], coin.decimals)
+        Coin.objects.filter(address=coin.address).update(
+            total_supply=total_supply,
+            price_per_token=logs["price_per_token"],
+            # against the new supply; total_supply in the same SET still reads the old one
+            market_cap=(Value(total_supply) - F('total_held')) * F('current_price'),
         )
+        print(f"Initailized coin with address: {logs['mint_address']}")
 
-        coin:Coin = self.custom_check(
-            lambda: Coin.objects.get(address=logs["mint_address"]),
-            not_found_exception=Coin.DoesNotExist
-        )
+    def handle_coin_metadata(self, event: dict):
+        fields = metadata_fields(event["metadata"])
+        if not fields:
+            return
+        updated = Coin.objects.filter(address=event["mint_address"]).update(**fields)
+        if not updated:
+            raise CoinNotReady(event["mint_address"])
+        broadcast_coin_updated(Coin.objects.get(address=event["mint_address"]))
+        print(f"Enriched coin {event['mint_address']} with {', '.join(fields)}")
 
-        coin_amount = self.bigint_to_float(logs["coin_amount"], coin.decimals)
-        sol_amount = self.bigint_to_float(logs["sol_amount"], coin.decimals)
-        print(logs)
-        try:
-            self.ensure_connection()
-            if not Trade.objects.filter(transaction_hash=signature).exists() and tradeuser != None and coin != None:
-                new_trade = Trade(
-                    transaction_hash=signature,
-                    user= tradeuser,
-                    coin=coin,
-                    trade_type=self.get_transaction_type(logs["transfer_type"]),
-                    coin_amount=coin_amount,
-                    sol_amount=sol_amount,
-                )
-                new_trade.save()
-                print(f"Created new trade with transaction_hash: {signature}")
-        except Exception as e:
-            print(f"Error while saving trade: {e}")
+    def handle_trades(self, batch: list) -> list:
+        """
+        Write a batch of (signature, trade event) pairs in one transaction.
+        Returns the trades whose coin does not exist yet.
+        """
+        started = time.perf_counter()
+        # one health check for the whole batch
+        self.ensure_connection()
+        waiting = []
+        trades = ingest_trades(batch, identities=self.identities, seen=self.seen, missing_coins=waiting)
+        logger.debug(f"Created {len(trades)} new trades from a batch of {len(batch)}")
+        parked = {signature for signature, _ in waiting}
+        self.metrics.record_write(TRADE_EVENTS[0], started, [event for signature, event in batch if signature not in parked])
+        return waiting
 
     def bigint_to_float(self, value: int, power:int=9) -> float:
-        result = Decimal(value).scaleb(-power).quantize(Decimal(f'0.{"0"*(power-1)}1'))  # for 9 decimals
-        return result
-
-    def custom_check(self, info: callable, not_found_exception: type[Exception]):
-        return_value = None
-        for attempt in range(3):
-            try:
-                self.ensure_connection()
-                return_value = info()
-                break
-            except not_found_exception as e:
-                print(f"Specific object({not_found_exception}) not found: {e}")
-                return
-            except OperationalError as e:
-                print(f"DB OperationalError (attempt {attempt + 1}/3): {e}")
-                time.sleep(1)
-            except Exception as e:
-                print(f"Unexpected error: {e}")
-                return
-        return return_value
+        return bigint_to_decimal(value, power)
 
     def ensure_connection(self):
         close_old_connections()
@@ -247,16 +531,4 @@ class Command(BaseCommand):
             connection.connect()
 
     def get_transaction_type(self, ttype):
-        ttype = str(ttype)
-        if ttype == "1":
-            return "SELL"
-        if ttype == "2":
-            return "COIN_CREATE"
-        if ttype == "0":
-            return "BUY"
-        raise(ValueError("Type not Registered"))
-
-    def get_function_id(self, logs:list) -> tuple:
-        for num, log in enumerate(logs): # get the function id
-            if "Program log: Instruction:" in log:
-                return log.split(": ")[-1], num
+        return get_transaction_type(ttype)
@@ -0,0 +1,40 @@
+from datetime import timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from ...models import Coin
+from ...utils.candles import rebuild_candles
+
+class Command(BaseCommand):
+    help = 'Rebuild OHLCV price candles from the Trade table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'addresses',
+            nargs='*',
+            help='Coins to rebuild (all of them if none are given)',
+        )
+        parser.add_argument(
+            '--since',
+            help='Only rebuild buckets from this ISO 8601 time onwards',
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                raise CommandError(f"Invalid --since: {options['since']}")
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since, dt_timezone.utc)
+        addresses = options['addresses'] or list(
+            Coin.objects.order_by('address').values_list('address', flat=True)
+        )
+        written = 0
+        for address in addresses:
+            written += rebuild_candles(address, since)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {written} candles for {len(addresses)} coins"
+        ))
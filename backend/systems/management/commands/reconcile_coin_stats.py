@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from ...models import Coin
+from ...utils.ingest import reconcile_coin_stats
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized holder columns of coins (total_held, holders_count, market_cap) from holdings'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'addresses',
+            nargs='*',
+            help='Coins to reconcile (all of them if none are given)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Coins recomputed per transaction',
+        )
+
+    def handle(self, *args, **options):
+        addresses = options['addresses'] or list(
+            Coin.objects.order_by('address').values_list('address', flat=True)
+        )
+        batch_size = options['batch_size']
+        drifted = 0
+        for start in range(0, len(addresses), batch_size):
+            drifted += reconcile_coin_stats(addresses[start:start + batch_size])
+        self.stdout.write(self.style.SUCCESS(
+            f"Reconciled {len(addresses)} coins, {drifted} had drifted"
+        ))
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('systems', '0018_coin_price_per_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListenerCheckpoint',
+            fields=[
+                ('program_id', models.CharField(max_length=44, primary_key=True, serialize=False)),
+                ('slot', models.BigIntegerField()),
+                ('signature', models.CharField(max_length=88)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('systems', '0019_listenercheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trade',
+            name='provisional',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+    ]
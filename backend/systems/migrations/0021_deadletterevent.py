@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:04
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('systems', '0020_trade_provisional'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeadLetterEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(max_length=64)),
+                ('signature', models.CharField(blank=True, max_length=88)),
+                ('mint_address', models.CharField(blank=True, db_index=True, max_length=44)),
+                ('slot', models.BigIntegerField(blank=True, null=True)),
+                ('payload', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('reason', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('systems', '0021_deadletterevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deadletterevent',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='deadletterevent',
+            name='next_retry_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
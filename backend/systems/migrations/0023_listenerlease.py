@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('systems', '0022_deadletterevent_retries'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListenerLease',
+            fields=[
+                ('name', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('holder', models.CharField(max_length=128)),
+                ('expires_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('systems', '0023_listenerlease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coin',
+            name='holders_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='coin',
+            name='market_cap',
+            field=models.DecimalField(decimal_places=8, default=0, max_digits=32),
+        ),
+        migrations.AddField(
+            model_name='coin',
+            name='total_held',
+            field=models.DecimalField(decimal_places=8, default=0, max_digits=20),
+        ),
+    ]
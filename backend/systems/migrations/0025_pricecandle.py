@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('systems', '0024_coin_holder_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceCandle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interval', models.CharField(choices=[('1m', '1 minute'), ('5m', '5 minutes'), ('1h', '1 hour'), ('1d', '1 day')], max_length=3)),
+                ('bucket_start', models.DateTimeField()),
+                ('open', models.DecimalField(decimal_places=18, max_digits=30)),
+                ('high', models.DecimalField(decimal_places=18, max_digits=30)),
+                ('low', models.DecimalField(decimal_places=18, max_digits=30)),
+                ('close', models.DecimalField(decimal_places=18, max_digits=30)),
+                ('volume', models.DecimalField(decimal_places=10, max_digits=24)),
+                ('trade_count', models.IntegerField(default=0)),
+                ('coin', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='candles', to='systems.coin')),
+            ],
+            options={
+                'ordering': ['bucket_start'],
+                'unique_together': {('coin', 'interval', 'bucket_start')},
+            },
+        ),
+    ]
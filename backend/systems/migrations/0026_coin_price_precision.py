@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('systems', '0025_pricecandle'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='coin',
+            name='ath',
+            field=models.DecimalField(decimal_places=18, default=0, max_digits=30),
+        ),
+        migrations.AlterField(
+            model_name='coin',
+            name='current_price',
+            field=models.DecimalField(decimal_places=18, default=0, max_digits=30),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:39
+
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import Count, DecimalField, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+HELD_FIELD = DecimalField(max_digits=20, decimal_places=8)
+
+
+def fill_coin_stats(apps, schema_editor):
+    """
+    The columns added in 0024 start at 0 for coins that already had trades:
+    sum the holdings, take the price of the latest and the highest trade,
+    then derive market_cap from both.
+    """
+    Coin = apps.get_model('systems', 'Coin')
+    UserCoinHoldings = apps.get_model('systems', 'UserCoinHoldings')
+    Trade = apps.get_model('systems', 'Trade')
+
+    holdings = UserCoinHoldings.objects.filter(coin_id=OuterRef('address'), amount_held__gt=0).values('coin_id')
+    Coin.objects.update(
+        total_held=Coalesce(
+            Subquery(holdings.annotate(total=Sum('amount_held')).values('total')[:1], output_field=HELD_FIELD),
+            Value(Decimal(0)), output_field=HELD_FIELD,
+        ),
+        holders_count=Coalesce(
+            Subquery(holdings.annotate(total=Count('id')).values('total')[:1], output_field=IntegerField()),
+            Value(0),
+        ),
+    )
+
+    # prices are divided here rather than in SQL, where sqlite divides integers
+    prices = {}
+    for coin_id, sol_amount, coin_amount in (
+        Trade.objects.filter(trade_type__in=('BUY', 'SELL'), coin_amount__gt=0)
+        .order_by('coin_id', 'created_at')
+        .values_list('coin_id', 'sol_amount', 'coin_amount').iterator()
+    ):
+        price = Decimal(sol_amount) / Decimal(coin_amount)
+        high = prices[coin_id][1] if coin_id in prices else price
+        prices[coin_id] = (price, max(high, price))
+    addresses = list(prices)
+    for start in range(0, len(addresses), 500):
+        coins = list(Coin.objects.filter(address__in=addresses[start:start + 500]).only('address', 'ath'))
+        for coin in coins:
+            coin.current_price, high = prices[coin.address]
+            coin.ath = max(coin.ath, high)
+        Coin.objects.bulk_update(coins, ['current_price', 'ath'])
+
+    Coin.objects.update(market_cap=(F('total_supply') - F('total_held')) * F('current_price'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('systems', '0026_coin_price_precision'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_coin_stats, migrations.RunPython.noop),
+    ]
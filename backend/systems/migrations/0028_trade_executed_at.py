@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:43
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def fill_event_times(apps, schema_editor):
+    """Trades written so far only know when they were inserted; candles start and end at their bucket"""
+    Trade = apps.get_model('systems', 'Trade')
+    PriceCandle = apps.get_model('systems', 'PriceCandle')
+    Trade.objects.update(executed_at=models.F('created_at'))
+    PriceCandle.objects.update(opened_at=models.F('bucket_start'), closed_at=models.F('bucket_start'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('systems', '0027_fill_coin_holder_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trade',
+            name='executed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='pricecandle',
+            name='opened_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='pricecandle',
+            name='closed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_event_times, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='trade',
+            index=models.Index(fields=['coin', 'executed_at'], name='systems_tra_coin_id_60585b_idx'),
+        ),
+    ]
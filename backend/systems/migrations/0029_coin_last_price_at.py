@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:12
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+
+
+def fill_last_price_at(apps, schema_editor):
+    """current_price so far came from each coin's latest trade; date it by that trade"""
+    Coin = apps.get_model('systems', 'Coin')
+    Trade = apps.get_model('systems', 'Trade')
+    trades = Trade.objects.filter(coin_id=OuterRef('address'), trade_type__in=('BUY', 'SELL'), coin_amount__gt=0)
+    Coin.objects.update(last_price_at=Subquery(
+        trades.values('coin_id').annotate(latest=Max('executed_at')).values('latest')[:1],
+        output_field=models.DateTimeField(),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('systems', '0028_trade_executed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coin',
+            name='last_price_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_last_price_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:05
+
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import F
+
+SOL_DECIMALS = 9
+
+
+def rescale_sol_amounts(apps, schema_editor):
+    """
+    sol_amount was scaled by the coin's decimals instead of the 9 of SOL.
+    Coins with other decimals had every SOL amount, and every price derived
+    from one, off by the same power of ten.
+    """
+    Coin = apps.get_model('systems', 'Coin')
+    Trade = apps.get_model('systems', 'Trade')
+    PriceCandle = apps.get_model('systems', 'PriceCandle')
+    for decimals in Coin.objects.exclude(decimals=SOL_DECIMALS).values_list('decimals', flat=True).distinct():
+        factor = Decimal(10) ** (decimals - SOL_DECIMALS)
+        coins = Coin.objects.filter(decimals=decimals)
+        Trade.objects.filter(coin__in=coins).update(sol_amount=F('sol_amount') * factor)
+        PriceCandle.objects.filter(coin__in=coins).update(
+            open=F('open') * factor, high=F('high') * factor, low=F('low') * factor,
+            close=F('close') * factor, volume=F('volume') * factor,
+        )
+        coins.update(
+            current_price=F('current_price') * factor, ath=F('ath') * factor,
+            market_cap=F('market_cap') * factor,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('systems', '0029_coin_last_price_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(rescale_sol_amounts, migrations.RunPython.noop),
+    ]
@@ -2,8 +2,9 @@ from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
-from django.db.models import Sum
+from django.db.models import F, Sum
 from decimal import Decimal
+from django.core.serializers.json import DjangoJSONEncoder
 
 # integrate the score directly into the models
 class SolanaUserManager(BaseUserManager):
@@ -86,29 +87,63 @@ class Coin(models.Model): # we have to store the ath
     decimals = models.SmallIntegerField(default= 9)
     price_per_token = models.IntegerField(default= 25)
 
-    current_price = models.DecimalField(max_digits=20, decimal_places=8, default=0)  # Added price field # start calculating
-    ath = models.DecimalField(max_digits=20, decimal_places=8, default=0) # will work like coin to store the highest
+    # SOL per token of the latest trade, and the highest it has traded at; maintained by trade ingestion
+    current_price = models.DecimalField(max_digits=30, decimal_places=18, default=0)
+    ath = models.DecimalField(max_digits=30, decimal_places=18, default=0)
+    # executed_at of the trade current_price comes from; older trades applied later leave it
+    last_price_at = models.DateTimeField(null=True, blank=True)
+
+    # kept up to date from the holdings deltas of every applied trade (systems.utils.ingest);
+    # the reconcile_coin_stats command recomputes them from UserCoinHoldings
+    total_held = models.DecimalField(max_digits=20, decimal_places=8, default=0)
+    holders_count = models.IntegerField(default=0)
+    market_cap = models.DecimalField(max_digits=32, decimal_places=8, default=0) # (total_supply - total_held) * current_price
+
+    # written by trade ingestion with UPDATEs relative to the stored row; save()
+    # on an instance loaded earlier (the admin does one) must not put back its copies
+    DERIVED_FIELDS = frozenset({'current_price', 'ath', 'last_price_at', 'total_held', 'holders_count', 'market_cap'})
 
     def __str__(self):
         return f"{self.name} ({self.ticker})"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # so save() can tell whether the supply was edited
+        instance._stored_supply = instance.__dict__.get('total_supply')
+        return instance
+
     def save(self, *args, **kwargs):
         if self.ticker:
             self.ticker = self.ticker.upper()  # Ensure it's always uppercase
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None and not self._state.adding:
+            deferred = self.get_deferred_fields()
+            update_fields = kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.DERIVED_FIELDS and field.attname not in deferred
+            ]
+            recompute = 'total_supply' in update_fields and self.total_supply != getattr(self, '_stored_supply', None)
+        else:
+            recompute = update_fields is not None and {'total_supply', 'total_held', 'current_price'} & set(update_fields)
+        if update_fields is None:
+            self.market_cap = self.compute_market_cap()
         super().save(*args, **kwargs)
-
-    @property
-    def total_held(self):
-        """Returns the total amount of this coin held by all users."""
-        from django.db.models import Sum
-        total = self.holders.aggregate(total=Sum('amount_held'))['total']
-        return total or 0  # Return 0 if no holdings exist
-
-    @property
-    def market_cap(self):
-        """Calculates market cap: (Total Supply - Total Held) * Current Price"""
-        return (self.total_supply - self.total_held) * self.current_price
+        self._stored_supply = self.total_supply
+        if recompute:
+            # from the stored columns, which may be newer than this instance
+            Coin.objects.filter(pk=self.pk).update(market_cap=(F('total_supply') - F('total_held')) * F('current_price'))
+            self.refresh_from_db(fields=['market_cap'])
+
+    def compute_market_cap(self):
+        """Market cap: (Total Supply - Total Held) * Current Price"""
+        return (Decimal(self.total_supply) - Decimal(self.total_held)) * Decimal(self.current_price)
     
+    def rolling_volume(self, window: str = "24h"):
+        """(SOL volume, trade count) over the last 24h, 7d or 30d, read from the price candles"""
+        from systems.utils.volume import rolling_totals
+        return rolling_totals([self.address], window)[self.address]
+
     @property
     def liquidity(self):
         return (self.total_held * self.current_price)
@@ -145,6 +180,10 @@ class Trade(models.Model): # change to transaction hash
     coin_amount = models.DecimalField(max_digits=20, decimal_places=10)
     sol_amount = models.DecimalField(max_digits=20, decimal_places=10)
     created_at = models.DateTimeField(auto_now_add=True)
+    # when the trade happened on chain: the block time, or when the listener received
+    # it; candles and prices follow this, not the insert time, so late trades land right
+    executed_at = models.DateTimeField(default=timezone.now)
+    provisional = models.BooleanField(default=False, db_index=True) # seen at processed commitment, not confirmed yet
 
     def __str__(self):
         return f"{self.get_trade_type_display()} Trade by {self.user.get_display_name()} on {self.coin.ticker}"
@@ -155,8 +194,78 @@ class Trade(models.Model): # change to transaction hash
             models.Index(fields=['user']),
             models.Index(fields=['coin']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['coin', 'executed_at']),
         ]
 
+class PriceCandle(models.Model):
+    """Open/high/low/close and volume of a coin's trades over one interval, kept up to date as trades are applied"""
+    INTERVALS = [
+        ('1m', '1 minute'),
+        ('5m', '5 minutes'),
+        ('1h', '1 hour'),
+        ('1d', '1 day'),
+    ]
+
+    coin = models.ForeignKey(Coin, on_delete=models.CASCADE, related_name='candles', to_field="address")
+    interval = models.CharField(max_length=3, choices=INTERVALS)
+    bucket_start = models.DateTimeField()
+    open = models.DecimalField(max_digits=30, decimal_places=18) # price in SOL per token
+    high = models.DecimalField(max_digits=30, decimal_places=18)
+    low = models.DecimalField(max_digits=30, decimal_places=18)
+    close = models.DecimalField(max_digits=30, decimal_places=18)
+    volume = models.DecimalField(max_digits=24, decimal_places=10) # SOL traded
+    trade_count = models.IntegerField(default=0)
+    # execution times of the trades that set open and close, so a trade applied
+    # late only takes them over if it is earlier or later than they are
+    opened_at = models.DateTimeField()
+    closed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.coin_id} {self.interval} @ {self.bucket_start}"
+
+    class Meta:
+        ordering = ['bucket_start']
+        # also the index behind chart range queries
+        unique_together = ('coin', 'interval', 'bucket_start')
+
+class ListenerCheckpoint(models.Model):
+    """Last program notification the listener handed off, used to backfill after an outage"""
+    program_id = models.CharField(max_length=44, primary_key=True)
+    slot = models.BigIntegerField()
+    signature = models.CharField(max_length=88)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.program_id} @ slot {self.slot}"
+
+class ListenerLease(models.Model):
+    """The listener replica allowed to write events, until its lease expires"""
+    name = models.CharField(max_length=64, primary_key=True)
+    holder = models.CharField(max_length=128)
+    expires_at = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} held by {self.holder} until {self.expires_at}"
+
+class DeadLetterEvent(models.Model):
+    """Listener event that could not be applied, kept for inspection and replay"""
+    event_type = models.CharField(max_length=64)
+    signature = models.CharField(max_length=88, blank=True)
+    mint_address = models.CharField(max_length=44, blank=True, db_index=True)
+    slot = models.BigIntegerField(null=True, blank=True)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    reason = models.TextField()
+    attempts = models.PositiveIntegerField(default=0)
+    next_retry_at = models.DateTimeField(null=True, blank=True, db_index=True) # null once retries are exhausted
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.event_type} {self.signature}: {self.reason}"
+
+    class Meta:
+        ordering = ['created_at']
+
 # drc stuffs
 class DRCScore(models.Model):
     """Base model for DRC scoring with common fields"""
@@ -257,7 +366,7 @@ class CoinDRCScore(DRCScore):
     
     def update_holders_count(self, save=True):
         """Update the count of holders for this coin"""
-        self.holders_count = self.coin.holders.count()
+        self.holders_count = self.coin.holders_count
         if save:
             self.save(update_fields=['holders_count', 'updated_at'])
         return self.holders_count
@@ -380,15 +489,10 @@ class CoinDRCScore(DRCScore):
         return days_diff < days_left
 
     def _calculate_fair_trading_bonus(self):
-        cutoff_time = timezone.now() - timezone.timedelta(days=30)
-        volume_data = self.coin.trades.filter(
-            created_at__gte=cutoff_time
-        ).aggregate(
-            total_volume=Sum('sol_amount')
-        )
         """Calculate bonus for fair trading patterns (low volatility)"""
-        if self.price_breakouts_per_month <= 6 and volume_data['total_volume'] != None:  # Max 6 breakouts considered fair
-            if volume_data['total_volume'] >= 15:
+        volume_30d, _ = self.coin.rolling_volume("30d")
+        if self.price_breakouts_per_month <= 6:  # Max 6 breakouts considered fair
+            if volume_30d >= 15:
                 return 50 
         return 0
 
@@ -405,9 +509,7 @@ class CoinDRCScore(DRCScore):
     def _calculate_retention_bonus(self, save=True):
         """Calculate bonus for holder retention"""
         held_bonus = 0
-        total_held = UserCoinHoldings.objects.filter(coin=self.coin).aggregate(
-            total=models.Sum('amount_held')
-        )['total'] or Decimal('0.0')
+        total_held = self.coin.total_held
 
         # Compute held percentage
         if self.coin.total_supply > 0:
@@ -453,9 +555,7 @@ class CoinDRCScore(DRCScore):
                 dump_detected = True
 
         # Check trade volume spike
-        volume_30d = self.coin.trades.filter(
-            created_at__gte=timezone.now() - timezone.timedelta(days=30)
-        ).aggregate(total_volume=Sum('sol_amount'))['total_volume'] or 0
+        volume_30d, _ = self.coin.rolling_volume("30d")
 
         if self.max_volume_recorded > 0 and volume_30d > self.max_volume_recorded * 1.5:
             pump_detected = True
@@ -508,7 +608,7 @@ class CoinDRCScore(DRCScore):
         if not self.successful_token:
             # Not less than 80% from ath
             # self.age_in_hours >= (30 * 24)) and  self.coin.market_cap >= 100000: # award +100
-            if self.coin.holders.all().count() >= 500 and self.coin.market_cap >= 500000:
+            if self.coin.holders_count >= 500 and self.coin.market_cap >= 500000:
                 if not self.token_abandonment and not self.team_abandonment:
                     self.successful_token = True  
 
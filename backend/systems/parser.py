@@ -1,14 +1,82 @@
 import hashlib
 import base64
+import binascii
+import json
+import logging
+import re
+import struct
+from functools import lru_cache
+from pathlib import Path
 import base58
+import numpy as np
+from solders.pubkey import Pubkey
 from construct import Struct, Bytes, Int8ul, Int32ul, PaddedString,Int64ul
 
+# struct formats for the fixed-size field types
+FIXED_FORMATS = {
+    "pubkey": "32s",
+    "bool": "?",
+    "u8": "B",
+    "i8": "b",
+    "u16": "H",
+    "i16": "h",
+    "u32": "I",
+    "i32": "i",
+    "u64": "Q",
+    "i64": "q",
+    "u128": "16s",
+    "i128": "16s",
+    "f32": "f",
+    "f64": "d",
+}
+# NumPy equivalents, used by decode_batch for fixed-size events
+NUMPY_FORMATS = {
+    "pubkey": "V32",
+    "bool": "?",
+    "u8": "u1",
+    "i8": "i1",
+    "u16": "<u2",
+    "i16": "<i2",
+    "u32": "<u4",
+    "i32": "<i4",
+    "u64": "<u8",
+    "i64": "<i8",
+    "f32": "<f4",
+    "f64": "<f8",
+}
+LENGTH_PREFIX = struct.Struct("<I")
+DISCRIMINATOR_SIZE = 8
+PROGRAM_DATA = "Program data: "
+DEFAULT_IDL_PATH = Path(__file__).resolve().parent / "idl" / "token_factory.json"
+
+logger = logging.getLogger(__name__)
+
+@lru_cache(maxsize=65536)
+def encode_pubkey(raw: bytes) -> str:
+    """Base58-encode a 32-byte pubkey; repeated mints and wallets hit the cache"""
+    return str(Pubkey.from_bytes(raw))
+
+# post-processing for fixed-size values that struct can't produce directly
+CONVERTERS = {
+    "pubkey": encode_pubkey,
+    "u128": lambda value: int.from_bytes(value, "little"),
+    "i128": lambda value: int.from_bytes(value, "little", signed=True),
+}
+
 class TokenEventDecoder:
-    def __init__(self, event_name: str, parse_dict: dict):
+    def __init__(self, event_name: str, parse_dict: dict, discriminator: bytes | None = None):
         self.event_name = event_name
         self.parse_dict = parse_dict
-        self.struct = self._convert_dict_to_struct()
-        self.discriminator = self._get_discriminator()
+        self.discriminator = discriminator or self._get_discriminator()
+        self.steps = self._compile()
+        self._struct = None
+
+    @property
+    def struct(self) -> Struct:
+        # only the construct reference path needs this, so build it on first use
+        if self._struct is None:
+            self._struct = self._convert_dict_to_struct()
+        return self._struct
 
     def decode(self, log_line: str) -> dict | None:
         if "Program data:" not in log_line:
@@ -17,8 +85,72 @@ class TokenEventDecoder:
         base64_data = log_line.split("Program data: ")[1].strip()
         raw = base64.b64decode(base64_data)
 
+        if not raw.startswith(self.discriminator):
+            return None
+
+        return self.decode_payload(raw)
+
+    def decode_payload(self, raw: bytes) -> dict:
+        """Decode an event (discriminator included) with the compiled layout"""
+        buffer = memoryview(raw)
+        offset = DISCRIMINATOR_SIZE
+        result = {}
+        for layout, keys, read in self.steps:
+            if layout is None:
+                result[keys], offset = read(buffer, offset)
+                continue
+            values = layout.unpack_from(buffer, offset)
+            offset += layout.size
+            for key, value, convert in zip(keys, values, read):
+                result[key] = convert(value) if convert else value
+        return result
+
+    def decode_batch(self, log_lines: list) -> dict:
+        """
+        Decode many fixed-size events at once into columnar arrays.
+
+        Matching payloads are concatenated into one buffer viewed through a NumPy
+        structured dtype, and the discriminator is filtered in a single vectorized
+        pass. Numeric fields come back as arrays, pubkey fields as PubkeyColumns
+        that base58-encode on access.
+        """
+        dtype = self.numpy_dtype()
+        payloads = []
+        for log in log_lines:
+            if log.startswith(PROGRAM_DATA):
+                raw = base64.b64decode(log[len(PROGRAM_DATA):])
+                if len(raw) == dtype.itemsize:
+                    payloads.append(raw)
+
+        records = np.frombuffer(b"".join(payloads), dtype=dtype)
+        records = records[records["discriminator"] == int.from_bytes(self.discriminator, "little")]
+
+        columns = {}
+        for key, value_type in self.parse_dict.items():
+            if value_type == "pubkey":
+                columns[key] = PubkeyColumn(records[key])
+            else:
+                columns[key] = records[key]
+        return columns
+
+    def numpy_dtype(self) -> np.dtype:
+        """Structured dtype of a whole event, discriminator included"""
+        fields = [("discriminator", "<u8")]
+        for key, value_type in self.parse_dict.items():
+            if not isinstance(value_type, str) or value_type not in NUMPY_FORMATS:
+                raise ValueError(f"{self.event_name} is not fixed-size ({key} is {value_type})")
+            fields.append((key, NUMPY_FORMATS[value_type]))
+        return np.dtype(fields)
+
+    def decode_with_construct(self, log_line: str) -> dict | None:
+        """Reference decoder going through construct; kept for comparison"""
+        if "Program data:" not in log_line:
+            return None
+
+        base64_data = log_line.split("Program data: ")[1].strip()
+        raw = base64.b64decode(base64_data)
+
         if raw[:8] != self.discriminator:
-            print("Discriminator mismatch.")
             return None
 
         parsed = self.struct.parse(raw[8:])
@@ -27,6 +159,29 @@ class TokenEventDecoder:
     def _get_discriminator(self) -> bytes:
         return hashlib.sha256(f"event:{self.event_name}".encode()).digest()[:8]
 
+    def _compile(self) -> list:
+        """
+        Turn parse_dict into a list of decode steps. Consecutive fixed-size fields
+        are merged into one precomputed struct.Struct, so a layout without
+        variable-size fields (e.g. TokenTransferEvent) decodes with a single
+        unpack_from. Strings, Options and Vecs get a compiled reader each.
+        """
+        steps = []
+        fmt, keys, converters = "", [], []
+        for key, value_type in self.parse_dict.items():
+            if isinstance(value_type, str) and value_type in FIXED_FORMATS:
+                fmt += FIXED_FORMATS[value_type]
+                keys.append(key)
+                converters.append(CONVERTERS.get(value_type))
+                continue
+            if fmt:
+                steps.append((struct.Struct("<" + fmt), tuple(keys), tuple(converters)))
+                fmt, keys, converters = "", [], []
+            steps.append((None, key, compile_reader(value_type)))
+        if fmt:
+            steps.append((struct.Struct("<" + fmt), tuple(keys), tuple(converters)))
+        return steps
+
     def _convert_dict_to_struct(self) -> Struct:
         fields = {}
 
@@ -57,9 +212,167 @@ class TokenEventDecoder:
             return base58.b58encode(output).decode()
         return output
 
+def compile_reader(value_type):
+    """
+    Build a `read(buffer, offset) -> (value, offset)` function for one borsh type:
+    a fixed-size type name, "string", "bytes", {"option": T}, {"vec": T} or
+    {"array": [T, n]}.
+    """
+    if value_type == "string":
+        def read_string(buffer, offset):
+            (length,) = LENGTH_PREFIX.unpack_from(buffer, offset)
+            offset += LENGTH_PREFIX.size
+            return bytes(buffer[offset:offset + length]).rstrip(b"\x00").decode("utf8"), offset + length
+        return read_string
+
+    if value_type == "bytes":
+        def read_bytes(buffer, offset):
+            (length,) = LENGTH_PREFIX.unpack_from(buffer, offset)
+            offset += LENGTH_PREFIX.size
+            return bytes(buffer[offset:offset + length]), offset + length
+        return read_bytes
+
+    if isinstance(value_type, str) and value_type in FIXED_FORMATS:
+        layout = struct.Struct("<" + FIXED_FORMATS[value_type])
+        convert = CONVERTERS.get(value_type)
+
+        def read_fixed(buffer, offset):
+            (value,) = layout.unpack_from(buffer, offset)
+            return (convert(value) if convert else value), offset + layout.size
+        return read_fixed
+
+    if isinstance(value_type, dict) and "option" in value_type:
+        read_inner = compile_reader(value_type["option"])
+
+        def read_option(buffer, offset):
+            if buffer[offset] == 0:
+                return None, offset + 1
+            return read_inner(buffer, offset + 1)
+        return read_option
+
+    if isinstance(value_type, dict) and ("vec" in value_type or "array" in value_type):
+        if "vec" in value_type:
+            read_inner, size = compile_reader(value_type["vec"]), None
+        else:
+            inner_type, size = value_type["array"]
+            read_inner = compile_reader(inner_type)
+
+        def read_sequence(buffer, offset):
+            length = size
+            if length is None:
+                (length,) = LENGTH_PREFIX.unpack_from(buffer, offset)
+                offset += LENGTH_PREFIX.size
+            items = []
+            for _ in range(length):
+                item, offset = read_inner(buffer, offset)
+                items.append(item)
+            return items, offset
+        return read_sequence
+
+    raise ValueError(f"Unsupported type: {value_type}")
+
+class PubkeyColumn:
+    """A column of raw 32-byte pubkeys, base58-encoded lazily"""
+    def __init__(self, raw: np.ndarray):
+        self.raw = raw
+
+    def __len__(self):
+        return len(self.raw)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return PubkeyColumn(self.raw[index])
+        return encode_pubkey(self.raw[index].tobytes())
+
+    def __iter__(self):
+        for value in self.raw:
+            yield encode_pubkey(value.tobytes())
+
+    def tolist(self) -> list:
+        return list(self)
+
+class EventRegistry:
+    """
+    Routes `Program data:` log lines to the decoder registered for their 8-byte
+    discriminator. Each line is base64-decoded once, and every event of a
+    transaction is returned in log order.
+    """
+    def __init__(self, decoders=()):
+        self.decoders = {}
+        for decoder in decoders:
+            self.register(decoder)
+
+    def register(self, decoder: TokenEventDecoder):
+        self.decoders[decoder.discriminator] = decoder
+
+    def decode_logs(self, logs: list) -> list:
+        """Return (event_name, event) for every known event in `logs`"""
+        events = []
+        for log in logs:
+            if not log.startswith(PROGRAM_DATA):
+                continue
+            try:
+                raw = base64.b64decode(log[len(PROGRAM_DATA):])
+                decoder = self.decoders.get(raw[:DISCRIMINATOR_SIZE])
+                if decoder:
+                    events.append((decoder.event_name, decoder.decode_payload(raw)))
+            except (binascii.Error, struct.error, UnicodeDecodeError, IndexError, ValueError) as e:
+                # a truncated payload can end inside an Option/Vec prefix
+                logger.warning(f"Skipping malformed program data: {e}")
+        return events
+
+def idl_type(value_type):
+    """Normalise an Anchor IDL field type to the parse_dict notation"""
+    if isinstance(value_type, str):
+        return "pubkey" if value_type == "publicKey" else value_type
+    if "option" in value_type:
+        return {"option": idl_type(value_type["option"])}
+    if "vec" in value_type:
+        return {"vec": idl_type(value_type["vec"])}
+    if "array" in value_type:
+        inner_type, size = value_type["array"]
+        return {"array": [idl_type(inner_type), size]}
+    raise ValueError(f"Unsupported type: {value_type}")
+
+def snake_case(name: str) -> str:
+    return re.sub(r"([a-z0-9])([A-Z])", r"\1_\2", name).lower()
+
+def load_idl_registry(path=DEFAULT_IDL_PATH) -> EventRegistry:
+    """
+    Build an EventRegistry with a compiled decoder for every event in an Anchor
+    IDL. Registries are cached per file version, so repeated calls are free.
+    """
+    path = Path(path)
+    return _load_idl_registry(str(path), path.stat().st_mtime)
+
+@lru_cache(maxsize=8)
+def _load_idl_registry(path: str, mtime: float) -> EventRegistry:
+    with open(path) as f:
+        idl = json.load(f)
+    # Anchor >= 0.30 keeps event fields in `types` and ships the discriminator
+    types = {item["name"]: item for item in idl.get("types", [])}
+
+    registry = EventRegistry()
+    for event in idl.get("events", []):
+        name = event["name"]
+        fields = event.get("fields")
+        if fields is None:
+            fields = types.get(name, {}).get("type", {}).get("fields", [])
+        discriminator = event.get("discriminator")
+        try:
+            parse_dict = {snake_case(field["name"]): idl_type(field["type"]) for field in fields}
+            registry.register(TokenEventDecoder(
+                name, parse_dict, discriminator=bytes(discriminator) if discriminator else None
+            ))
+        except ValueError as e:
+            logger.warning(f"Skipping IDL event {name}: {e}")
+    return registry
+
 
 # Usage example
 if __name__ == "__main__":
+    import timeit
+
     my_dict = {
         "token_name": "string",
         "token_symbol": "string",
@@ -75,3 +388,11 @@ if __name__ == "__main__":
     decoder = TokenEventDecoder("TokenCreatedEvent", my_dict)
     event = decoder.decode(log_line)
     print("✅ Decoded Event:", event)
+    assert event == decoder.decode_with_construct(log_line)
+
+    # Microbenchmark: compiled struct path vs construct on the sample payload
+    runs = 20000
+    compiled = timeit.timeit(lambda: decoder.decode(log_line), number=runs)
+    reference = timeit.timeit(lambda: decoder.decode_with_construct(log_line), number=runs)
+    print(f"compiled:  {compiled / runs * 1e6:.1f} us/event")
+    print(f"construct: {reference / runs * 1e6:.1f} us/event ({reference / compiled:.1f}x slower)")
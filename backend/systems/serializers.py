@@ -7,6 +7,7 @@ from .models import (
     Coin,
     UserCoinHoldings, 
     Trade,
+    PriceCandle,
 )
 
 class SolanaUserSerializer(serializers.ModelSerializer):
@@ -43,6 +44,9 @@ class ConnectWalletSerializer(serializers.Serializer):
 
 class CoinSerializer(serializers.ModelSerializer):
     creator_display_name = serializers.SerializerMethodField()
+    # annotated by systems.utils.volume.annotate_rolling; 0 where the queryset was not annotated
+    volume_24h = serializers.DecimalField(max_digits=24, decimal_places=10, read_only=True, default=0)
+    trades_24h = serializers.IntegerField(read_only=True, default=0)
     
     class Meta:
         model = Coin
@@ -50,13 +54,22 @@ class CoinSerializer(serializers.ModelSerializer):
             'address', 'ticker', 'name', 'creator', 'creator_display_name',
             'created_at', 'total_supply', 'image_url',
             'description', 'discord', 'website', 'twitter',
-            'current_price', 'total_held', 'market_cap', 'score'
+            'current_price', 'total_held', 'holders_count', 'market_cap', 'score',
+            'volume_24h', 'trades_24h',
+        ]
+        read_only_fields = [
+            'address', 'creator', 'creator_display_name', 'created_at',
+            'current_price', 'total_held', 'holders_count', 'market_cap',
         ]
-        read_only_fields = ['address', 'creator', 'creator_display_name', 'created_at']
     
     def get_creator_display_name(self, obj):
         return obj.creator.get_display_name()
 
+class PriceCandleSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PriceCandle
+        fields = ['bucket_start', 'open', 'high', 'low', 'close', 'volume', 'trade_count']
+
 class UserCoinHoldingsSerializer(serializers.ModelSerializer):
     coin_ticker = serializers.ReadOnlyField(source='coin.ticker')
     coin_name = serializers.ReadOnlyField(source='coin.name')
@@ -80,9 +93,9 @@ class TradeSerializer(serializers.ModelSerializer):
         model = Trade
         fields = [
             'transaction_hash', 'user', 'coin', 'coin_symbol', 'trade_type',
-            'trade_type_display', 'coin_amount', 'sol_amount', 'created_at'
+            'trade_type_display', 'coin_amount', 'sol_amount', 'created_at', 'executed_at', 'provisional'
         ]
-        read_only_fields = ['transaction_hash', 'user', 'created_at']
+        read_only_fields = ['transaction_hash', 'user', 'created_at', 'executed_at', 'provisional']
    
     def get_trade_type_display(self, obj):
         return obj.get_trade_type_display()
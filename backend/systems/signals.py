@@ -1,13 +1,13 @@
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.db import transaction
-from django.db.models import F
 from django.utils import timezone
 from .models import (
     SolanaUser, Coin, Trade, UserCoinHoldings,
     DeveloperScore, TraderScore, CoinDRCScore
 )
 from .utils.broadcast import broadcast_coin_created, broadcast_trade_created
+from .utils.ingest import apply_trades
 
 # Create scores when users/coins are created
 @receiver(post_save, sender=SolanaUser)
@@ -30,72 +30,9 @@ def update_holdings_and_scores_on_trade(sender, instance, created, **kwargs):
         # If this is an update to an existing trade, we don't want to process it again
         return
     
+    # same holdings upsert and in-place holder count as batched ingestion
     with transaction.atomic():
-        user = instance.user
-        coin = instance.coin
-        
-        # Get or create the user's holdings for this coin
-        holdings, _ = UserCoinHoldings.objects.get_or_create(
-            user=user,
-            coin=coin,
-            defaults={'amount_held': 0}
-        )
-        
-        if instance.trade_type == 'BUY':
-            # Increase the amount held
-            holdings.amount_held = F('amount_held') + instance.coin_amount
-            holdings.save(update_fields=['amount_held'])
-            
-        elif instance.trade_type == 'SELL':
-            # Decrease the amount held
-            holdings.amount_held = F('amount_held') - instance.coin_amount
-            holdings.save(update_fields=['amount_held'])
-            
-        elif instance.trade_type == 'COIN_CREATE':
-            # Creator gets the initial supply minus any that might be in circulation
-            holdings.amount_held = F('amount_held') + instance.coin_amount
-            holdings.save(update_fields=['amount_held'])
-        
-        # Refresh from database to get the updated value
-        holdings.refresh_from_db()
-        
-        delete_holdings = False
-        # If holdings amount is zero or negative, mark for deletion
-        if holdings.amount_held <= 0:
-            delete_holdings = True
-        
-        # Update trader score - do this before potentially deleting holdings
-        trader_score, _ = TraderScore.objects.get_or_create(trader=user)
-        
-        # Update coin score - track 24h volume
-        coin_score, _ = CoinDRCScore.objects.get_or_create(coin=coin)
-        
-        # Add this trade's volume to 24h volume if it's a buy or sell
-        if instance.trade_type in ['BUY', 'SELL']:
-            # Get trades from last 24 hours
-            one_day_ago = timezone.now() - timezone.timedelta(hours=24)
-            recent_trades = Trade.objects.filter(
-                coin=coin,
-                created_at__gte=one_day_ago
-            )
-            
-            # Calculate volume
-            # volume = sum(t.sol_amount for t in recent_trades)
-            # coin_score.trade_volume_24h = volume
-            # coin_score.save(update_fields=['trade_volume_24h', 'updated_at'])
-        
-        # If this is a coin creation, update developer score
-        if instance.trade_type == 'COIN_CREATE':
-            dev_score, _ = DeveloperScore.objects.get_or_create(developer=coin.creator)
-            dev_score.recalculate_score()
-        
-        # Now delete the holdings if necessary
-        if delete_holdings:
-            holdings.delete()
-        
-        # Update holders count and recalculate scores
-        coin_score.update_holders_count()
-        # trader_score.recalculate_score()
+        apply_trades([instance])
         broadcast_trade_created(instance)
 
 @receiver(post_save, sender=Coin)
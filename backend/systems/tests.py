@@ -1,9 +1,44 @@
-from django.test import TestCase
+import asyncio
+import base64
+import importlib
+import json
+import multiprocessing
+import os
+import tempfile
+import struct
+import threading
+import time
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from django.test import TestCase, SimpleTestCase, TransactionTestCase
 from django.utils import timezone
+from django.core.cache import cache
 from decimal import Decimal
-from datetime import timedelta
-from django.db import IntegrityError
-from .models import SolanaUser, Coin, CoinDRCScore, UserCoinHoldings, Trade, DeveloperScore
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+from django.db import IntegrityError, connection, connections
+from django.core.management import call_command
+from io import StringIO
+from .models import SolanaUser, Coin, CoinDRCScore, UserCoinHoldings, Trade, DeveloperScore, PriceCandle
+from .utils.ingest import ingest_trades, rollback_provisional, expired_provisional
+from .utils.provisional import ProvisionalReconciler
+from .utils.deadletter import store_dead_letters, resolve_dead_letters, claim_due_dead_letters, DeadLetterRetrier
+from .models import DeadLetterEvent
+from .utils.identity import IdentityCache
+from .utils.dispatcher import CoinDispatcher, CoinNotReady, PendingBuffer
+from .utils.archive import ArchiveWriter, read_archive, replay_archive, parse_speed, decode_notification
+from .utils.notifications import LogNotification, SubscriptionMap
+from .utils.backfill import SolanaRpcClient, Backfiller, CheckpointStore
+from .utils.dedup import SignatureFilter
+from .models import ListenerCheckpoint, ListenerLease
+from .utils.leader import LeaderElector, acquire_lease, release_lease
+from .utils.fanin import SignatureFanIn
+from .utils.inbox import NotificationQueue
+from .utils.metrics import ListenerMetrics, MetricsServer
+from .utils.volume import WINDOWS, rolling_totals
+from .utils.metadata import MetadataCache, MetadataFetcher, MetadataEnricher, metadata_fields
+from .parser import TokenEventDecoder, EventRegistry, load_idl_registry
+from .serializers import CoinSerializer
 
 
 class CoinDRCScoreTestCase(TestCase):
@@ -484,3 +519,1635 @@ class CoinDRCScoreTestCase(TestCase):
     #     # Should return the current score
     #     self.assertEqual(score, drc_score.score)
     #     self.assertGreater(drc_score.age_in_hours, 0)
+
+
+class TradeIngestionTestCase(TestCase):
+    """Test cases for batched trade ingestion"""
+
+    def setUp(self):
+        self.creator = SolanaUser.objects.create_user(
+            wallet_address="1234567890123456789012345678901234567890123",
+        )
+        self.trader = SolanaUser.objects.create_user(
+            wallet_address="2234567890123456789012345678901234567890123",
+        )
+        self.coin = Coin.objects.create(
+            address="COIN123456789012345678901234567890123456789",
+            name="Test Coin",
+            creator=self.creator,
+            total_supply=Decimal('1000000'),
+            image_url="https://example.com/image.png",
+            ticker="TEST",
+        )
+
+    def trade_event(self, user, transfer_type, coin_amount, sol_amount=1_000_000_000):
+        return {
+            "transfer_type": transfer_type,
+            "mint_address": self.coin.address,
+            "user": user.wallet_address,
+            "sol_amount": sol_amount,
+            "coin_amount": coin_amount,
+        }
+
+    def test_batch_applies_holdings_and_skips_duplicates(self):
+        """Trades in a batch are inserted once and netted into holdings"""
+        batch = [
+            ("SIG1", self.trade_event(self.trader, 0, 5_000_000_000)),
+            ("SIG2", self.trade_event(self.creator, 0, 2_000_000_000)),
+            ("SIG3", self.trade_event(self.trader, 1, 1_000_000_000)),
+            ("SIG1", self.trade_event(self.trader, 0, 5_000_000_000)),
+        ]
+        inserted = ingest_trades(batch)
+
+        self.assertEqual(len(inserted), 3)
+        self.assertEqual(Trade.objects.count(), 3)
+        holding = UserCoinHoldings.objects.get(user=self.trader, coin=self.coin)
+        self.assertEqual(holding.amount_held, Decimal('4'))
+        self.assertEqual(CoinDRCScore.objects.get(coin=self.coin).holders_count, 2)
+
+        # replaying the same batch must not touch holdings again
+        seen = SignatureFilter()
+        self.assertEqual(ingest_trades(batch, seen=seen), [])
+        holding.refresh_from_db()
+        self.assertEqual(holding.amount_held, Decimal('4'))
+        self.assertEqual(seen.stats()["missed"], 3)
+
+    def test_insert_reports_only_new_rows(self):
+        """A batch mixing stored and new signatures only applies the new ones"""
+        ingest_trades([("SIG1", self.trade_event(self.trader, 0, 2_000_000_000))])
+        inserted = ingest_trades([
+            ("SIG1", self.trade_event(self.trader, 0, 2_000_000_000)),
+            ("SIG2", self.trade_event(self.trader, 0, 1_000_000_000)),
+        ])
+
+        self.assertEqual([trade.transaction_hash for trade in inserted], ["SIG2"])
+        self.assertEqual(
+            UserCoinHoldings.objects.get(user=self.trader, coin=self.coin).amount_held, Decimal('3')
+        )
+
+    def test_selling_everything_removes_holding(self):
+        """A holding that drops to zero is deleted"""
+        ingest_trades([("SIG1", self.trade_event(self.trader, 0, 3_000_000_000))])
+        ingest_trades([("SIG2", self.trade_event(self.trader, 1, 3_000_000_000))])
+
+        self.assertFalse(UserCoinHoldings.objects.filter(user=self.trader).exists())
+        self.assertEqual(CoinDRCScore.objects.get(coin=self.coin).holders_count, 0)
+
+    def test_batch_uses_constant_queries(self):
+        """Query count does not grow with the number of trades in the batch"""
+        batch = [
+            (f"SIG{i}", self.trade_event(self.trader, 0, 1_000_000_000))
+            for i in range(50)
+        ]
+        # savepoint/release + 8 statements, whatever the batch size
+        with self.assertNumQueries(10):
+            ingest_trades(batch)
+
+    def test_trade_costs_one_upsert_per_holding(self):
+        """A saved trade upserts its holding and adjusts the holder count without reading either"""
+        def trade(signature, trade_type, amount):
+            return Trade.objects.create(
+                transaction_hash=signature, user=self.trader, coin=self.coin,
+                trade_type=trade_type, coin_amount=Decimal(amount), sol_amount=Decimal('1'),
+            )
+
+        # trade insert, savepoint/release, holdings upsert, trader score, score holder count,
+        # coin columns, candles
+        with self.assertNumQueries(8):
+            trade("SIG1", 'BUY', '3')
+        with self.assertNumQueries(8):
+            trade("SIG2", 'SELL', '1')
+        self.assertEqual(UserCoinHoldings.objects.get(user=self.trader).amount_held, Decimal('2'))
+        self.assertEqual(CoinDRCScore.objects.get(coin=self.coin).holders_count, 1)
+
+        # closing the position adds the one DELETE
+        with self.assertNumQueries(9):
+            trade("SIG3", 'SELL', '2')
+        self.assertFalse(UserCoinHoldings.objects.filter(user=self.trader).exists())
+        self.assertEqual(CoinDRCScore.objects.get(coin=self.coin).holders_count, 0)
+
+    def test_coin_columns_follow_holdings(self):
+        """total_held, holders_count and market_cap move with every applied trade"""
+        ingest_trades([
+            ("SIG1", self.trade_event(self.trader, 0, 5_000_000_000)),
+            ("SIG2", self.trade_event(self.creator, 0, 2_000_000_000)),
+        ])
+        # selling more than is held removes the holding, not more than it held
+        ingest_trades([("SIG3", self.trade_event(self.creator, 1, 3_000_000_000))])
+
+        self.coin.refresh_from_db()
+        self.assertEqual((self.coin.holders_count, self.coin.total_held), (1, Decimal('5')))
+        # priced at the last trade: 1 SOL for 3 tokens
+        self.assertEqual(self.coin.market_cap, ((1000000 - 5) * Decimal(1) / 3).quantize(Decimal('0.00000001')))
+
+    def test_reconcile_repairs_drifted_columns(self):
+        """The reconcile command recomputes the columns from holdings, and then finds nothing to repair"""
+        # 1 SOL for 3 tokens, so the market cap has more decimals than the column keeps
+        ingest_trades([("SIG1", self.trade_event(self.trader, 0, 3_000_000_000))])
+        Coin.objects.filter(pk=self.coin.pk).update(total_held=0, holders_count=7)
+
+        out = StringIO()
+        call_command('reconcile_coin_stats', stdout=out)
+        self.assertIn("1 had drifted", out.getvalue())
+        self.coin.refresh_from_db()
+        self.assertEqual((self.coin.holders_count, self.coin.total_held), (1, Decimal('3')))
+
+        out = StringIO()
+        call_command('reconcile_coin_stats', stdout=out)
+        self.assertIn("0 had drifted", out.getvalue())
+
+    def test_save_leaves_trade_columns_alone(self):
+        """Saving a coin loaded before a trade keeps the trade's columns, and market_cap follows the supply"""
+        stale = Coin.objects.get(pk=self.coin.pk)
+        ingest_trades([("SIG1", self.trade_event(self.trader, 0, 5_000_000_000))])
+
+        stale.name = "Renamed"
+        stale.total_supply = Decimal('2000000')
+        stale.save()
+
+        self.coin.refresh_from_db()
+        self.assertEqual((self.coin.name, self.coin.total_held, self.coin.current_price), ("Renamed", Decimal('5'), Decimal('0.2')))
+        self.assertEqual(self.coin.market_cap, (2000000 - 5) * Decimal('0.2'))
+        self.assertEqual(stale.market_cap, self.coin.market_cap)
+
+    def test_sol_amount_is_in_lamports(self):
+        """SOL amounts are scaled by 9 decimals, coin amounts by the coin's own"""
+        Coin.objects.filter(pk=self.coin.pk).update(decimals=6)
+        ingest_trades([("SIG1", self.trade_event(self.trader, 0, 2_000_000, sol_amount=1_500_000_000))])
+
+        trade = Trade.objects.get(pk="SIG1")
+        self.assertEqual((trade.coin_amount, trade.sol_amount), (2, Decimal('1.5')))
+        self.coin.refresh_from_db()
+        self.assertEqual(self.coin.current_price, Decimal('0.75'))
+
+    def test_plain_save_is_one_query(self):
+        """Saving a coin without touching its supply is a single UPDATE that leaves the derived columns alone"""
+        ingest_trades([("SIG1", self.trade_event(self.trader, 0, 5_000_000_000))])
+        coin = Coin.objects.get(pk=self.coin.pk)
+        coin.name = "Renamed"
+        with self.assertNumQueries(1):
+            coin.save()
+        self.coin.refresh_from_db()
+        self.assertEqual((self.coin.name, self.coin.market_cap), ("Renamed", (1000000 - 5) * Decimal('0.2')))
+
+    def test_api_cannot_write_current_price(self):
+        """current_price is maintained by ingestion; the serializer ignores it and shows the stored one"""
+        serializer = CoinSerializer(self.coin, data={'name': 'Renamed', 'current_price': '9'}, partial=True)
+        self.assertTrue(serializer.is_valid())
+        self.assertNotIn('current_price', serializer.validated_data)
+        serializer.save()
+        self.assertEqual(Decimal(serializer.data['current_price']), 0)
+        self.coin.refresh_from_db()
+        self.assertEqual((self.coin.name, self.coin.current_price), ("Renamed", 0))
+
+    def test_coin_list_is_one_query(self):
+        """Listing coins reads the stored columns instead of aggregating per coin"""
+        for i in range(20):
+            Coin.objects.create(
+                address=f"LIST{i:040d}", name=f"Coin {i}", creator=self.creator,
+                total_supply=Decimal('1000'), image_url="https://example.com/image.png",
+            )
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/coins/')
+        self.assertEqual(len(response.json()), 21)
+
+    def test_trades_for_missing_coin_are_handed_back(self):
+        """Trades of a coin that is not written yet are returned, not dropped"""
+        early = {**self.trade_event(self.trader, 0, 1_000_000_000), "mint_address": "NEWMINT", "slot": 7}
+        waiting = []
+        ingest_trades([("SIG1", early)], missing_coins=waiting)
+        self.assertEqual(waiting, [("SIG1", early)])
+
+        store_dead_letters([("TokenTransferEvent", "SIG1", early)], "coin never appeared")
+        letter = DeadLetterEvent.objects.get()
+        self.assertEqual((letter.mint_address, letter.slot, letter.payload), ("NEWMINT", 7, early))
+
+    def test_identity_cache_skips_lookups(self):
+        """Once users and coins are cached, a batch no longer looks them up"""
+        identities = IdentityCache()
+        ingest_trades([("SIG1", self.trade_event(self.trader, 0, 1_000_000_000))], identities=identities)
+
+        batch = [
+            (f"SIG{i}", self.trade_event(self.trader, 0, 1_000_000_000))
+            for i in range(2, 10)
+        ]
+        with self.assertNumQueries(8):
+            inserted = ingest_trades(batch, identities=identities)
+
+        self.assertEqual(len(inserted), 8)
+        self.assertEqual(
+            UserCoinHoldings.objects.get(user=self.trader, coin=self.coin).amount_held, Decimal('9')
+        )
+        self.assertEqual(identities.stats()["coins"], {"size": 1, "hits": 1, "misses": 1})
+
+    def test_identity_cache_does_not_remember_unknown(self):
+        """Missing wallets are looked up again, so later sign-ups resolve"""
+        identities = IdentityCache(max_users=1)
+        self.assertEqual(identities.resolve_users(["NEWWALLET"]), {})
+        SolanaUser.objects.create_user(wallet_address="NEWWALLET")
+        self.assertIn("NEWWALLET", identities.resolve_users(["NEWWALLET"]))
+        identities.resolve_users([self.trader.wallet_address])
+        self.assertEqual(len(identities.users), 1)
+
+
+class PriceCandleTestCase(TestCase):
+    """Test cases for incremental OHLCV candles and the chart endpoint"""
+    START = datetime(2026, 3, 2, 10, 0, 30, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        self.creator = SolanaUser.objects.create_user(wallet_address="1234567890123456789012345678901234567890123")
+        self.trader = SolanaUser.objects.create_user(wallet_address="2234567890123456789012345678901234567890123")
+        self.coin = Coin.objects.create(
+            address="COIN123456789012345678901234567890123456789",
+            name="Test Coin",
+            creator=self.creator,
+            total_supply=Decimal('1000000'),
+            image_url="https://example.com/image.png",
+            ticker="TEST",
+        )
+
+    def trade_at(self, seconds, signature, sol_amount, provisional=False):
+        """Buy one token for `sol_amount` SOL, `seconds` after START"""
+        event = {
+            "transfer_type": 0,
+            "mint_address": self.coin.address,
+            "user": self.trader.wallet_address,
+            "sol_amount": int(Decimal(sol_amount) * 10**9),
+            "coin_amount": 10**9,
+            "provisional": provisional,
+        }
+        with mock.patch('django.utils.timezone.now', return_value=self.START + timedelta(seconds=seconds)):
+            ingest_trades([(signature, event)])
+
+    def candles(self, interval):
+        return list(
+            PriceCandle.objects.filter(coin=self.coin, interval=interval)
+            .values_list('open', 'high', 'low', 'close', 'volume', 'trade_count')
+        )
+
+    def test_trades_fold_into_every_interval(self):
+        """Each trade updates its 1m/5m/1h/1d buckets in place"""
+        self.trade_at(0, "SIG1", 1)
+        self.trade_at(10, "SIG2", 3)
+        self.trade_at(20, "SIG3", 2)
+        self.trade_at(60, "SIG4", 4)
+
+        self.assertEqual(self.candles('1m'), [(1, 3, 1, 2, 6, 3), (4, 4, 4, 4, 4, 1)])
+        self.assertEqual(self.candles('1d'), [(1, 4, 1, 4, 10, 4)])
+        first = PriceCandle.objects.filter(interval='1m').first()
+        self.assertEqual(first.bucket_start, datetime(2026, 3, 2, 10, 0, tzinfo=dt_timezone.utc))
+
+        # a rebuild from the trade table arrives at the same rows
+        incremental = self.candles('5m')
+        call_command('rebuild_candles', stdout=StringIO())
+        self.assertEqual(self.candles('5m'), incremental)
+
+    def test_late_trade_lands_in_its_own_bucket(self):
+        """A trade applied after later ones is bucketed by when it was executed, without taking over the close"""
+        self.trade_at(0, "SIG1", 1)
+        self.trade_at(20, "SIG2", 2)
+        self.trade_at(61, "SIG3", 4)
+        # backfilled a minute later, executed between SIG1 and SIG2
+        event = {
+            "transfer_type": 0, "mint_address": self.coin.address, "user": self.trader.wallet_address,
+            "sol_amount": 5 * 10**9, "coin_amount": 10**9,
+            "block_time": (self.START + timedelta(seconds=10)).timestamp(),
+        }
+        with mock.patch('django.utils.timezone.now', return_value=self.START + timedelta(seconds=120)):
+            ingest_trades([("SIG_LATE", event)])
+
+        self.assertEqual(self.candles('1m'), [(1, 5, 1, 2, 8, 3), (4, 4, 4, 4, 4, 1)])
+        self.assertEqual(
+            Trade.objects.get(pk="SIG_LATE").executed_at, self.START + timedelta(seconds=10)
+        )
+        # the coin keeps the price of SIG3, while ath still takes the late high
+        self.coin.refresh_from_db()
+        self.assertEqual((self.coin.current_price, self.coin.ath), (4, 5))
+        self.assertEqual(self.coin.last_price_at, self.START + timedelta(seconds=61))
+        # a rebuild from the trade table agrees
+        incremental = self.candles('1m')
+        call_command('rebuild_candles', stdout=StringIO())
+        self.assertEqual(self.candles('1m'), incremental)
+
+    def test_rollback_recomputes_high(self):
+        """Rolling back a provisional trade takes it out of its candles"""
+        self.trade_at(0, "SIG1", 1)
+        self.trade_at(10, "SIG2", 5, provisional=True)
+        self.assertEqual(self.candles('1h'), [(1, 5, 1, 5, 6, 2)])
+
+        rollback_provisional(["SIG2"])
+        self.assertEqual(self.candles('1h'), [(1, 1, 1, 1, 1, 1)])
+
+    def test_price_and_ath_follow_trades(self):
+        """current_price is the last execution price, ath the highest, rolled back with the trade"""
+        self.trade_at(0, "SIG1", 1)
+        self.trade_at(10, "SIG2", 3)
+        self.trade_at(20, "SIG3", Decimal('0.000000002'))
+        self.coin.refresh_from_db()
+        self.assertEqual((self.coin.current_price, self.coin.ath), (Decimal('0.000000002'), 3))
+        self.assertEqual(self.coin.market_cap, ((1000000 - 3) * Decimal('0.000000002')).quantize(Decimal('0.00000001')))
+
+        self.trade_at(30, "SIG4", 7, provisional=True)
+        self.coin.refresh_from_db()
+        self.assertEqual((self.coin.current_price, self.coin.ath), (7, 7))
+        rollback_provisional(["SIG4"])
+        self.coin.refresh_from_db()
+        self.assertEqual((self.coin.current_price, self.coin.ath), (Decimal('0.000000002'), 3))
+        self.assertEqual(self.coin.last_price_at, self.START + timedelta(seconds=20))
+
+    def test_rolling_windows(self):
+        """24h/7d/30d volume and trade counts are summed from a bounded number of buckets"""
+        self.trade_at(-3 * 86400, "SIG1", 4)
+        self.trade_at(-2 * 3600, "SIG2", 1)
+        self.trade_at(0, "SIG3", 2)
+        now = self.START + timedelta(hours=1)
+
+        totals = {window: rolling_totals([self.coin.address], window, now)[self.coin.address] for window in WINDOWS}
+        self.assertEqual(totals, {"24h": (3, 2), "7d": (7, 3), "30d": (7, 3)})
+        self.assertEqual(rolling_totals(["NOCOIN"], "24h", now), {"NOCOIN": (0, 0)})
+
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            coin = self.client.get(f'/api/coins/{self.coin.address}/').json()
+        self.assertEqual((Decimal(coin['volume_24h']), coin['trades_24h']), (3, 2))
+
+    def test_endpoint_serves_range(self):
+        """The candles action filters on interval and time range with one query"""
+        for minute in range(5):
+            self.trade_at(minute * 60, f"SIG{minute}", minute + 1)
+        url = f'/api/coins/{self.coin.address}/candles/'
+        start = int(self.START.timestamp()) - 30 + 60  # 10:01:00
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'interval': '1m', 'from': start, 'to': start + 180})
+        self.assertEqual([candle['close'] for candle in response.json()], ['2.000000000000000000', '3.000000000000000000', '4.000000000000000000'])
+
+        latest = self.client.get(url, {'interval': '1m', 'limit': 2}).json()
+        self.assertEqual([candle['trade_count'] for candle in latest], [1, 1])
+        self.assertEqual(latest[-1]['open'], '5.000000000000000000')
+        self.assertEqual(self.client.get(url, {'interval': '2m'}).status_code, 400)
+
+
+class CoinDispatcherTestCase(SimpleTestCase):
+    """Test cases for the per-coin ordered worker pool"""
+
+    async def test_events_for_a_coin_stay_ordered(self):
+        """Events of one coin are applied in order on a single DB thread"""
+        applied = []
+
+        def handle_event(event_type, signature, event):
+            applied.append((event["mint_address"], signature, threading.current_thread().name))
+
+        def handle_trades(batch):
+            for signature, event in batch:
+                applied.append((event["mint_address"], signature, threading.current_thread().name))
+
+        dispatcher = CoinDispatcher(handle_event, handle_trades, workers=4, batch_window=0.01)
+        await dispatcher.start()
+        for mint in ("MINT_A", "MINT_B", "MINT_C"):
+            await dispatcher.submit("TokenCreatedEvent", f"{mint}-create", {"mint_address": mint})
+            await dispatcher.submit("InitVaultEvent", f"{mint}-init", {"mint_address": mint})
+            for i in range(5):
+                await dispatcher.submit("TokenTransferEvent", f"{mint}-trade{i}", {"mint_address": mint})
+        await dispatcher.stop()
+
+        for mint in ("MINT_A", "MINT_B", "MINT_C"):
+            rows = [row for row in applied if row[0] == mint]
+            self.assertEqual(
+                [signature for _, signature, _ in rows],
+                [f"{mint}-create", f"{mint}-init"] + [f"{mint}-trade{i}" for i in range(5)],
+            )
+            self.assertEqual(len({thread for _, _, thread in rows}), 1)
+
+    async def test_slow_coin_does_not_block_others(self):
+        """A coin stuck on a slow write does not hold up a coin on another worker"""
+        release = threading.Event()
+        applied = []
+
+        def handle_event(event_type, signature, event):
+            if signature == "slow":
+                release.wait(5)
+            applied.append(signature)
+
+        dispatcher = CoinDispatcher(handle_event, lambda batch: None, workers=2)
+        slow, fast = "MINT_A", next(
+            mint for mint in ("MINT_B", "MINT_C", "MINT_D", "MINT_E")
+            if dispatcher.worker_for(mint) is not dispatcher.worker_for("MINT_A")
+        )
+        await dispatcher.start()
+        await dispatcher.submit("TokenCreatedEvent", "slow", {"mint_address": slow})
+        await dispatcher.submit("TokenCreatedEvent", "fast", {"mint_address": fast})
+        await asyncio.wait_for(dispatcher.worker_for(fast).queue.join(), timeout=2)
+        self.assertEqual(applied, ["fast"])
+
+        release.set()
+        await dispatcher.stop()
+        self.assertEqual(applied, ["fast", "slow"])
+
+    async def test_events_wait_for_their_coin(self):
+        """Events that arrive before their coin are parked and replayed in slot order"""
+        coins, applied, dead = set(), [], []
+
+        def handle_event(event_type, signature, event):
+            if event_type == "TokenCreatedEvent":
+                coins.add(event["mint_address"])
+            elif event["mint_address"] not in coins:
+                raise CoinNotReady(event["mint_address"])
+            elif event_type == "Broken":
+                raise ValueError("bad payload")
+            applied.append(signature)
+
+        def handle_trades(batch):
+            waiting = [(signature, event) for signature, event in batch if event["mint_address"] not in coins]
+            applied.extend(signature for signature, event in batch if event["mint_address"] in coins)
+            return waiting
+
+        dispatcher = CoinDispatcher(
+            handle_event, handle_trades, workers=1, batch_window=0.01,
+            dead_letter=lambda entries, reason: dead.extend((entry[1], reason) for entry in entries),
+        )
+        await dispatcher.start()
+        await dispatcher.submit("TokenTransferEvent", "trade", {"mint_address": "MINT", "slot": 12})
+        await dispatcher.submit("InitVaultEvent", "init", {"mint_address": "MINT", "slot": 11})
+        await dispatcher.worker_for("MINT").queue.join()
+        await dispatcher.worker_for("MINT").batcher.flush()
+        self.assertEqual((applied, dispatcher.pending_count()), ([], 2))
+
+        await dispatcher.submit("TokenCreatedEvent", "create", {"mint_address": "MINT", "slot": 10})
+        await dispatcher.submit("Broken", "broken", {"mint_address": "MINT", "slot": 13})
+        await dispatcher.submit("InitVaultEvent", "orphan", {"mint_address": "OTHER", "slot": 14})
+        await dispatcher.stop()
+
+        self.assertEqual(applied, ["create", "init", "trade"])
+        self.assertEqual(dead, [
+            ("broken", "ValueError: bad payload"),
+            ("orphan", "coin never appeared before shutdown"),
+        ])
+
+    def test_pending_buffer_ttl_and_bound(self):
+        """Parked events expire after the TTL and the oldest overflow first"""
+        pending = PendingBuffer(ttl=10, max_size=2)
+        pending.park("InitVaultEvent", "a", {"mint_address": "M1"}, now=0)
+        pending.park("InitVaultEvent", "b", {"mint_address": "M2"}, now=5)
+        overflow = pending.park("InitVaultEvent", "c", {"mint_address": "M2"}, now=6)
+
+        self.assertEqual([signature for _, signature, _ in overflow], ["a"])
+        self.assertEqual([signature for _, signature, _ in pending.expire(now=15.5)], ["b"])
+        self.assertEqual(len(pending), 1)
+
+
+class DeadLetterRetryTestCase(TestCase):
+    """Test cases for retrying dead-lettered events"""
+
+    def bury(self, signature="SIG1"):
+        store_dead_letters([("InitVaultEvent", signature, {"mint_address": "MINT", "slot": 3})], "ValueError: boom")
+        return DeadLetterEvent.objects.get(signature=signature)
+
+    def test_retries_back_off_until_exhausted(self):
+        """Each claim pushes the next retry out further; the last one clears it"""
+        letter = self.bury()
+        self.assertEqual(claim_due_dead_letters(10), [])
+
+        DeadLetterEvent.objects.update(next_retry_at=timezone.now())
+        before = timezone.now()
+        [claimed] = claim_due_dead_letters(10, max_attempts=2)
+        self.assertEqual(claimed.attempts, 1)
+        self.assertGreaterEqual(claimed.next_retry_at, before + timedelta(seconds=10))
+
+        DeadLetterEvent.objects.update(next_retry_at=timezone.now())
+        [claimed] = claim_due_dead_letters(10, max_attempts=2)
+        self.assertIsNone(claimed.next_retry_at)
+        self.assertEqual(claim_due_dead_letters(10), [])
+
+        # a retry that fails again keeps its row
+        store_dead_letters([("InitVaultEvent", "SIG1", {**letter.payload, "dead_letter_id": letter.pk})], "still broken")
+        self.assertEqual(list(DeadLetterEvent.objects.values_list('reason', flat=True)), ["still broken"])
+        resolve_dead_letters([letter.pk])
+        self.assertFalse(DeadLetterEvent.objects.exists())
+
+    async def test_retrier_requeues_and_resolves(self):
+        """Due dead letters go back through the workers and are dropped once handled"""
+        letter = await DeadLetterEvent.objects.acreate(
+            event_type="InitVaultEvent", signature="SIG1", mint_address="MINT",
+            payload={"mint_address": "MINT"}, reason="boom", next_retry_at=timezone.now(),
+        )
+        applied, resolved = [], []
+        dispatcher = CoinDispatcher(
+            lambda event_type, signature, event: applied.append(signature),
+            lambda batch: [], workers=1, resolve_dead_letters=resolved.extend,
+        )
+        await dispatcher.start()
+        self.assertEqual(await DeadLetterRetrier(dispatcher).drain(), 1)
+        await dispatcher.stop()
+
+        self.assertEqual((applied, resolved), (["SIG1"], [letter.pk]))
+
+    async def test_full_queue_does_not_use_up_attempts(self):
+        """A letter that could not be queued keeps its attempt count and stays due"""
+        due = timezone.now()
+        letter = await DeadLetterEvent.objects.acreate(
+            event_type="InitVaultEvent", signature="SIG1", mint_address="MINT",
+            payload={"mint_address": "MINT"}, reason="boom", next_retry_at=due,
+        )
+        dispatcher = mock.Mock(try_submit=mock.Mock(return_value=False))
+        retrier = DeadLetterRetrier(dispatcher, max_attempts=2)
+        for _ in range(3):
+            self.assertEqual(await retrier.drain(), 0)
+
+        await letter.arefresh_from_db()
+        self.assertEqual((letter.attempts, letter.next_retry_at), (0, due))
+        self.assertEqual(dispatcher.try_submit.call_count, 3)
+
+    async def test_retries_never_wait_for_queue_space(self):
+        """A full queue skips the retry instead of blocking"""
+        dispatcher = CoinDispatcher(lambda *args: None, lambda batch: [], workers=1, queue_size=1)
+        self.assertTrue(dispatcher.try_submit("InitVaultEvent", "a", {"mint_address": "MINT"}))
+        self.assertFalse(dispatcher.try_submit("InitVaultEvent", "b", {"mint_address": "MINT"}))
+
+
+class TokenEventDecoderTestCase(SimpleTestCase):
+    """Test cases for the compiled event decoder"""
+
+    def test_fixed_layout_matches_construct(self):
+        """TokenTransferEvent decodes in one unpack and matches the construct path"""
+        decoder = TokenEventDecoder("TokenTransferEvent", {
+            "transfer_type": "u8",
+            "mint_address": "pubkey",
+            "user": "pubkey",
+            "sol_amount": "u64",
+            "coin_amount": "u64",
+        })
+        raw = decoder.discriminator + struct.pack("<B32s32sQQ", 1, os.urandom(32), os.urandom(32), 7, 2**64 - 1)
+        log_line = "Program data: " + base64.b64encode(raw).decode()
+
+        self.assertEqual(len(decoder.steps), 1)
+        self.assertEqual(decoder.decode(log_line), decoder.decode_with_construct(log_line))
+
+    def test_string_layout_matches_construct(self):
+        """Layouts with strings decode like the construct path"""
+        decoder = TokenEventDecoder("TokenCreatedEvent", {
+            "token_name": "string",
+            "token_symbol": "string",
+            "token_uri": "string",
+            "mint_address": "pubkey",
+            "creator": "pubkey",
+            "decimals": "u8",
+        })
+        raw = decoder.discriminator
+        for value in ("Notty ✓", "NTY", "ipfs://QmHash"):
+            encoded = value.encode()
+            raw += struct.pack("<I", len(encoded)) + encoded
+        raw += os.urandom(64) + bytes([6])
+        log_line = "Program data: " + base64.b64encode(raw).decode()
+
+        event = decoder.decode(log_line)
+        self.assertEqual(event, decoder.decode_with_construct(log_line))
+        self.assertEqual(event["token_name"], "Notty ✓")
+        self.assertEqual(event["decimals"], 6)
+
+    def test_batch_decode_matches_single_decode(self):
+        """decode_batch returns the same values as decoding line by line"""
+        decoder = TokenEventDecoder("TokenTransferEvent", {
+            "transfer_type": "u8",
+            "mint_address": "pubkey",
+            "user": "pubkey",
+            "sol_amount": "u64",
+            "coin_amount": "u64",
+        })
+        other = TokenEventDecoder("OtherEvent", {"transfer_type": "u8"})
+        lines = []
+        for i in range(20):
+            raw = decoder.discriminator + struct.pack("<B32s32sQQ", i % 2, os.urandom(32), os.urandom(32), i, i * 10)
+            lines.append("Program data: " + base64.b64encode(raw).decode())
+        # same size, wrong discriminator
+        lines.append("Program data: " + base64.b64encode(other.discriminator + os.urandom(81)).decode())
+        lines.append("Program log: Instruction: BuyToken")
+
+        columns = decoder.decode_batch(lines)
+        expected = [decoder.decode(line) for line in lines[:20]]
+
+        self.assertEqual(len(columns["user"]), 20)
+        for key in ("mint_address", "user"):
+            self.assertEqual(columns[key].tolist(), [event[key] for event in expected])
+        for key in ("transfer_type", "sol_amount", "coin_amount"):
+            self.assertEqual(columns[key].tolist(), [event[key] for event in expected])
+
+    def test_other_discriminators_are_ignored(self):
+        """Lines for other events or plain logs decode to None"""
+        decoder = TokenEventDecoder("InitVaultEvent", {"mint_address": "pubkey"})
+        other = base64.b64encode(b"\x00" * 40).decode()
+
+        self.assertIsNone(decoder.decode("Program data: " + other))
+        self.assertIsNone(decoder.decode("Program log: Instruction: BuyToken"))
+
+
+class EventRegistryTestCase(SimpleTestCase):
+    """Test cases for discriminator-indexed event routing"""
+
+    def test_every_event_of_a_transaction_is_decoded_in_order(self):
+        """A transaction emitting several events yields all of them"""
+        created = TokenEventDecoder("TokenCreatedEvent", {"mint_address": "pubkey", "decimals": "u8"})
+        transfer = TokenEventDecoder("TokenTransferEvent", {"transfer_type": "u8", "coin_amount": "u64"})
+        registry = EventRegistry([created, transfer])
+
+        def program_data(raw):
+            return "Program data: " + base64.b64encode(raw).decode()
+
+        logs = [
+            "Program log: Instruction: CreateToken",
+            program_data(created.discriminator + os.urandom(32) + bytes([9])),
+            "Program log: Instruction: BuyToken",
+            program_data(b"\x01" * 8 + b"unknown event"),
+            program_data(transfer.discriminator + struct.pack("<BQ", 0, 10)),
+            program_data(transfer.discriminator + struct.pack("<BQ", 1, 4)),
+        ]
+        events = registry.decode_logs(logs)
+
+        self.assertEqual(
+            [event_type for event_type, _ in events],
+            ["TokenCreatedEvent", "TokenTransferEvent", "TokenTransferEvent"],
+        )
+        self.assertEqual(events[1][1], {"transfer_type": 0, "coin_amount": 10})
+        self.assertEqual(events[2][1], {"transfer_type": 1, "coin_amount": 4})
+
+    def test_truncated_option_skips_only_its_line(self):
+        """A payload cut off inside an Option prefix is skipped; the rest of the logs still decode"""
+        optional = TokenEventDecoder("OptionalEvent", {"kind": "u8", "amount": {"option": "u64"}})
+        transfer = TokenEventDecoder("TokenTransferEvent", {"transfer_type": "u8", "coin_amount": "u64"})
+        registry = EventRegistry([optional, transfer])
+        logs = [
+            "Program data: " + base64.b64encode(optional.discriminator + b"\x01").decode(),
+            "Program data: " + base64.b64encode(transfer.discriminator + struct.pack("<BQ", 0, 10)).decode(),
+        ]
+        with self.assertLogs('systems.parser', level='WARNING'):
+            events = registry.decode_logs(logs)
+        self.assertEqual(events, [("TokenTransferEvent", {"transfer_type": 0, "coin_amount": 10})])
+
+
+class IdlRegistryTestCase(SimpleTestCase):
+    """Test cases for decoders generated from an Anchor IDL"""
+
+    def test_bundled_idl_matches_listener_events(self):
+        """The bundled IDL yields the events the listener handles"""
+        registry = load_idl_registry()
+        decoders = {decoder.event_name: decoder for decoder in registry.decoders.values()}
+
+        self.assertEqual(
+            set(decoders), {"TokenCreatedEvent", "InitVaultEvent", "TokenTransferEvent"}
+        )
+        self.assertEqual(
+            list(decoders["TokenTransferEvent"].parse_dict),
+            ["transfer_type", "mint_address", "user", "sol_amount", "coin_amount"],
+        )
+
+    def test_extended_types(self):
+        """u16/u32/u128/i64/bool/Option/Vec fields decode from an IDL"""
+        idl = {"events": [{"name": "RichEvent", "fields": [
+            {"name": "small", "type": "u16"},
+            {"name": "medium", "type": "u32"},
+            {"name": "huge", "type": "u128"},
+            {"name": "delta", "type": "i64"},
+            {"name": "isLive", "type": "bool"},
+            {"name": "maybeOwner", "type": {"option": "publicKey"}},
+            {"name": "noMemo", "type": {"option": "string"}},
+            {"name": "amounts", "type": {"vec": "u64"}},
+        ]}]}
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+            json.dump(idl, f)
+        self.addCleanup(os.remove, f.name)
+
+        registry = load_idl_registry(f.name)
+        decoder = next(iter(registry.decoders.values()))
+        owner = os.urandom(32)
+        raw = (
+            decoder.discriminator
+            + struct.pack("<HI", 7, 70000)
+            + (2**100).to_bytes(16, "little")
+            + struct.pack("<q?", -5, True)
+            + b"\x01" + owner
+            + b"\x00"
+            + struct.pack("<I3Q", 3, 1, 2, 3)
+        )
+        events = registry.decode_logs(["Program data: " + base64.b64encode(raw).decode()])
+
+        self.assertEqual(events, [("RichEvent", {
+            "small": 7,
+            "medium": 70000,
+            "huge": 2**100,
+            "delta": -5,
+            "is_live": True,
+            "maybe_owner": TokenEventDecoder._get_proper_output("pubkey", owner),
+            "no_memo": None,
+            "amounts": [1, 2, 3],
+        })])
+        self.assertIs(load_idl_registry(f.name), registry)
+
+
+class EventArchiveTestCase(SimpleTestCase):
+    """Test cases for the raw event archive and replay"""
+
+    def write_archive(self, suffix, notifications):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        writer = ArchiveWriter(path)
+        for notification in notifications:
+            writer.write(notification)
+        writer.close()
+        return path
+
+    def test_round_trip(self):
+        """Notifications come back unchanged and in order, compressed or not"""
+        notifications = [
+            LogNotification("sig1", 10, ["Program log: a", "Program data: AAAA"], received_at=1.5, program_id="PROGRAM_B", block_time=1),
+            LogNotification("sig2", 11, [], err={"InstructionError": [0, "Custom"]}, received_at=2.5),
+        ]
+        for suffix in (".bin", ".bin.gz"):
+            path = self.write_archive(suffix, notifications)
+            restored = list(read_archive(path))
+            self.assertEqual(
+                [(n.signature, n.slot, n.logs, n.err, n.received_at, n.program_id, n.block_time) for n in restored],
+                [(n.signature, n.slot, n.logs, n.err, n.received_at, n.program_id, n.block_time) for n in notifications],
+            )
+
+    def test_records_without_program_still_decode(self):
+        """Version 0 records, written before the program was stored, read back without one"""
+        def string(value):
+            return struct.pack("<I", len(value)) + value.encode()
+
+        body = struct.pack("<QdB", 12, 3.5, 1) + string("sig3") + string('"Failed"') + struct.pack("<I", 1) + string("log")
+        restored = decode_notification(body)
+
+        self.assertEqual(
+            (restored.signature, restored.slot, restored.logs, restored.err, restored.received_at, restored.program_id),
+            ("sig3", 12, ["log"], "Failed", 3.5, None),
+        )
+
+    def test_replay_feeds_callback(self):
+        """Replay hands every notification to the callback in archive order"""
+        path = self.write_archive(".bin", [
+            LogNotification(f"sig{i}", i, [f"log {i}"], received_at=100.0 + i / 1000)
+            for i in range(5)
+        ])
+        seen = []
+
+        async def callback(notification):
+            seen.append(notification.signature)
+
+        count = asyncio.run(replay_archive(path, callback, speed="realtime"))
+
+        self.assertEqual(count, 5)
+        self.assertEqual(seen, [f"sig{i}" for i in range(5)])
+        self.assertEqual(parse_speed("10x"), 10.0)
+        with self.assertRaises(ValueError):
+            parse_speed("fast")
+
+
+class StandInRpc:
+    """Local stand-in for the two RPC methods backfilling uses"""
+
+    def __init__(self, transactions):
+        # oldest first: (signature, slot, err, logs)
+        self.transactions = transactions
+        self.calls = []
+
+    async def handle(self, request):
+        body = await request.json()
+        method, params = body["method"], body["params"]
+        self.calls.append(method)
+        if method == "getSignaturesForAddress":
+            config = params[1]
+            newest_first = [
+                {"signature": sig, "slot": slot, "err": err}
+                for sig, slot, err, _ in reversed(self.transactions)
+            ]
+            signatures = [info["signature"] for info in newest_first]
+            start = signatures.index(config["before"]) + 1 if config.get("before") else 0
+            end = signatures.index(config["until"]) if config.get("until") else len(signatures)
+            result = newest_first[start:end][:config["limit"]]
+        else:
+            sig, slot, err, logs = next(tx for tx in self.transactions if tx[0] == params[0])
+            result = {"slot": slot, "meta": {"err": err, "logMessages": logs}}
+        return web.json_response({"jsonrpc": "2.0", "id": body["id"], "result": result})
+
+    async def backfill(self, until, page_size=2):
+        app = web.Application()
+        app.router.add_post("/", self.handle)
+        delivered = []
+
+        async def callback(notification):
+            delivered.append(notification)
+
+        async with TestServer(app) as server:
+            rpc = SolanaRpcClient(str(server.make_url("/")))
+            try:
+                count = await Backfiller(
+                    rpc, "Program1111", callback, concurrency=2, page_size=page_size
+                ).run(until)
+            finally:
+                await rpc.close()
+        return count, delivered
+
+class BackfillTestCase(SimpleTestCase):
+    """Test cases for gap backfill after a reconnect"""
+
+    def test_backfill_pages_until_checkpoint(self):
+        """Everything after the checkpoint is delivered oldest first, failures skipped"""
+        stand_in = StandInRpc([
+            ("sig0", 10, None, ["old"]),
+            ("sig1", 11, None, ["log 1"]),
+            ("sig2", 12, {"InstructionError": [0, "Custom"]}, ["failed"]),
+            ("sig3", 13, None, ["log 3"]),
+            ("sig4", 14, None, ["log 4"]),
+            ("sig5", 15, None, ["log 5"]),
+        ])
+
+        count, delivered = asyncio.run(stand_in.backfill("sig0"))
+
+        self.assertEqual(count, 4)
+        self.assertEqual([n.signature for n in delivered], ["sig1", "sig3", "sig4", "sig5"])
+        self.assertEqual([n.slot for n in delivered], [11, 13, 14, 15])
+        self.assertEqual(delivered[0].logs, ["log 1"])
+        self.assertEqual({n.program_id for n in delivered}, {"Program1111"})
+        # 5 newer signatures in pages of 2, plus one getTransaction per success
+        self.assertEqual(stand_in.calls.count("getSignaturesForAddress"), 3)
+        self.assertEqual(stand_in.calls.count("getTransaction"), 4)
+
+    def test_recent_signatures_dedupes(self):
+        """A signature delivered live is not delivered again by the backfill"""
+        recent = SignatureFilter(max_size=2)
+        self.assertTrue(recent.add("a"))
+        self.assertFalse(recent.add("a"))
+        recent.add("b")
+        recent.add("c")
+        self.assertNotIn("a", recent)
+        self.assertEqual(len(recent), 2)
+        stats = recent.stats()
+        self.assertEqual((stats["checked"], stats["duplicates"], stats["evicted"]), (4, 1, 1))
+        self.assertGreater(stats["memory_bytes"], 0)
+
+PROGRAM = "A7sBBSngzEZTsCPCffHDbeXDJ54uJWkwdEsskmn2YBGo"
+
+def listeners_module():
+    """
+    systems.listeners. The installed solana-py may not ship the websocket
+    `connect` it imports; the tests patch it with a FakeWebsocket anyway.
+    """
+    from solana.rpc import websocket_api
+    with mock.patch.object(websocket_api, 'connect', None, create=True):
+        return importlib.import_module('systems.listeners')
+
+def log_note(slot, signature, subscription=None, logs=None):
+    """A logsNotification as a raw JSON message"""
+    return {"method": "logsNotification", "params": {"subscription": subscription, "result": {
+        "context": {"slot": slot},
+        "value": {"signature": signature, "logs": logs or [f"log {signature}"], "err": None},
+    }}}
+
+class FakeWebsocket:
+    """A websocket that plays back scripted messages, then stays open until closed"""
+
+    def __init__(self, messages=(), log=None):
+        self.messages = list(messages)
+        self.subscribed = []
+        self.closed = asyncio.Event()
+        # shared by several sockets to see the order calls happened in
+        self.log = log if log is not None else []
+
+    async def logs_subscribe(self, program_filter, commitment):
+        self.subscribed.append(program_filter)
+        self.log.append(("subscribe", self))
+
+    async def logs_unsubscribe(self, subscription_id):
+        pass
+
+    async def close(self):
+        self.log.append(("close", self))
+        self.closed.set()
+
+    def __aiter__(self):
+        return self.play()
+
+    async def play(self):
+        for message in self.messages:
+            yield message
+        await self.closed.wait()
+
+async def wait_until(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        await asyncio.sleep(0.005)
+
+class CheckpointStoreTestCase(TestCase):
+    """Test cases for the persisted listener checkpoint"""
+
+    def test_checkpoint_round_trip(self):
+        """Only newer slots advance the checkpoint, and it survives a restart"""
+        store = CheckpointStore("Program1111")
+        store.advance(20, "sig20")
+        store.advance(19, "sig19")
+        store.save_sync()
+
+        restored = CheckpointStore("Program1111")
+        restored.load_sync()
+
+        self.assertEqual((restored.slot, restored.signature), (20, "sig20"))
+        self.assertEqual(ListenerCheckpoint.objects.count(), 1)
+
+    async def test_checkpoint_waits_for_queued_events(self):
+        """Stopping with events still queued saves a checkpoint that does not cover them"""
+        listeners = listeners_module()
+        gate, committed = threading.Event(), []
+
+        def handle_event(event_type, signature, event):
+            if event["slot"] >= 3:
+                gate.wait(5)
+            committed.append(event["slot"])
+
+        dispatcher = CoinDispatcher(handle_event, lambda batch: None, workers=1)
+        checkpoint = CheckpointStore(PROGRAM)
+
+        async def callback(notification):
+            event = {"mint_address": "MINT", "slot": notification.slot}
+            await dispatcher.submit("InitVaultEvent", notification.signature, event, notification.delivery)
+
+        websocket = FakeWebsocket([log_note(slot, f"sig{slot}") for slot in range(1, 6)])
+        listener = listeners.SolanaEventListener(
+            "ws://node", PROGRAM, callback, checkpoint=checkpoint, heartbeat_interval=None,
+        )
+        await dispatcher.start()
+        with mock.patch.object(listeners, 'connect', mock.AsyncMock(return_value=websocket)):
+            reader = asyncio.create_task(listener.listen())
+            await wait_until(lambda: len(committed) == 2)
+            # everything is handed off, slots 3-5 still sit on the worker queue
+            await listener.stop()
+            await reader
+        await checkpoint.save()
+        saved = await ListenerCheckpoint.objects.aget(program_id=PROGRAM)
+        self.assertEqual((saved.slot, saved.signature), (2, "sig2"))
+
+        gate.set()
+        await dispatcher.stop()
+        await checkpoint.save()
+        saved = await ListenerCheckpoint.objects.aget(program_id=PROGRAM)
+        self.assertEqual((saved.slot, saved.signature, committed), (5, "sig5", [1, 2, 3, 4, 5]))
+
+
+class LeaderLeaseTestCase(TestCase):
+    """Test cases for electing the one listener replica that writes"""
+
+    def test_lease_is_exclusive_until_it_expires(self):
+        self.assertTrue(acquire_lease("listener", "replica-a", ttl=10))
+        self.assertFalse(acquire_lease("listener", "replica-b", ttl=10))
+        # renewing keeps it; an expired lease goes to whoever asks next
+        self.assertTrue(acquire_lease("listener", "replica-a", ttl=-1))
+        self.assertTrue(acquire_lease("listener", "replica-b", ttl=10))
+        self.assertFalse(acquire_lease("listener", "replica-a", ttl=10))
+
+        release_lease("listener", "replica-b")
+        self.assertTrue(acquire_lease("listener", "replica-a", ttl=10))
+        self.assertEqual(ListenerLease.objects.get().holder, "replica-a")
+
+    async def test_standby_takes_over_when_leader_stops(self):
+        events = []
+
+        def elector(holder):
+            async def elected():
+                events.append(("elected", holder))
+
+            async def demoted():
+                events.append(("demoted", holder))
+            return LeaderElector("listener", elected, demoted, ttl=10, holder=holder)
+
+        leader, standby = elector("replica-a"), elector("replica-b")
+        self.assertTrue(await leader.campaign())
+        self.assertFalse(await standby.campaign())
+        await leader.stop()
+        self.assertTrue(await standby.campaign())
+        await asyncio.sleep(0)
+        self.assertEqual(events, [("elected", "replica-a"), ("elected", "replica-b")])
+
+
+def run_replica(holder, rpc_url, results):
+    """A listener replica in its own process: on election, resume from the shared checkpoint"""
+    async def lead():
+        checkpoint = CheckpointStore("Program1111")
+        await checkpoint.load()
+        rpc = SolanaRpcClient(rpc_url)
+        delivered = []
+
+        async def deliver(notification):
+            delivered.append(notification.signature)
+
+        try:
+            await Backfiller(rpc, "Program1111", deliver).run(checkpoint.signature)
+        finally:
+            await rpc.close()
+        results.put((holder, time.time(), delivered))
+
+    async def replica():
+        LeaderElector("failover", lead, ttl=1, interval=0.1, holder=holder).start()
+        await asyncio.sleep(60)
+
+    asyncio.run(replica())
+
+
+class ListenerFailoverTestCase(TransactionTestCase):
+    """Two replica processes sharing the lease and checkpoint tables"""
+
+    def serve_rpc(self, stand_in):
+        """Run the stand-in RPC on a background thread; returns its URL and a stop function"""
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+        state = {}
+
+        async def start():
+            app = web.Application()
+            app.router.add_post("/", stand_in.handle)
+            state["runner"] = runner = web.AppRunner(app)
+            await runner.setup()
+            await web.TCPSite(runner, "127.0.0.1", 0).start()
+            host, port = runner.addresses[0][:2]
+            state["url"] = f"http://{host}:{port}/"
+            started.set()
+
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        asyncio.run_coroutine_threadsafe(start(), loop)
+        started.wait(5)
+
+        def stop():
+            asyncio.run_coroutine_threadsafe(state["runner"].cleanup(), loop).result(5)
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(5)
+        return state["url"], stop
+
+    def share_database(self):
+        """
+        Forked replicas cannot see an in-memory sqlite database, so for this
+        test the connection points at a file holding the tables they use.
+        """
+        if not (connection.vendor == "sqlite" and connection.is_in_memory_db()):
+            return
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        memory_name, memory_connection = connection.settings_dict["NAME"], connection.connection
+
+        def restore():
+            connection.close()
+            connection.settings_dict["NAME"], connection.connection = memory_name, memory_connection
+        self.addCleanup(restore)
+
+        connection.connection = None
+        connection.settings_dict["NAME"] = os.path.join(directory.name, "replicas.sqlite3")
+        with connection.schema_editor() as editor:
+            editor.create_model(ListenerCheckpoint)
+            editor.create_model(ListenerLease)
+
+    def test_standby_process_takes_over_within_the_ttl(self):
+        self.share_database()
+        ListenerCheckpoint.objects.create(program_id="Program1111", slot=10, signature="sig0")
+        url, stop_rpc = self.serve_rpc(StandInRpc([
+            ("sig0", 10, None, ["old"]),
+            ("sig1", 11, None, ["log 1"]),
+            ("sig2", 12, None, ["log 2"]),
+        ]))
+        self.addCleanup(stop_rpc)
+
+        # each process opens its own connection
+        connections.close_all()
+        context = multiprocessing.get_context("fork")
+        results = context.Queue()
+        replicas = [
+            context.Process(target=run_replica, args=(holder, url, results), daemon=True)
+            for holder in ("replica-a", "replica-b")
+        ]
+        for replica in replicas:
+            self.addCleanup(replica.join, 5)
+            self.addCleanup(replica.kill)
+
+        replicas[0].start()
+        self.assertEqual(results.get(timeout=10)[0], "replica-a")
+        replicas[1].start()
+        time.sleep(0.5)
+        self.assertTrue(results.empty())  # warm standby, not writing
+
+        replicas[0].kill()
+        killed_at = time.time()
+        holder, elected_at, delivered = results.get(timeout=10)
+        failover = elected_at - killed_at
+
+        self.assertEqual(holder, "replica-b")
+        self.assertEqual(delivered, ["sig1", "sig2"])
+        # ttl of 1s plus one campaign interval, with room for a slow machine
+        self.assertLess(failover, 2.5)
+
+
+class SignatureFanInTestCase(SimpleTestCase):
+    """Test cases for merging notifications from several endpoints"""
+
+    def test_first_copy_wins(self):
+        """Duplicates are dropped and counted as lag against the endpoint that sent them"""
+        fan_in = SignatureFanIn()
+
+        self.assertTrue(fan_in.arrive("sig1", "fast", now=10.0))
+        self.assertFalse(fan_in.arrive("sig1", "slow", now=10.2))
+        self.assertTrue(fan_in.arrive("sig2", "slow", now=11.0))
+        self.assertFalse(fan_in.arrive("sig2", "fast", now=11.05))
+
+        fast, slow = fan_in.summary()
+        self.assertEqual((fast["url"], fast["first"], fast["received"]), ("fast", 1, 2))
+        self.assertEqual(fast["max_lag_ms"], 50.0)
+        self.assertEqual((slow["url"], slow["first"]), ("slow", 1))
+        self.assertEqual(slow["max_lag_ms"], 200.0)
+
+    def test_window_expires_signatures(self):
+        """A copy arriving after the window is treated as new"""
+        fan_in = SignatureFanIn(window=5.0)
+        fan_in.arrive("sig1", "a", now=0.0)
+        self.assertTrue(fan_in.arrive("sig1", "b", now=6.0))
+
+    def test_concurrent_endpoints(self):
+        """Streams racing on the event loop forward every signature exactly once"""
+        fan_in = SignatureFanIn()
+        forwarded = []
+
+        async def endpoint(url, delay):
+            for i in range(20):
+                await asyncio.sleep(delay)
+                if fan_in.arrive(f"sig{i}", url):
+                    forwarded.append(f"sig{i}")
+
+        async def run():
+            await asyncio.gather(endpoint("a", 0.001), endpoint("b", 0.002), endpoint("c", 0))
+
+        asyncio.run(run())
+
+        self.assertEqual(sorted(forwarded), sorted(f"sig{i}" for i in range(20)))
+        self.assertEqual(sum(stats["received"] for stats in fan_in.summary()), 60)
+
+
+class SubscriptionMapTestCase(SimpleTestCase):
+    """Test cases for routing multiplexed subscriptions to their program"""
+
+    def test_confirmations_line_up_by_request_id(self):
+        """Confirmations arriving out of order still map to the right program"""
+        subscriptions = SubscriptionMap(["PROGRAM_A", "PROGRAM_B"])
+        subscriptions.confirm(8, 220)
+        self.assertFalse(subscriptions.complete())
+        subscriptions.confirm(7, 110)
+
+        self.assertTrue(subscriptions.complete())
+        self.assertEqual(subscriptions.program_for(110), "PROGRAM_A")
+        self.assertEqual(subscriptions.program_for(220), "PROGRAM_B")
+        self.assertIsNone(subscriptions.program_for(330))
+
+    def test_single_program_needs_no_confirmation(self):
+        self.assertEqual(SubscriptionMap(["PROGRAM_A"]).program_for(None), "PROGRAM_A")
+
+
+class NotificationQueueTestCase(SimpleTestCase):
+    """Test cases for the buffer between the websocket readers and processing"""
+
+    def notes(self, count, received_at=100.0):
+        return [LogNotification(f"SIG{i}", i, [f"log {i}"], received_at=received_at + i) for i in range(count)]
+
+    async def drain(self, queue):
+        signatures = []
+        while queue.depth():
+            signatures.append((await queue.get()).signature)
+            await queue.task_done()
+        return signatures
+
+    async def test_spill_keeps_arrival_order(self):
+        """Overflow goes to disk and comes back after what was in memory"""
+        with tempfile.TemporaryDirectory() as directory:
+            queue = NotificationQueue(max_size=2, policy="spill", spill_path=os.path.join(directory, "spill.bin"))
+            for note in self.notes(4):
+                await queue.put(note)
+            self.assertEqual((queue.depth(), queue.spilled), (4, 2))
+            self.assertEqual(queue.oldest_age(now=110.0), 10.0)
+
+            self.assertEqual(await self.drain(queue), ["SIG0", "SIG1", "SIG2", "SIG3"])
+            # the spill is reused once read to the end
+            for note in self.notes(3):
+                await queue.put(note)
+            self.assertEqual(await self.drain(queue), ["SIG0", "SIG1", "SIG2"])
+            await queue.join()
+            queue.close()
+
+    async def test_drop_discards_overflow(self):
+        """Notifications beyond max_size are counted and discarded"""
+        queue = NotificationQueue(max_size=2, policy="drop")
+        for note in self.notes(3):
+            await queue.put(note)
+        self.assertEqual(queue.stats()["dropped"], 1)
+        self.assertEqual(await self.drain(queue), ["SIG0", "SIG1"])
+
+    async def test_block_waits_for_room(self):
+        """A full queue holds the reader until the consumer catches up"""
+        queue = NotificationQueue(max_size=1, policy="block")
+        first, second = self.notes(2)
+        await queue.put(first)
+        reader = asyncio.create_task(queue.put(second))
+        await asyncio.sleep(0.01)
+        self.assertFalse(reader.done())
+
+        self.assertEqual((await queue.get()).signature, "SIG0")
+        await asyncio.wait_for(reader, timeout=1)
+        self.assertEqual((queue.depth(), queue.blocked), (1, 1))
+
+
+class SolanaEventListenerTestCase(SimpleTestCase):
+    """Test cases for the websocket listener, against a FakeWebsocket"""
+
+    OTHER_PROGRAM = "TokenkegQfeZyiNwAJbNbGKPFXCWuBvf9Ss623VQ5DA"
+
+    def setUp(self):
+        self.listeners = listeners_module()
+
+    async def run_listener(self, listener, websockets, until):
+        """Read the websockets, one per connect, until `until()` holds, then stop the listener"""
+        with mock.patch.object(self.listeners, 'connect', mock.AsyncMock(side_effect=websockets)):
+            reader = asyncio.create_task(listener.listen())
+            await wait_until(until)
+            await listener.stop()
+            await reader
+
+    def two_programs(self):
+        """Subscription confirmations for PROGRAM (id 100) and OTHER_PROGRAM (id 200), out of order"""
+        return [{"jsonrpc": "2.0", "id": 2, "result": 200}, {"jsonrpc": "2.0", "id": 1, "result": 100}]
+
+    async def test_spilled_notifications_keep_their_program(self):
+        """Records spilled to disk come back routed to their own program and checkpoint"""
+        handled, gate = [], asyncio.Event()
+
+        async def callback(notification):
+            await gate.wait()
+            handled.append((notification.signature, notification.program_id))
+
+        checkpoints = {PROGRAM: CheckpointStore(PROGRAM), self.OTHER_PROGRAM: CheckpointStore(self.OTHER_PROGRAM)}
+        websocket = FakeWebsocket(self.two_programs() + [
+            log_note(slot, f"sig{slot}", subscription=100 if slot % 2 else 200) for slot in range(1, 7)
+        ])
+        with tempfile.TemporaryDirectory() as directory:
+            queue = NotificationQueue(max_size=1, policy="spill", spill_path=os.path.join(directory, "spill.bin"))
+            listener = self.listeners.SolanaEventListener(
+                "ws://node", [PROGRAM, self.OTHER_PROGRAM], callback,
+                checkpoint=checkpoints, queue=queue, heartbeat_interval=None,
+            )
+
+            def spilled():
+                if queue.received == 6:
+                    gate.set()
+                return len(handled) == 6
+
+            await self.run_listener(listener, [websocket], spilled)
+
+        self.assertGreaterEqual(queue.spilled, 4)
+        self.assertEqual(handled, [
+            (f"sig{slot}", PROGRAM if slot % 2 else self.OTHER_PROGRAM) for slot in range(1, 7)
+        ])
+        self.assertEqual((checkpoints[PROGRAM].slot, checkpoints[self.OTHER_PROGRAM].slot), (5, 6))
+
+    async def test_subscriptions_route_to_their_program(self):
+        """Notifications go to the program of their subscription; a transaction of both is delivered to each"""
+        handled = []
+
+        async def callback(notification):
+            handled.append((notification.signature, notification.program_id))
+
+        websocket = FakeWebsocket(self.two_programs() + [
+            log_note(1, "sigA", subscription=100),
+            log_note(2, "sigB", subscription=200),
+            log_note(3, "sigAB", subscription=100),
+            log_note(3, "sigAB", subscription=200),
+            log_note(3, "sigAB", subscription=200),
+        ])
+        listener = self.listeners.SolanaEventListener(
+            "ws://node", [PROGRAM, self.OTHER_PROGRAM], callback, heartbeat_interval=None,
+        )
+        await self.run_listener(listener, [websocket], lambda: len(handled) == 4)
+
+        self.assertEqual(handled, [
+            ("sigA", PROGRAM), ("sigB", self.OTHER_PROGRAM), ("sigAB", PROGRAM), ("sigAB", self.OTHER_PROGRAM),
+        ])
+        self.assertEqual(len(websocket.subscribed), 2)
+
+    async def test_stale_connection_is_replaced_before_it_is_closed(self):
+        """The watchdog subscribes on a fresh socket before closing the idle one, without a backfill"""
+        handled, log = [], []
+
+        async def callback(notification):
+            handled.append(notification.signature)
+
+        stale = FakeWebsocket([log_note(1, "sig1")], log=log)
+        fresh = FakeWebsocket([log_note(2, "sig2")], log=log)
+        checkpoint = CheckpointStore(PROGRAM)
+        checkpoint.slot, checkpoint.signature = 0, "sig0"
+        rpc = mock.Mock(get_signatures_for_address=mock.AsyncMock(return_value=[]), close=mock.AsyncMock())
+        listener = self.listeners.SolanaEventListener(
+            "ws://node", PROGRAM, callback, rpc_client=rpc, checkpoint=checkpoint,
+            heartbeat_interval=0.01, idle_timeout=0.05,
+        )
+        await self.run_listener(listener, [stale, fresh, FakeWebsocket(log=log)], lambda: len(handled) == 2)
+
+        self.assertEqual(handled, ["sig1", "sig2"])
+        self.assertEqual(log[:3], [("subscribe", stale), ("subscribe", fresh), ("close", stale)])
+        self.assertEqual(listener.fan_in.endpoint("ws://node").connects, 2)
+        # only the first connect backfilled
+        self.assertEqual(rpc.get_signatures_for_address.await_count, 1)
+
+    async def test_full_inbox_blocks_the_reader(self):
+        """Under the block policy the socket waits and nothing is lost"""
+        handled, gate = [], asyncio.Event()
+
+        async def callback(notification):
+            await gate.wait()
+            handled.append(notification.signature)
+
+        queue = NotificationQueue(max_size=1, policy="block")
+        websocket = FakeWebsocket([log_note(slot, f"sig{slot}") for slot in range(1, 6)])
+        listener = self.listeners.SolanaEventListener("ws://node", PROGRAM, callback, queue=queue, heartbeat_interval=None)
+
+        def drained():
+            if queue.blocked and not gate.is_set():
+                # the reader is stuck on a full inbox with the rest of the socket unread
+                self.assertLess(queue.received, 5)
+                gate.set()
+            return len(handled) == 5
+
+        await self.run_listener(listener, [websocket], drained)
+        self.assertEqual(handled, [f"sig{slot}" for slot in range(1, 6)])
+        self.assertEqual(queue.dropped, 0)
+
+    async def test_full_inbox_drops_overflow(self):
+        """Under the drop policy the socket keeps being read and the overflow is counted"""
+        handled, gate = [], asyncio.Event()
+
+        async def callback(notification):
+            await gate.wait()
+            handled.append(notification.signature)
+
+        queue = NotificationQueue(max_size=1, policy="drop")
+        websocket = FakeWebsocket([log_note(slot, f"sig{slot}") for slot in range(1, 6)])
+        listener = self.listeners.SolanaEventListener("ws://node", PROGRAM, callback, queue=queue, heartbeat_interval=None)
+
+        def read_everything():
+            if queue.received == 5:
+                gate.set()
+            return gate.is_set() and queue.depth() == 0 and len(handled) + queue.dropped == 5
+
+        with self.assertLogs("systems.utils.inbox", "ERROR"):
+            await self.run_listener(listener, [websocket], read_everything)
+        self.assertGreaterEqual(queue.dropped, 3)
+        self.assertEqual(handled, sorted(handled))
+
+
+class ListenerMetricsTestCase(SimpleTestCase):
+    """Test cases for the listener's Prometheus metrics"""
+
+    def test_writes_feed_latency_and_slot_lag(self):
+        """Committed events update the write and end-to-end histograms and the slot lag"""
+        metrics = ListenerMetrics()
+        metrics.head_slot.set(120)
+        started = time.perf_counter()
+        metrics.record_write("TokenTransferEvent", started, [
+            {"slot": 100, "received_at": time.time() - 0.2},
+            {"slot": 90, "received_at": time.time() - 0.3},
+            {"slot": 150, "provisional": True},
+        ])
+        metrics.events.inc(event_type="TokenTransferEvent")
+        metrics.events.inc(event_type='Odd "name"')
+
+        self.assertEqual(metrics.slot_lag(), 20)
+        self.assertEqual(metrics.end_to_end_seconds.count(kind="TokenTransferEvent"), 2)
+        text = metrics.registry.render()
+        self.assertIn('solana_listener_events_total{event_type="TokenTransferEvent"} 1', text)
+        self.assertIn('solana_listener_events_total{event_type="Odd \\"name\\""} 1', text)
+        self.assertIn('solana_listener_end_to_end_seconds_bucket{kind="TokenTransferEvent",le="0.25"} 1', text)
+        self.assertIn('solana_listener_end_to_end_seconds_bucket{kind="TokenTransferEvent",le="+Inf"} 2', text)
+        self.assertIn("solana_listener_slot_lag 20", text)
+
+    def test_reconnects_by_kind(self):
+        """Watchdog swaps and full reconnects are separate series"""
+        metrics = ListenerMetrics()
+        metrics.stale_connections.inc(endpoint="wss://a", reason="ping")
+        metrics.reconnect_seconds.observe(0.004, endpoint="wss://a", kind="replace")
+        metrics.reconnect_seconds.observe(3.2, endpoint="wss://a", kind="reconnect")
+
+        text = metrics.registry.render()
+        self.assertIn('solana_listener_stale_connections_total{endpoint="wss://a",reason="ping"} 1', text)
+        self.assertIn('solana_listener_reconnect_seconds_bucket{endpoint="wss://a",kind="replace",le="0.005"} 1', text)
+        self.assertIn('solana_listener_reconnect_seconds_bucket{endpoint="wss://a",kind="reconnect",le="2.5"} 0', text)
+
+    async def test_endpoint_serves_queue_gauges(self):
+        """The HTTP endpoint renders gauges computed at scrape time"""
+        metrics = ListenerMetrics()
+        queue = NotificationQueue(max_size=5)
+        metrics.watch_inbox(queue)
+        await queue.put(LogNotification("SIG1", 1, []))
+
+        server = MetricsServer(metrics.registry)
+        client = TestClient(TestServer(web.Application()))
+        client.server.app.router.add_get("/metrics", server.metrics)
+        async with client:
+            response = await client.get("/metrics")
+            text = await response.text()
+        self.assertTrue(response.headers["Content-Type"].startswith("text/plain; version=0.0.4"))
+        self.assertIn("solana_listener_inbox_depth 1", text)
+        # no head slot yet, so no lag sample
+        self.assertNotIn("\nsolana_listener_slot_lag ", text)
+
+    async def test_port_in_use_is_reported(self):
+        """A second server on a taken port fails with the address in the message"""
+        first = MetricsServer(ListenerMetrics().registry, port=0)
+        await first.start()
+        try:
+            port = first.runner.addresses[0][1]
+            second = MetricsServer(ListenerMetrics().registry, port=port)
+            with self.assertRaisesMessage(OSError, f"Cannot serve metrics on 127.0.0.1:{port}"):
+                await second.start()
+            self.assertIsNone(second.runner)
+        finally:
+            await first.stop()
+
+
+class MetadataEnrichmentTestCase(SimpleTestCase):
+    """Test cases for background IPFS metadata enrichment"""
+    IPFS_HASH = "QmYwAPJzv5CZsnA625s3Xf2nemtYgPpHdWEz79ojWnPbdG"
+
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+        self.requests = []
+        cache.clear()
+
+    async def gateway_app(self):
+        async def slow(request):
+            self.requests.append("slow")
+            await asyncio.sleep(5)
+            return web.json_response({"description": "too late"})
+
+        async def missing(request):
+            self.requests.append("missing")
+            return web.Response(status=404)
+
+        async def fast(request):
+            self.requests.append("fast")
+            return web.json_response({
+                "image": "https://example.com/coin.png",
+                "description": "A coin",
+                "attributes": {"website": "https://example.com"},
+            })
+
+        app = web.Application()
+        app.router.add_get("/slow/{hash}", slow)
+        app.router.add_get("/missing/{hash}", missing)
+        app.router.add_get("/fast/{hash}", fast)
+        return app
+
+    async def fetch_twice(self):
+        async with TestServer(await self.gateway_app()) as server:
+            base = str(server.make_url("/"))
+            fetcher = MetadataFetcher(
+                gateways=[f"{base}slow/", f"{base}missing/", f"{base}fast/"],
+                cache=MetadataCache(self.cache_dir.name),
+            )
+            try:
+                start = time.monotonic()
+                first = await fetcher.fetch(self.IPFS_HASH)
+                elapsed = time.monotonic() - start
+                requests_made = len(self.requests)
+                second = await fetcher.fetch(self.IPFS_HASH)
+            finally:
+                await fetcher.close()
+        return first, second, elapsed, requests_made
+
+    def test_first_gateway_to_answer_wins(self):
+        """Gateways are raced and the result is cached on disk"""
+        first, second, elapsed, requests_made = asyncio.run(self.fetch_twice())
+
+        self.assertEqual(first["description"], "A coin")
+        self.assertLess(elapsed, 2)
+        self.assertEqual(requests_made, 3)
+        self.assertEqual(second, first)
+        self.assertEqual(len(self.requests), 3)
+        self.assertEqual(MetadataCache(self.cache_dir.name).read_disk(self.IPFS_HASH), first)
+
+    def test_enricher_reports_metadata(self):
+        """Submitted coins get their metadata delivered in the background"""
+        MetadataCache(self.cache_dir.name).write_disk(self.IPFS_HASH, {"image": "https://example.com/a.png"})
+        delivered = []
+
+        async def on_metadata(mint_address, metadata):
+            delivered.append((mint_address, metadata_fields(metadata)))
+
+        async def run():
+            enricher = MetadataEnricher(
+                MetadataFetcher(gateways=["http://127.0.0.1:9/"], cache=MetadataCache(self.cache_dir.name)),
+                on_metadata,
+            )
+            await enricher.start()
+            enricher.submit("MINT", f"https://ipfs.io/ipfs/{self.IPFS_HASH}")
+            await enricher.stop()
+
+        asyncio.run(run())
+
+        self.assertEqual(delivered, [("MINT", {"image_url": "https://example.com/a.png"})])
+
+
+class FakeNotificationSource:
+    """Scripted processed/confirmed trade notifications, fed straight into ingestion"""
+
+    def __init__(self, script):
+        self.script = script
+
+    def feed(self):
+        for commitment, signature, event in self.script:
+            if commitment == "processed":
+                event = {**event, "provisional": True}
+            ingest_trades([(signature, event)])
+
+class ProvisionalTradeTestCase(TestCase):
+    """Test cases for processed-commitment trades and their reconciliation"""
+
+    def setUp(self):
+        self.creator = SolanaUser.objects.create_user(wallet_address="1234567890123456789012345678901234567890123")
+        self.trader = SolanaUser.objects.create_user(wallet_address="2234567890123456789012345678901234567890123")
+        self.coin = Coin.objects.create(
+            address="COIN123456789012345678901234567890123456789",
+            name="Test Coin",
+            creator=self.creator,
+            total_supply=Decimal('1000000'),
+            image_url="https://example.com/image.png",
+            ticker="TEST",
+        )
+
+    def buy(self, coin_amount):
+        return {
+            "transfer_type": 0,
+            "mint_address": self.coin.address,
+            "user": self.trader.wallet_address,
+            "sol_amount": 1_000_000_000,
+            "coin_amount": coin_amount,
+        }
+
+    def held(self):
+        holding = UserCoinHoldings.objects.filter(user=self.trader, coin=self.coin).first()
+        return holding.amount_held if holding else Decimal('0')
+
+    def test_processed_then_confirmed(self):
+        """A provisional trade counts immediately and is promoted, not re-applied, on confirmation"""
+        FakeNotificationSource([("processed", "SIG1", self.buy(2_000_000_000))]).feed()
+        self.assertTrue(Trade.objects.get(pk="SIG1").provisional)
+        self.assertEqual(self.held(), Decimal('2'))
+
+        FakeNotificationSource([("confirmed", "SIG1", self.buy(2_000_000_000))]).feed()
+        self.assertFalse(Trade.objects.get(pk="SIG1").provisional)
+        self.assertEqual(self.held(), Decimal('2'))
+
+    def test_confirmed_copy_in_same_batch_wins(self):
+        """Both copies in one batch store a confirmed trade"""
+        ingest_trades([
+            ("SIG1", {**self.buy(1_000_000_000), "provisional": True}),
+            ("SIG1", self.buy(1_000_000_000)),
+        ])
+        self.assertFalse(Trade.objects.get(pk="SIG1").provisional)
+
+    def test_unconfirmed_trade_is_rolled_back(self):
+        """Provisional trades past the timeout are deleted and their holdings reversed"""
+        FakeNotificationSource([
+            ("processed", "SIG1", self.buy(2_000_000_000)),
+            ("confirmed", "SIG1", self.buy(2_000_000_000)),
+            ("processed", "SIG2", self.buy(3_000_000_000)),
+        ]).feed()
+        self.assertEqual(self.held(), Decimal('5'))
+
+        self.assertEqual(expired_provisional(timedelta(seconds=60)), {})
+        expired = expired_provisional(timedelta(seconds=-1))
+        self.assertEqual(expired, {self.coin.address: ["SIG2"]})
+
+        self.assertEqual(rollback_provisional(["SIG1", "SIG2"]), ["SIG2"])
+        self.assertFalse(Trade.objects.filter(pk="SIG2").exists())
+        self.assertEqual(self.held(), Decimal('2'))
+        # a second scan finds nothing left to undo
+        self.assertEqual(rollback_provisional(["SIG2"]), [])
+
+    def test_reconciler_routes_rollbacks_per_coin(self):
+        """Expired trades are queued as one ProvisionalExpired event per coin"""
+        submitted = []
+
+        async def submit(event_type, signature, event):
+            submitted.append((event_type, event))
+
+        async def find_expired(older_than):
+            return {"COIN_A": ["SIG1", "SIG2"], "COIN_B": ["SIG3"]}
+
+        reconciler = ProvisionalReconciler(submit, timeout=30, find_expired=find_expired)
+        self.assertEqual(asyncio.run(reconciler.scan()), 3)
+        self.assertEqual(submitted, [
+            ("ProvisionalExpired", {"mint_address": "COIN_A", "signatures": ["SIG1", "SIG2"]}),
+            ("ProvisionalExpired", {"mint_address": "COIN_B", "signatures": ["SIG3"]}),
+        ])
@@ -0,0 +1,143 @@
+import asyncio
+import gzip
+import json
+import logging
+import struct
+import time
+
+from systems.utils.notifications import LogNotification
+
+logger = logging.getLogger(__name__)
+
+# Every record is a u32 length followed by the record body:
+#   slot (u64), received_at (f64), flags (u8), then length-prefixed utf8
+#   strings: signature, error (json, empty when none), program id (from
+#   version 1, empty when unknown), then the block time (f64, from version 2,
+#   0 when unknown) and each log line, preceded by the number of log lines (u32).
+# The lowest bit of flags is set for failed transactions, the others hold the
+# record version. Version 0 records, written before the program was stored,
+# only ever had 0 or 1 there.
+RECORD_LENGTH = struct.Struct("<I")
+RECORD_HEADER = struct.Struct("<QdB")
+STRING_LENGTH = struct.Struct("<I")
+BLOCK_TIME = struct.Struct("<d")
+RECORD_VERSION = 2
+
+def open_archive(path: str, mode: str):
+    """Archives ending in .gz are gzip-compressed; appending adds a new gzip member"""
+    if str(path).endswith(".gz"):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+def encode_notification(notification: LogNotification) -> bytes:
+    flags = RECORD_VERSION << 1 | (notification.err is not None)
+    parts = [RECORD_HEADER.pack(notification.slot or 0, notification.received_at, flags)]
+    strings = [
+        notification.signature or "",
+        json.dumps(notification.err, default=str) if notification.err is not None else "",
+        notification.program_id or "",
+    ]
+    for value in strings:
+        encoded = value.encode()
+        parts.append(STRING_LENGTH.pack(len(encoded)) + encoded)
+    parts.append(BLOCK_TIME.pack(notification.block_time or 0))
+    parts.append(STRING_LENGTH.pack(len(notification.logs)))
+    for log in notification.logs:
+        encoded = log.encode()
+        parts.append(STRING_LENGTH.pack(len(encoded)) + encoded)
+    body = b"".join(parts)
+    return RECORD_LENGTH.pack(len(body)) + body
+
+def decode_notification(body: bytes) -> LogNotification:
+    slot, received_at, flags = RECORD_HEADER.unpack_from(body, 0)
+    failed, version = flags & 1, flags >> 1
+    offset = RECORD_HEADER.size
+
+    def read_string():
+        nonlocal offset
+        (length,) = STRING_LENGTH.unpack_from(body, offset)
+        offset += STRING_LENGTH.size
+        value = body[offset:offset + length].decode()
+        offset += length
+        return value
+
+    signature = read_string()
+    err = read_string()
+    program_id = read_string() if version >= 1 else ""
+    block_time = 0
+    if version >= 2:
+        (block_time,) = BLOCK_TIME.unpack_from(body, offset)
+        offset += BLOCK_TIME.size
+    (count,) = STRING_LENGTH.unpack_from(body, offset)
+    offset += STRING_LENGTH.size
+    logs = [read_string() for _ in range(count)]
+    return LogNotification(
+        signature, slot, logs,
+        err=json.loads(err) if failed else None,
+        received_at=received_at,
+        program_id=program_id or None,
+        block_time=block_time or None,
+    )
+
+class ArchiveWriter:
+    """Appends every notification the listener receives to a raw event archive"""
+    def __init__(self, path: str, flush_every: int = 100):
+        self.path = path
+        self.flush_every = flush_every
+        self.file = open_archive(path, "ab")
+        self.written = 0
+
+    def write(self, notification: LogNotification):
+        self.file.write(encode_notification(notification))
+        self.written += 1
+        if self.written % self.flush_every == 0:
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+def read_archive(path: str):
+    """Yield the archived notifications in the order they were received"""
+    with open_archive(path, "rb") as f:
+        while True:
+            header = f.read(RECORD_LENGTH.size)
+            if len(header) < RECORD_LENGTH.size:
+                return
+            (length,) = RECORD_LENGTH.unpack(header)
+            body = f.read(length)
+            if len(body) < length:
+                logger.warning(f"Truncated record at the end of {path}")
+                return
+            yield decode_notification(body)
+
+def parse_speed(speed: str) -> float | None:
+    """'max' -> None (no pacing), 'realtime' -> 1.0, '10x' -> 10.0"""
+    if speed == "max":
+        return None
+    if speed == "realtime":
+        return 1.0
+    if speed.endswith("x"):
+        factor = float(speed[:-1])
+        if factor > 0:
+            return factor
+    raise ValueError(f"Invalid replay speed: {speed} (use max, realtime or Nx)")
+
+async def replay_archive(path: str, callback, speed: str = "max") -> int:
+    """
+    Feed an archive through `callback` as if the notifications had just arrived.
+    Returns the number of notifications replayed.
+    """
+    factor = parse_speed(speed)
+    first_received = started = None
+    count = 0
+    for notification in read_archive(path):
+        if factor is not None:
+            if first_received is None:
+                first_received, started = notification.received_at, time.monotonic()
+            due = started + (notification.received_at - first_received) / factor
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await callback(notification)
+        count += 1
+    return count
@@ -0,0 +1,222 @@
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+
+import aiohttp
+from asgiref.sync import sync_to_async
+
+from systems.utils.notifications import LogNotification
+
+logger = logging.getLogger(__name__)
+
+def http_url_for(ws_url: str) -> str:
+    """wss://api.devnet.solana.com -> https://api.devnet.solana.com"""
+    if ws_url.startswith("wss://"):
+        return "https://" + ws_url[len("wss://"):]
+    if ws_url.startswith("ws://"):
+        return "http://" + ws_url[len("ws://"):]
+    return ws_url
+
+class RpcError(Exception):
+    pass
+
+class SolanaRpcClient:
+    """Minimal JSON-RPC client for the calls backfilling and monitoring need"""
+    def __init__(self, url: str, timeout: float = 30):
+        self.url = url
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.session = None
+        self.ids = itertools.count(1)
+
+    async def call(self, method: str, params: list):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(timeout=self.timeout)
+        payload = {"jsonrpc": "2.0", "id": next(self.ids), "method": method, "params": params}
+        async with self.session.post(self.url, json=payload) as response:
+            response.raise_for_status()
+            body = await response.json()
+        if body.get("error"):
+            raise RpcError(f"{method} failed: {body['error']}")
+        return body.get("result")
+
+    async def get_signatures_for_address(self, address: str, before=None, until=None,
+                                         limit=1000, commitment="confirmed") -> list:
+        """Newest first, like the RPC method itself"""
+        config = {"limit": limit, "commitment": commitment}
+        if before:
+            config["before"] = before
+        if until:
+            config["until"] = until
+        return await self.call("getSignaturesForAddress", [address, config]) or []
+
+    async def get_transaction(self, signature: str, commitment="confirmed"):
+        config = {"encoding": "json", "commitment": commitment, "maxSupportedTransactionVersion": 0}
+        return await self.call("getTransaction", [signature, config])
+
+    async def get_slot(self, commitment="confirmed") -> int:
+        return await self.call("getSlot", [{"commitment": commitment}])
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+class Delivery:
+    """
+    A notification handed off to the event handlers. It is done once every
+    hold on it is released: the hand-off itself, and each decoded event until
+    a worker has committed or dead-lettered it.
+    """
+    __slots__ = ("checkpoint", "slot", "signature", "holds")
+
+    def __init__(self, checkpoint, slot, signature):
+        self.checkpoint = checkpoint
+        self.slot = slot
+        self.signature = signature
+        self.holds = 1
+
+    def hold(self):
+        self.holds += 1
+
+    def release(self):
+        self.holds -= 1
+        if self.holds == 0:
+            self.checkpoint.settle()
+
+class CheckpointStore:
+    """
+    Keeps the (slot, signature) of a program in the DB up to which everything
+    handed off has been committed.
+
+    Notifications are tracked in hand-off order and the checkpoint only moves
+    past one once it and every notification before it are done, so it never
+    covers events still waiting on a worker queue or in a trade batch. Advancing
+    is in-memory; the row is written at most every `interval` seconds and on
+    save(), so the hot path never waits on the database.
+    """
+    def __init__(self, program_id: str, interval: float = 5.0):
+        self.program_id = str(program_id)
+        self.interval = interval
+        self.slot = None
+        self.signature = None
+        self.dirty = False
+        self.saved_at = time.monotonic()
+        self.in_flight = deque()
+
+    def load_sync(self):
+        from systems.models import ListenerCheckpoint
+        row = ListenerCheckpoint.objects.filter(program_id=self.program_id).first()
+        if row:
+            self.slot, self.signature = row.slot, row.signature
+        return row
+
+    def save_sync(self):
+        if not self.dirty:
+            return
+        from systems.models import ListenerCheckpoint
+        ListenerCheckpoint.objects.update_or_create(
+            program_id=self.program_id,
+            defaults={"slot": self.slot, "signature": self.signature},
+        )
+        self.dirty = False
+
+    async def load(self):
+        return await sync_to_async(self.load_sync)()
+
+    async def save(self):
+        await sync_to_async(self.save_sync)()
+        self.saved_at = time.monotonic()
+
+    def advance(self, slot, signature):
+        if slot is None or (self.slot is not None and slot < self.slot):
+            return
+        self.slot, self.signature, self.dirty = slot, signature, True
+
+    def track(self, slot, signature) -> Delivery:
+        """Start tracking a handed-off notification; release() it once handed off"""
+        delivery = Delivery(self, slot, signature)
+        self.in_flight.append(delivery)
+        return delivery
+
+    def settle(self):
+        """Advance past the oldest deliveries that are done"""
+        while self.in_flight and self.in_flight[0].holds == 0:
+            delivery = self.in_flight.popleft()
+            self.advance(delivery.slot, delivery.signature)
+
+    def forget(self):
+        """Another replica owns the checkpoint now; drop what is in flight and unsaved"""
+        self.in_flight.clear()
+        self.dirty = False
+
+    async def maybe_save(self):
+        if self.dirty and time.monotonic() - self.saved_at >= self.interval:
+            try:
+                await self.save()
+            except Exception as e:
+                logger.warning(f"Could not save checkpoint: {e}")
+
+class Backfiller:
+    """
+    Fetches every program transaction newer than `until` and hands it to
+    `callback` as a LogNotification, oldest first.
+    """
+    def __init__(self, rpc, program_id: str, callback, concurrency: int = 8,
+                 page_size: int = 1000, commitment: str = "confirmed"):
+        self.rpc = rpc
+        self.program_id = str(program_id)
+        self.callback = callback
+        self.concurrency = concurrency
+        self.page_size = page_size
+        # getTransaction does not accept processed
+        self.commitment = "confirmed" if commitment == "processed" else commitment
+
+    async def missing_signatures(self, until: str) -> list:
+        """Page back from the newest signature until the checkpoint, return oldest first"""
+        signatures = []
+        before = None
+        while True:
+            page = await self.rpc.get_signatures_for_address(
+                self.program_id, before=before, until=until,
+                limit=self.page_size, commitment=self.commitment,
+            )
+            signatures.extend(page)
+            if len(page) < self.page_size:
+                break
+            before = page[-1]["signature"]
+        signatures.reverse()
+        return [info for info in signatures if info.get("err") is None]
+
+    async def fetch(self, semaphore, info: dict):
+        async with semaphore:
+            tx = await self.rpc.get_transaction(info["signature"], commitment=self.commitment)
+        if not tx:
+            logger.warning(f"Transaction {info['signature']} not available for backfill")
+            return None
+        meta = tx.get("meta") or {}
+        return LogNotification(
+            info["signature"], tx.get("slot", info.get("slot")),
+            meta.get("logMessages") or [], meta.get("err"), program_id=self.program_id,
+            block_time=tx.get("blockTime"),
+        )
+
+    async def run(self, until: str) -> int:
+        """Returns the number of notifications delivered"""
+        missing = await self.missing_signatures(until)
+        if not missing:
+            return 0
+        logger.info(f"Backfilling {len(missing)} transactions since {until}")
+        semaphore = asyncio.Semaphore(self.concurrency)
+        delivered = 0
+        # fetch a window at a time so ordering holds without buffering the whole gap
+        window = self.concurrency * 4
+        for start in range(0, len(missing), window):
+            chunk = missing[start:start + window]
+            notifications = await asyncio.gather(*(self.fetch(semaphore, info) for info in chunk))
+            for notification in notifications:
+                if notification is not None:
+                    await self.callback(notification)
+                    delivered += 1
+        return delivered
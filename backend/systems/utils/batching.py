@@ -0,0 +1,48 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class TradeBatcher:
+    """
+    Collects decoded trade events and hands them to `flush_callback` in batches,
+    either once `max_size` events are pending or `max_wait` seconds after the
+    first event of the batch arrived, whichever comes first.
+    """
+    def __init__(self, flush_callback, max_size=100, max_wait=0.25):
+        self.flush_callback = flush_callback
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self._pending = []
+        self._timer = None
+        self._lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self._pending)
+
+    async def add(self, signature: str, event: dict):
+        self._pending.append((signature, event))
+        if len(self._pending) >= self.max_size:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def flush(self):
+        """Write out everything that is pending; flushes never overlap"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        async with self._lock:
+            batch, self._pending = self._pending, []
+            if not batch:
+                return
+            try:
+                await self.flush_callback(batch)
+            except Exception as e:
+                logger.error(f"Failed to flush {len(batch)} trades: {e}")
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.max_wait)
+        self._timer = None  # past the sleep, a concurrent flush must not cancel us
+        await self.flush()
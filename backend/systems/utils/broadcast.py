@@ -12,8 +12,8 @@ def _broadcast(info: dict, group: str = "events"):
         }
     )
 
-def broadcast_coin_created(instance: Coin):
-    coin_info = {
+def _coin_info(instance: Coin) -> dict:
+    return {
         "address": instance.address,
         "name": instance.name,
         "ticker": instance.ticker,
@@ -26,7 +26,13 @@ def broadcast_coin_created(instance: Coin):
         "website": instance.website,
         "twitter": instance.twitter,
     }
-    _broadcast(coin_info)
+
+def broadcast_coin_created(instance: Coin):
+    _broadcast(_coin_info(instance))
+
+def broadcast_coin_updated(instance: Coin):
+    """Sent when a coin's metadata arrives after the coin was created"""
+    _broadcast({**_coin_info(instance), "updated": True})
 
 def broadcast_trade_created(instance: Trade):
     trade_info = {
@@ -36,5 +42,11 @@ def broadcast_trade_created(instance: Trade):
         "trade_type": instance.trade_type,
         "coin_amount": str(instance.coin_amount),
         "sol_amount": str(instance.sol_amount),
+        "provisional": instance.provisional,
     }
-    _broadcast(trade_info)   
+    _broadcast(trade_info)
+
+def broadcast_trade_status(transaction_hashes: list, status: str):
+    """Provisional trades were confirmed or rolled back"""
+    for transaction_hash in transaction_hashes:
+        _broadcast({"transaction_hash": transaction_hash, "status": status})   
@@ -0,0 +1,133 @@
+import operator
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from functools import reduce
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from systems.models import PriceCandle, Trade
+
+# interval -> bucket width in seconds
+INTERVAL_SECONDS = {"1m": 60, "5m": 300, "1h": 3600, "1d": 86400}
+CANDLE_TRADE_TYPES = ("BUY", "SELL")
+UPSERT_CHUNK = 100
+
+def bucket_start(moment: datetime, interval: str) -> datetime:
+    """Start of the `interval` bucket containing `moment`, aligned to the Unix epoch (UTC)"""
+    seconds = INTERVAL_SECONDS[interval]
+    timestamp = int(moment.timestamp())
+    return datetime.fromtimestamp(timestamp - timestamp % seconds, tz=dt_timezone.utc)
+
+def trade_price(sol_amount: Decimal, coin_amount: Decimal):
+    if not coin_amount:
+        return None
+    return Decimal(sol_amount) / Decimal(coin_amount)
+
+def aggregate_candles(trades) -> dict:
+    """
+    Fold (coin_id, executed_at, sol_amount, coin_amount) tuples, oldest first,
+    into {(coin_id, interval, bucket_start): [open, high, low, close, volume, trade_count, opened_at, closed_at]}
+    for every interval.
+    """
+    candles = {}
+    for coin_id, executed_at, sol_amount, coin_amount in trades:
+        price = trade_price(sol_amount, coin_amount)
+        if price is None:
+            continue
+        for interval in INTERVAL_SECONDS:
+            key = (coin_id, interval, bucket_start(executed_at, interval))
+            candle = candles.get(key)
+            if candle is None:
+                candles[key] = [price, price, price, price, Decimal(sol_amount), 1, executed_at, executed_at]
+                continue
+            candle[1] = max(candle[1], price)
+            candle[2] = min(candle[2], price)
+            candle[3] = price
+            candle[4] += sol_amount
+            candle[5] += 1
+            candle[7] = executed_at
+    return candles
+
+def upsert_candles(trades: list):
+    """
+    Fold freshly applied trades into the candles of the buckets they were
+    executed in, with one INSERT ... ON CONFLICT DO UPDATE per chunk: new
+    buckets are created, existing ones widen high/low and add volume and
+    trade count. Open and close only move to trades executed before the
+    current open or after the current close, so a trade applied late (a
+    backfill, a retried dead letter) does not reorder its bucket.
+    """
+    candles = aggregate_candles(
+        (trade.coin_id, trade.executed_at, trade.sol_amount, trade.coin_amount)
+        for trade in sorted(trades, key=lambda trade: trade.executed_at)
+        if trade.trade_type in CANDLE_TRADE_TYPES
+    )
+    if not candles:
+        return
+    meta = PriceCandle._meta
+    names = ('coin', 'interval', 'bucket_start', 'open', 'high', 'low', 'close', 'volume', 'trade_count', 'opened_at', 'closed_at')
+    fields = [meta.get_field(name) for name in names]
+    quote = connection.ops.quote_name
+    table = quote(meta.db_table)
+    coin, interval, start, open_, high, low, close, volume, trade_count, opened_at, closed_at = (
+        quote(field.column) for field in fields
+    )
+    row = "(" + ", ".join(["%s"] * len(fields)) + ")"
+
+    items = list(candles.items())
+    with connection.cursor() as cursor:
+        for first in range(0, len(items), UPSERT_CHUNK):
+            chunk = items[first:first + UPSERT_CHUNK]
+            params = [
+                field.get_db_prep_save(value, connection)
+                for key, values in chunk for field, value in zip(fields, key + tuple(values))
+            ]
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(quote(field.column) for field in fields)}) "
+                f"VALUES {', '.join([row] * len(chunk))} "
+                f"ON CONFLICT ({coin}, {interval}, {start}) DO UPDATE SET "
+                f"{open_} = CASE WHEN excluded.{opened_at} < {table}.{opened_at} THEN excluded.{open_} ELSE {table}.{open_} END, "
+                f"{opened_at} = CASE WHEN excluded.{opened_at} < {table}.{opened_at} THEN excluded.{opened_at} ELSE {table}.{opened_at} END, "
+                f"{high} = CASE WHEN excluded.{high} > {table}.{high} THEN excluded.{high} ELSE {table}.{high} END, "
+                f"{low} = CASE WHEN excluded.{low} < {table}.{low} THEN excluded.{low} ELSE {table}.{low} END, "
+                f"{close} = CASE WHEN excluded.{closed_at} >= {table}.{closed_at} THEN excluded.{close} ELSE {table}.{close} END, "
+                f"{closed_at} = CASE WHEN excluded.{closed_at} >= {table}.{closed_at} THEN excluded.{closed_at} ELSE {table}.{closed_at} END, "
+                f"{volume} = {table}.{volume} + excluded.{volume}, "
+                f"{trade_count} = {table}.{trade_count} + excluded.{trade_count}",
+                params,
+            )
+
+def rebuild_candles(coin_id: str, since: datetime | None = None, batch_size: int = 1000) -> int:
+    """
+    Recompute a coin's candles from its trades, every bucket from the one
+    containing `since` onwards (all of them when None). Used by the
+    rebuild_candles command and after provisional trades are rolled back.
+    Returns the number of candles written.
+    """
+    with transaction.atomic():
+        candles = PriceCandle.objects.filter(coin_id=coin_id)
+        trades = Trade.objects.filter(coin_id=coin_id, trade_type__in=CANDLE_TRADE_TYPES)
+        starts = {}
+        if since is not None:
+            starts = {interval: bucket_start(since, interval) for interval in INTERVAL_SECONDS}
+            candles = candles.filter(reduce(operator.or_, (
+                Q(interval=interval, bucket_start__gte=start) for interval, start in starts.items()
+            )))
+            # the widest bucket starts earliest, so its trades cover every interval
+            trades = trades.filter(executed_at__gte=min(starts.values()))
+        candles.delete()
+
+        rows = [
+            PriceCandle(
+                coin_id=key[0], interval=key[1], bucket_start=key[2],
+                open=first, high=high, low=low, close=last, volume=volume, trade_count=count,
+                opened_at=opened_at, closed_at=closed_at,
+            )
+            for key, (first, high, low, last, volume, count, opened_at, closed_at) in aggregate_candles(
+                trades.order_by('executed_at').values_list('coin_id', 'executed_at', 'sol_amount', 'coin_amount').iterator()
+            ).items()
+            if not starts or key[2] >= starts[key[1]]
+        ]
+        PriceCandle.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
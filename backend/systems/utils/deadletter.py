@@ -0,0 +1,117 @@
+import asyncio
+import logging
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.utils import timezone
+
+from systems.models import DeadLetterEvent
+from systems.utils.dispatcher import DEAD_LETTER_ID
+
+logger = logging.getLogger(__name__)
+
+BASE_DELAY = 5
+MAX_DELAY = 3600
+MAX_ATTEMPTS = 8
+
+def retry_delay(attempts: int, base: float = BASE_DELAY, cap: float = MAX_DELAY) -> timedelta:
+    return timedelta(seconds=min(base * 2 ** attempts, cap))
+
+def store_dead_letters(entries: list, reason: str):
+    """
+    Persist (event_type, signature, event) entries the listener gave up on.
+    Events that were themselves retries only get their reason updated; their
+    row already carries the next retry time.
+    """
+    retried = [event[DEAD_LETTER_ID] for _, _, event in entries if DEAD_LETTER_ID in event]
+    if retried:
+        DeadLetterEvent.objects.filter(pk__in=retried).update(reason=reason)
+    next_retry_at = timezone.now() + retry_delay(0)
+    DeadLetterEvent.objects.bulk_create([
+        DeadLetterEvent(
+            event_type=event_type,
+            signature=signature or "",
+            mint_address=event.get("mint_address", ""),
+            slot=event.get("slot"),
+            payload=event,
+            reason=reason,
+            next_retry_at=next_retry_at,
+        )
+        for event_type, signature, event in entries
+        if DEAD_LETTER_ID not in event
+    ])
+
+def resolve_dead_letters(ids: list):
+    """Retried events went through; drop their rows"""
+    DeadLetterEvent.objects.filter(pk__in=ids).delete()
+
+def claim_due_dead_letters(limit: int, max_attempts: int = MAX_ATTEMPTS) -> list:
+    """
+    Pick up to `limit` rows whose retry is due and push their next retry out
+    before handing them back, so a retry that is lost mid-flight comes round
+    again after the backoff rather than straight away. Letters that could not
+    be queued after all are handed to release_dead_letters.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        letters = list(
+            DeadLetterEvent.objects.select_for_update(skip_locked=True)
+            .filter(next_retry_at__lte=now)
+            .order_by('next_retry_at')[:limit]
+        )
+        for letter in letters:
+            letter.due_at = letter.next_retry_at
+            letter.attempts += 1
+            letter.next_retry_at = now + retry_delay(letter.attempts) if letter.attempts < max_attempts else None
+        DeadLetterEvent.objects.bulk_update(letters, ['attempts', 'next_retry_at'])
+    return letters
+
+def release_dead_letters(letters: list):
+    """Undo the claim of letters that were not queued, so the skipped retry does not count as an attempt"""
+    for letter in letters:
+        letter.attempts -= 1
+        letter.next_retry_at = letter.due_at
+    DeadLetterEvent.objects.bulk_update(letters, ['attempts', 'next_retry_at'])
+
+class DeadLetterRetrier:
+    """
+    Background task that feeds due dead letters back through the dispatcher.
+    At most `concurrency` events are claimed per sweep, and they are only
+    queued if the coin's queue has room, so live events never wait on retries.
+    """
+    def __init__(self, dispatcher, concurrency: int = 4, interval: float = 5, max_attempts: int = MAX_ATTEMPTS):
+        self.dispatcher = dispatcher
+        self.concurrency = concurrency
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.task = None
+
+    async def drain(self) -> int:
+        """Queue the due dead letters; returns how many were queued"""
+        letters = await sync_to_async(claim_due_dead_letters)(self.concurrency, self.max_attempts)
+        skipped = []
+        for letter in letters:
+            event = {**letter.payload, DEAD_LETTER_ID: letter.pk}
+            if not self.dispatcher.try_submit(letter.event_type, letter.signature, event):
+                skipped.append(letter)
+        if skipped:
+            await sync_to_async(release_dead_letters)(skipped)
+        return len(letters) - len(skipped)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                queued = await self.drain()
+                if queued:
+                    logger.info(f"Retrying {queued} dead-lettered events")
+            except Exception as e:
+                logger.error(f"Dead letter retry failed: {e}")
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
@@ -0,0 +1,85 @@
+import sys
+import time
+from collections import OrderedDict
+
+FLOAT_SIZE = sys.getsizeof(0.0)
+
+class SignatureFilter:
+    """
+    Sliding-window set of recently seen signatures with their first arrival time.
+
+    Oldest entries are evicted first, by count and, if `max_age` is set, by age.
+    Membership is exact, so a signature is only ever reported as a duplicate if
+    it really was seen: the false positive rate is zero. A duplicate that has
+    left the window reaches the database, where conflict-ignoring inserts drop
+    it; those are reported back through record_conflicts() as misses.
+    """
+    def __init__(self, max_size: int = 10000, max_age: float | None = None):
+        self.max_size = max_size
+        self.max_age = max_age
+        self.signatures = OrderedDict()
+        self.key_bytes = 0
+        self.checked = 0
+        self.duplicates = 0
+        self.evicted = 0
+        self.missed = 0
+
+    def add(self, signature: str, now: float | None = None) -> bool:
+        """Returns False if the signature was already seen"""
+        now = time.monotonic() if now is None else now
+        self.expire(now)
+        self.checked += 1
+        if signature in self.signatures:
+            self.duplicates += 1
+            return False
+        self.signatures[signature] = now
+        self.key_bytes += sys.getsizeof(signature)
+        if len(self.signatures) > self.max_size:
+            self.pop_oldest()
+        return True
+
+    def pop_oldest(self):
+        signature, _ = self.signatures.popitem(last=False)
+        self.key_bytes -= sys.getsizeof(signature)
+        self.evicted += 1
+
+    def expire(self, now: float):
+        if self.max_age is None:
+            return
+        while self.signatures:
+            oldest = next(iter(self.signatures.values()))
+            if now - oldest <= self.max_age:
+                break
+            self.pop_oldest()
+
+    def clear(self):
+        self.signatures.clear()
+        self.key_bytes = 0
+
+    def record_conflicts(self, count: int):
+        """Duplicates that got past the window and were dropped by the database"""
+        self.missed += count
+
+    def first_seen(self, signature: str) -> float | None:
+        return self.signatures.get(signature)
+
+    def memory_bytes(self) -> int:
+        """Approximate footprint: the table plus the signature strings and timestamps"""
+        return sys.getsizeof(self.signatures) + self.key_bytes + FLOAT_SIZE * len(self.signatures)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.signatures),
+            "checked": self.checked,
+            "duplicates": self.duplicates,
+            "evicted": self.evicted,
+            "missed": self.missed,
+            "memory_bytes": self.memory_bytes(),
+            "false_positive_rate": 0.0,
+        }
+
+    def __contains__(self, signature):
+        return signature in self.signatures
+
+    def __len__(self):
+        return len(self.signatures)
@@ -0,0 +1,280 @@
+import asyncio
+import itertools
+import logging
+import time
+import zlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections
+
+from systems.utils.batching import TradeBatcher
+
+logger = logging.getLogger(__name__)
+
+TRADE_EVENTS = ("TokenTransferEvent",)
+# set on events resubmitted from the dead-letter table
+DEAD_LETTER_ID = "dead_letter_id"
+# the listener's Delivery of the notification an event was decoded from; released
+# once the event is committed or dead-lettered so the checkpoint can move past it
+DELIVERY = "delivery"
+# events that bring a coin into existence; parked events of the mint follow them
+CREATION_EVENTS = ("TokenCreatedEvent",)
+
+class CoinNotReady(Exception):
+    """Raised by an event handler when the event's coin has not been written yet"""
+
+class PendingBuffer:
+    """
+    Events waiting for their coin to exist, per mint. They are released in slot
+    order (arrival order within a slot). Entries older than `ttl` seconds, or
+    beyond `max_size` in total, are given up on.
+    """
+    def __init__(self, ttl: float = 300, max_size: int = 10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.by_mint = defaultdict(list)
+        self.size = 0
+        self.sequence = itertools.count()
+
+    def park(self, event_type: str, signature: str, event: dict, now: float | None = None) -> list:
+        """Park an event; returns the events dropped to stay within max_size"""
+        now = time.monotonic() if now is None else now
+        entry = (event.get("slot") or 0, next(self.sequence), now, event_type, signature, event)
+        self.by_mint[event.get("mint_address", "")].append(entry)
+        self.size += 1
+        overflow = []
+        while self.size > self.max_size:
+            overflow.append(self.pop_oldest())
+        return overflow
+
+    def pop_oldest(self):
+        mint = min(self.by_mint, key=lambda mint: self.by_mint[mint][0][2])
+        entry = self.by_mint[mint].pop(0)
+        if not self.by_mint[mint]:
+            del self.by_mint[mint]
+        self.size -= 1
+        return entry[3:]
+
+    def release(self, mint_address: str) -> list:
+        """Everything parked for the mint, in slot order"""
+        entries = sorted(self.by_mint.pop(mint_address, []))
+        self.size -= len(entries)
+        return [entry[3:] for entry in entries]
+
+    def expire(self, now: float | None = None) -> list:
+        """Remove and return the events that have waited longer than ttl"""
+        now = time.monotonic() if now is None else now
+        expired = []
+        for mint in list(self.by_mint):
+            entries = self.by_mint[mint]
+            keep = [entry for entry in entries if now - entry[2] <= self.ttl]
+            expired.extend(entry[3:] for entry in entries if now - entry[2] > self.ttl)
+            if keep:
+                self.by_mint[mint] = keep
+            else:
+                del self.by_mint[mint]
+        self.size -= len(expired)
+        return expired
+
+    def __len__(self):
+        return self.size
+
+class CoinWorker:
+    """
+    Drains one queue of events in order. All database work runs on a dedicated
+    thread, so the worker owns its own Django connection.
+
+    Events whose coin does not exist yet (the handler raises CoinNotReady, or
+    handle_trades returns them) are parked until that coin's creation event
+    has been handled. Events that fail, expire or overflow are passed to
+    `dead_letter(entries, reason)` on the DB thread. Retried dead letters that
+    go through are reported to `resolve_dead_letters(ids)`. Either way, once an
+    event is written or dead-lettered its delivery is released.
+    """
+    def __init__(self, index, handle_event, handle_trades, prepare=None,
+                 queue_size=1000, batch_size=100, batch_window=0.25,
+                 dead_letter=None, pending_ttl=300, max_parked=10000,
+                 resolve_dead_letters=None):
+        self.index = index
+        self.handle_event = handle_event
+        self.handle_trades = handle_trades
+        self.prepare = prepare
+        self.dead_letter = dead_letter
+        self.resolve_dead_letters = resolve_dead_letters
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"db-worker-{index}")
+        self.batcher = TradeBatcher(self.write_trades, max_size=batch_size, max_wait=batch_window)
+        self.pending = PendingBuffer(ttl=pending_ttl, max_size=max_parked)
+        self.task = None
+        self.sweeper = None
+
+    async def run_sync(self, func, *args):
+        """Run `func` on this worker's DB thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def run(self):
+        while True:
+            event_type, signature, event = await self.queue.get()
+            try:
+                await self.process(event_type, signature, event)
+            except Exception as e:
+                logger.error(f"Worker {self.index} failed on {event_type} {signature}: {e}")
+                self.settle([event])
+            finally:
+                self.queue.task_done()
+
+    async def process(self, event_type, signature, event):
+        if event_type in TRADE_EVENTS:
+            await self.batcher.add(signature, event)
+            return
+        # trades queued before this event are written first
+        await self.batcher.flush()
+        if self.prepare:
+            event = await self.prepare(event_type, event)
+        try:
+            await self.run_sync(self.handle_event, event_type, signature, event)
+        except CoinNotReady:
+            await self.park(event_type, signature, event)
+            return
+        except Exception as e:
+            await self.bury([(event_type, signature, event)], f"{type(e).__name__}: {e}")
+            return
+        await self.resolve([event])
+        self.settle([event])
+        if event_type in CREATION_EVENTS:
+            await self.release(event.get("mint_address", ""))
+
+    async def write_trades(self, batch):
+        try:
+            waiting = await self.run_sync(self.handle_trades, batch)
+        except Exception as e:
+            await self.bury([(TRADE_EVENTS[0], signature, event) for signature, event in batch], f"{type(e).__name__}: {e}")
+            return
+        waiting = waiting or []
+        parked = {id(event) for _, event in waiting}
+        written = [event for _, event in batch if id(event) not in parked]
+        await self.resolve(written)
+        self.settle(written)
+        for signature, event in waiting:
+            await self.park(TRADE_EVENTS[0], signature, event)
+
+    async def park(self, event_type, signature, event):
+        overflow = self.pending.park(event_type, signature, event)
+        if overflow:
+            await self.bury(overflow, "pending buffer full")
+
+    async def release(self, mint_address: str):
+        """Replay the events that were waiting for this coin"""
+        for event_type, signature, event in self.pending.release(mint_address):
+            await self.process(event_type, signature, event)
+        await self.batcher.flush()
+
+    async def bury(self, entries: list, reason: str):
+        if not entries:
+            return
+        logger.warning(f"Worker {self.index} dead-lettering {len(entries)} events: {reason}")
+        # deliveries are not part of the stored payload
+        deliveries = [event.pop(DELIVERY, None) for _, _, event in entries]
+        if self.dead_letter:
+            try:
+                await self.run_sync(self.dead_letter, entries, reason)
+            except Exception as e:
+                logger.error(f"Could not store dead letters: {e}")
+        for delivery in deliveries:
+            if delivery is not None:
+                delivery.release()
+
+    async def resolve(self, events: list):
+        ids = [event[DEAD_LETTER_ID] for event in events if DEAD_LETTER_ID in event]
+        if ids and self.resolve_dead_letters:
+            try:
+                await self.run_sync(self.resolve_dead_letters, ids)
+            except Exception as e:
+                logger.error(f"Could not resolve dead letters {ids}: {e}")
+
+    def settle(self, events: list):
+        """The events are written; let the checkpoint move past them"""
+        for event in events:
+            delivery = event.pop(DELIVERY, None)
+            if delivery is not None:
+                delivery.release()
+
+    async def sweep(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await self.bury(self.pending.expire(), "coin never appeared")
+
+    async def stop(self):
+        await self.queue.join()
+        if self.task:
+            self.task.cancel()
+        if self.sweeper:
+            self.sweeper.cancel()
+        await self.batcher.flush()
+        await self.bury(self.pending.expire(now=float("inf")), "coin never appeared before shutdown")
+        await self.run_sync(connections.close_all)
+        self.executor.shutdown(wait=True)
+
+class CoinDispatcher:
+    """
+    Routes events onto `workers` ordered queues by hashing the mint address.
+
+    Events for the same coin always land on the same queue, so InitVaultEvent follows
+    TokenCreatedEvent and trades apply in order, while unrelated coins are written in
+    parallel on separate DB threads.
+    """
+    def __init__(self, handle_event, handle_trades, prepare=None, workers=4,
+                 queue_size=1000, batch_size=100, batch_window=0.25,
+                 dead_letter=None, pending_ttl=300, max_parked=10000,
+                 resolve_dead_letters=None):
+        self.pending_ttl = pending_ttl
+        self.workers = [
+            CoinWorker(
+                index, handle_event, handle_trades, prepare=prepare,
+                queue_size=queue_size, batch_size=batch_size, batch_window=batch_window,
+                dead_letter=dead_letter, pending_ttl=pending_ttl, max_parked=max_parked,
+                resolve_dead_letters=resolve_dead_letters,
+            )
+            for index in range(workers)
+        ]
+
+    def worker_for(self, mint_address: str) -> CoinWorker:
+        return self.workers[zlib.crc32(mint_address.encode()) % len(self.workers)]
+
+    async def start(self):
+        for worker in self.workers:
+            worker.task = asyncio.create_task(worker.run())
+            worker.sweeper = asyncio.create_task(worker.sweep(max(self.pending_ttl / 4, 1)))
+
+    async def submit(self, event_type: str, signature: str, event: dict, delivery=None):
+        """
+        Queue an event; waits when the coin's queue is full. A `delivery` is
+        held until the event has been committed or dead-lettered.
+        """
+        if delivery is not None:
+            delivery.hold()
+            event[DELIVERY] = delivery
+        # events without a mint are still ordered among themselves on one queue
+        worker = self.worker_for(event.get("mint_address", ""))
+        await worker.queue.put((event_type, signature, event))
+
+    def try_submit(self, event_type: str, signature: str, event: dict) -> bool:
+        """Queue an event only if the coin's queue has room"""
+        worker = self.worker_for(event.get("mint_address", ""))
+        try:
+            worker.queue.put_nowait((event_type, signature, event))
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    def queue_depths(self) -> list:
+        return [worker.queue.qsize() for worker in self.workers]
+
+    def pending_count(self) -> int:
+        return sum(len(worker.pending) for worker in self.workers)
+
+    async def stop(self):
+        """Drain every queue, flush pending trades and release the DB threads"""
+        await asyncio.gather(*(worker.stop() for worker in self.workers))
@@ -0,0 +1,64 @@
+import time
+
+from systems.utils.dedup import SignatureFilter
+
+class EndpointStats:
+    """How quickly one websocket endpoint delivers notifications"""
+    def __init__(self, url: str):
+        self.url = url
+        self.connects = 0
+        self.received = 0
+        self.first = 0  # notifications this endpoint delivered before any other
+        self.lag_total = 0.0  # seconds behind the first copy, summed
+        self.lag_max = 0.0
+
+    def record(self, lag: float):
+        self.received += 1
+        if lag <= 0:
+            self.first += 1
+            return
+        self.lag_total += lag
+        self.lag_max = max(self.lag_max, lag)
+
+    @property
+    def mean_lag(self) -> float:
+        return self.lag_total / self.received if self.received else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "url": self.url,
+            "connects": self.connects,
+            "received": self.received,
+            "first": self.first,
+            "mean_lag_ms": round(self.mean_lag * 1000, 3),
+            "max_lag_ms": round(self.lag_max * 1000, 3),
+        }
+
+class SignatureFanIn:
+    """
+    Merges the notification streams of several endpoints. The first copy of a
+    signature is forwarded; later copies are dropped and only count towards the
+    arrival lag of the endpoint that sent them.
+    """
+    def __init__(self, max_size: int = 10000, window: float = 300.0, seen=None):
+        self.seen = seen if seen is not None else SignatureFilter(max_size=max_size, max_age=window)
+        self.stats = {}
+
+    def endpoint(self, url: str) -> EndpointStats:
+        if url not in self.stats:
+            self.stats[url] = EndpointStats(url)
+        return self.stats[url]
+
+    def arrive(self, signature: str, url: str, now: float | None = None) -> bool:
+        """Returns True if this is the first copy of `signature`"""
+        now = time.monotonic() if now is None else now
+        first = self.seen.add(signature, now)
+        self.endpoint(url).record(0.0 if first else now - self.seen.first_seen(signature))
+        return first
+
+    def summary(self) -> list:
+        """Per-endpoint stats, fastest first"""
+        return sorted(
+            (stats.as_dict() for stats in self.stats.values()),
+            key=lambda stats: (-stats["first"], stats["mean_lag_ms"]),
+        )
@@ -0,0 +1,98 @@
+import threading
+from collections import OrderedDict
+
+from systems.models import Coin, SolanaUser
+
+class LRUCache:
+    """Thread-safe bounded mapping, least recently used entries evicted first"""
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def discard(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def stats(self) -> dict:
+        return {"size": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+    def __len__(self):
+        return len(self.entries)
+
+class IdentityCache:
+    """
+    Remembers which wallets and mints exist so trades can be written without
+    looking them up. Coins are kept as deferred instances carrying only
+    address, decimals and creator, which is all trade ingestion reads.
+    Unknown addresses are not cached, so a user or coin created later is
+    picked up on the next miss.
+    """
+    COIN_FIELDS = ("address", "decimals", "creator_id")
+
+    def __init__(self, max_users: int = 50000, max_coins: int = 10000):
+        self.users = LRUCache(max_users)
+        self.coins = LRUCache(max_coins)
+
+    def resolve_users(self, wallets) -> dict:
+        """wallet -> SolanaUser stand-in for every wallet that exists"""
+        found, missing = {}, []
+        for wallet in wallets:
+            user = self.users.get(wallet)
+            if user is None:
+                missing.append(wallet)
+            else:
+                found[wallet] = user
+        if missing:
+            for wallet in SolanaUser.objects.filter(wallet_address__in=missing).values_list('wallet_address', flat=True):
+                found[wallet] = self.remember_user(wallet)
+        return found
+
+    def resolve_coins(self, mints) -> dict:
+        """mint -> Coin with only the identity fields loaded, for every coin that exists"""
+        found, missing = {}, []
+        for mint in mints:
+            coin = self.coins.get(mint)
+            if coin is None:
+                missing.append(mint)
+            else:
+                found[mint] = coin
+        if missing:
+            for coin in Coin.objects.filter(address__in=missing).only(*self.COIN_FIELDS):
+                found[coin.address] = self.remember_coin(coin)
+        return found
+
+    def remember_user(self, wallet: str) -> SolanaUser:
+        user = SolanaUser(wallet_address=wallet)
+        self.users.put(wallet, user)
+        return user
+
+    def remember_coin(self, coin: Coin) -> Coin:
+        identity = Coin(address=coin.address, decimals=coin.decimals, creator_id=coin.creator_id)
+        self.coins.put(coin.address, identity)
+        return identity
+
+    def forget_coin(self, mint: str):
+        self.coins.discard(mint)
+
+    def stats(self) -> dict:
+        return {"users": self.users.stats(), "coins": self.coins.stats()}
@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from collections import deque
+
+from systems.utils.archive import RECORD_LENGTH, encode_notification, decode_notification
+from systems.utils.notifications import LogNotification
+
+logger = logging.getLogger(__name__)
+
+# what happens to a notification that arrives while the queue is full
+OVERFLOW_POLICIES = ("block", "spill", "drop")
+
+class SpillFile:
+    """
+    Notifications that did not fit in memory, in the archive record format,
+    read back in the order they were written. The file is truncated whenever
+    it has been read to the end.
+    """
+    def __init__(self, path=None):
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix="listener-spill-", suffix=".bin")
+            os.close(fd)
+        self.path = path
+        self.writer = open(path, "wb")
+        self.reader = open(path, "rb")
+        # arrival time of every unread record, for the oldest-item gauge
+        self.received = deque()
+
+    def write(self, notification: LogNotification):
+        self.writer.write(encode_notification(notification))
+        self.writer.flush()
+        self.received.append(notification.received_at)
+
+    def read(self) -> LogNotification:
+        (length,) = RECORD_LENGTH.unpack(self.reader.read(RECORD_LENGTH.size))
+        notification = decode_notification(self.reader.read(length))
+        self.received.popleft()
+        if not self.received:
+            self.writer.seek(0)
+            self.writer.truncate()
+            self.reader.seek(0)
+        return notification
+
+    def close(self):
+        self.writer.close()
+        self.reader.close()
+        os.unlink(self.path)
+
+    def __len__(self):
+        return len(self.received)
+
+class NotificationQueue:
+    """
+    Bounded queue between the websocket readers and event processing.
+
+    When `max_size` notifications are waiting, `policy` decides what put() does
+    with the next one: "block" waits for room (the socket stops being read),
+    "spill" appends it to a file on disk that is drained once memory is empty,
+    and "drop" discards it, logging an error for the first drop and every
+    `alert_every` after it. Notifications come out in arrival order under
+    every policy.
+    """
+    def __init__(self, max_size: int = 10000, policy: str = "block", spill_path=None, alert_every: int = 1000):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Invalid overflow policy: {policy} (use {', '.join(OVERFLOW_POLICIES)})")
+        self.max_size = max_size
+        self.policy = policy
+        self.spill_path = spill_path
+        self.alert_every = alert_every
+        self.items = deque()
+        self.spill = None
+        self.changed = asyncio.Condition()
+        self.unfinished = 0
+        self.received = 0
+        self.spilled = 0
+        self.dropped = 0
+        self.blocked = 0
+
+    async def put(self, notification: LogNotification):
+        async with self.changed:
+            self.received += 1
+            if len(self.items) >= self.max_size or (self.spill and len(self.spill)):
+                if self.policy == "drop":
+                    self.drop(notification)
+                    return
+                if self.policy == "spill":
+                    if self.spill is None:
+                        self.spill = SpillFile(self.spill_path)
+                    # once spilling, everything goes to disk until it is read back
+                    self.spill.write(notification)
+                    self.spilled += 1
+                else:
+                    self.blocked += 1
+                    await self.changed.wait_for(lambda: len(self.items) < self.max_size)
+                    self.items.append(notification)
+            else:
+                self.items.append(notification)
+            self.unfinished += 1
+            self.changed.notify_all()
+
+    def drop(self, notification: LogNotification):
+        self.dropped += 1
+        if self.dropped == 1 or self.dropped % self.alert_every == 0:
+            logger.error(
+                f"Notification queue full ({self.max_size}), dropped {self.dropped} so far "
+                f"(latest {notification.signature} at slot {notification.slot}); these events are lost"
+            )
+
+    async def get(self) -> LogNotification:
+        async with self.changed:
+            await self.changed.wait_for(lambda: self.items or (self.spill and len(self.spill)))
+            # memory holds everything older than the first spilled record
+            notification = self.items.popleft() if self.items else self.spill.read()
+            self.changed.notify_all()
+            return notification
+
+    async def task_done(self):
+        async with self.changed:
+            self.unfinished -= 1
+            self.changed.notify_all()
+
+    async def join(self):
+        """Wait until every queued notification has been processed"""
+        async with self.changed:
+            await self.changed.wait_for(lambda: self.unfinished == 0)
+
+    def depth(self) -> int:
+        return len(self.items) + (len(self.spill) if self.spill else 0)
+
+    def oldest_age(self, now: float | None = None) -> float:
+        """Seconds the oldest waiting notification has been queued, 0 when empty"""
+        now = time.time() if now is None else now
+        if self.items:
+            oldest = self.items[0].received_at
+        elif self.spill and len(self.spill):
+            oldest = self.spill.received[0]
+        else:
+            return 0.0
+        return max(now - oldest, 0.0)
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth(),
+            "oldest_age": round(self.oldest_age(), 3),
+            "received": self.received,
+            "spilled": self.spilled,
+            "dropped": self.dropped,
+            "blocked": self.blocked,
+        }
+
+    def close(self):
+        if self.spill:
+            self.spill.close()
+            self.spill = None
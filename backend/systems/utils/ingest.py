@@ -0,0 +1,441 @@
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Case, Count, DateTimeField, DecimalField, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from systems.models import (
+    Coin, Trade, SolanaUser, UserCoinHoldings, PriceCandle,
+    DeveloperScore, TraderScore, CoinDRCScore,
+)
+from systems.utils.broadcast import broadcast_trade_created, broadcast_trade_status
+from systems.utils.candles import CANDLE_TRADE_TYPES, trade_price, upsert_candles, rebuild_candles
+
+TRANSFER_TYPES = {"0": "BUY", "1": "SELL", "2": "COIN_CREATE"}
+# sol_amount is in lamports whatever the decimals of the coin traded
+SOL_DECIMALS = 9
+
+def bigint_to_decimal(value: int, power: int = 9) -> Decimal:
+    """Scale an on-chain integer amount down by `power` decimals"""
+    return Decimal(value).scaleb(-power).quantize(Decimal(f'0.{"0"*(power-1)}1'))
+
+def get_transaction_type(ttype) -> str:
+    try:
+        return TRANSFER_TYPES[str(ttype)]
+    except KeyError:
+        raise ValueError("Type not Registered")
+
+def event_time(event: dict) -> datetime:
+    """When a decoded event happened: its block time, else when the listener received it, else now"""
+    moment = event.get("block_time") or event.get("received_at")
+    if not moment:
+        return timezone.now()
+    return datetime.fromtimestamp(moment, tz=dt_timezone.utc)
+
+def ingest_trades(events: list, identities=None, seen=None, missing_coins=None) -> list:
+    """
+    Persist a batch of decoded trade events in a single transaction.
+
+    `events` is a list of (signature, decoded TokenTransferEvent) pairs. Users and
+    coins are resolved with one IN query each (or from `identities`, an
+    IdentityCache, which only queries the addresses it has not seen), new trades
+    are written with one conflict-ignoring bulk insert that reports which rows
+    were new, and the holdings deltas are applied set-wise for those only.
+    Duplicates the insert drops are reported to `seen` (a SignatureFilter).
+
+    Trades whose coin does not exist yet are appended to `missing_coins` when
+    it is given, so the caller can retry them once the coin is written.
+
+    Events flagged `provisional` (seen at processed commitment) are stored and
+    applied as provisional trades; a later confirmed copy promotes them.
+    Trades are stamped with when they happened (event_time), not when this
+    batch runs, so a backfilled or retried trade lands in its own candles.
+    Returns the trades that were actually inserted.
+    """
+    pending = {}
+    for signature, logs in events:
+        # the same signature can show up twice in a window; a confirmed copy wins
+        if signature not in pending or not logs.get("provisional"):
+            pending[signature] = logs
+    if not pending:
+        return []
+
+    with transaction.atomic():
+        wallets = {logs["user"] for logs in pending.values()}
+        mints = {logs["mint_address"] for logs in pending.values()}
+        if identities is not None:
+            users, coins = identities.resolve_users(wallets), identities.resolve_coins(mints)
+        else:
+            users, coins = SolanaUser.objects.in_bulk(wallets), Coin.objects.in_bulk(mints)
+
+        trades = []
+        for signature, logs in pending.items():
+            user = users.get(logs["user"])
+            coin = coins.get(logs["mint_address"])
+            if coin is None and missing_coins is not None:
+                missing_coins.append((signature, logs))
+                continue
+            if user is None or coin is None:
+                print(f"Skipping trade {signature}: unknown user or coin")
+                continue
+            trades.append(Trade(
+                transaction_hash=signature,
+                user=user,
+                coin=coin,
+                trade_type=get_transaction_type(logs["transfer_type"]),
+                coin_amount=bigint_to_decimal(logs["coin_amount"], coin.decimals),
+                sol_amount=bigint_to_decimal(logs["sol_amount"], SOL_DECIMALS),
+                executed_at=event_time(logs),
+                provisional=bool(logs.get("provisional")),
+            ))
+
+        if not trades:
+            return []
+
+        inserted = insert_trades(trades)
+        confirmed = [
+            trade.transaction_hash for trade in trades
+            if trade.transaction_hash not in inserted and not trade.provisional
+        ]
+        if confirmed:
+            promoted = promote_trades(confirmed)
+            if seen is not None and len(promoted) < len(confirmed):
+                seen.record_conflicts(len(confirmed) - len(promoted))
+        trades = [trade for trade in trades if trade.transaction_hash in inserted]
+        if not trades:
+            return []
+        apply_trades(trades)
+        transaction.on_commit(lambda: _broadcast_trades(trades), robust=True)
+    return trades
+
+INSERT_CHUNK = 100
+HELD_FIELD = DecimalField(max_digits=20, decimal_places=8)
+PRICE_FIELD = DecimalField(max_digits=30, decimal_places=18)
+
+def insert_trades(trades: list) -> set:
+    """
+    INSERT ... ON CONFLICT DO NOTHING RETURNING transaction_hash: the database
+    decides which trades are new, in the same statement that writes them.
+    Returns the hashes of the rows that were inserted.
+    """
+    fields = Trade._meta.concrete_fields
+    table = connection.ops.quote_name(Trade._meta.db_table)
+    columns = ", ".join(connection.ops.quote_name(field.column) for field in fields)
+    pk_column = connection.ops.quote_name(Trade._meta.pk.column)
+    row = "(" + ", ".join(["%s"] * len(fields)) + ")"
+
+    inserted = set()
+    with connection.cursor() as cursor:
+        for start in range(0, len(trades), INSERT_CHUNK):
+            chunk = trades[start:start + INSERT_CHUNK]
+            params = [
+                field.get_db_prep_save(field.pre_save(trade, add=True), connection)
+                for trade in chunk for field in fields
+            ]
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) VALUES {', '.join([row] * len(chunk))} "
+                f"ON CONFLICT ({pk_column}) DO NOTHING RETURNING {pk_column}",
+                params,
+            )
+            inserted.update(transaction_hash for (transaction_hash,) in cursor.fetchall())
+    return inserted
+
+def promote_trades(transaction_hashes: list) -> list:
+    """Mark provisional trades as confirmed; returns the hashes that were provisional"""
+    promoted = list(
+        Trade.objects.filter(transaction_hash__in=transaction_hashes, provisional=True)
+        .values_list('transaction_hash', flat=True)
+    )
+    if promoted:
+        Trade.objects.filter(transaction_hash__in=promoted).update(provisional=False)
+        transaction.on_commit(lambda: broadcast_trade_status(promoted, "confirmed"), robust=True)
+    return promoted
+
+def rollback_provisional(transaction_hashes: list) -> list:
+    """
+    Delete provisional trades that never confirmed and reverse their holdings
+    deltas. Trades confirmed in the meantime are left alone. Returns the hashes
+    that were rolled back.
+    """
+    with transaction.atomic():
+        trades = list(
+            Trade.objects.select_for_update()
+            .filter(transaction_hash__in=transaction_hashes, provisional=True)
+            .select_related('coin')
+        )
+        if not trades:
+            return []
+        rolled_back = [trade.transaction_hash for trade in trades]
+        Trade.objects.filter(transaction_hash__in=rolled_back).delete()
+        apply_trades(trades, reverse=True)
+        transaction.on_commit(lambda: broadcast_trade_status(rolled_back, "rolled_back"), robust=True)
+    return rolled_back
+
+def expired_provisional(older_than: timedelta) -> dict:
+    """coin address -> hashes of provisional trades older than `older_than`"""
+    expired = defaultdict(list)
+    for coin_id, transaction_hash in Trade.objects.filter(
+        provisional=True, created_at__lt=timezone.now() - older_than
+    ).values_list('coin_id', 'transaction_hash'):
+        expired[coin_id].append(transaction_hash)
+    return dict(expired)
+
+def apply_trades(trades: list, reverse: bool = False):
+    """
+    Set-wise equivalent of the post_save trade signal for trades written with
+    insert_trades: holdings are upserted once per (user, coin), score rows
+    ensured, holder counts adjusted in place and the trades folded into
+    their price candles, whatever the batch size.
+    With `reverse` the trades are undone instead.
+    """
+    deltas = defaultdict(Decimal)
+    for trade in trades:
+        amount = -trade.coin_amount if reverse else trade.coin_amount
+        if trade.trade_type == 'SELL':
+            deltas[(trade.user_id, trade.coin_id)] -= amount
+        else:
+            deltas[(trade.user_id, trade.coin_id)] += amount
+
+    changes = upsert_holdings(deltas)
+
+    TraderScore.objects.bulk_create(
+        [TraderScore(trader_id=user_id) for user_id in {user_id for user_id, _ in deltas}], ignore_conflicts=True
+    )
+    adjust_holders_counts({coin_id: holders for coin_id, (holders, _) in changes.items()})
+
+    if reverse:
+        adjust_coin_stats(changes)
+        # high/low cannot be taken back incrementally; recompute from what is left
+        earliest = {}
+        for trade in trades:
+            earliest[trade.coin_id] = min(earliest.get(trade.coin_id, trade.executed_at), trade.executed_at)
+        for coin_id, since in earliest.items():
+            rebuild_candles(coin_id, since)
+        refresh_prices(list(earliest))
+    else:
+        adjust_coin_stats(changes, batch_prices(trades))
+        upsert_candles(trades)
+
+    creators = {trade.coin.creator_id for trade in trades if trade.trade_type == 'COIN_CREATE'}
+    for creator_id in creators:
+        dev_score, _ = DeveloperScore.objects.get_or_create(developer_id=creator_id)
+        dev_score.recalculate_score()
+
+def upsert_holdings(deltas: dict) -> dict:
+    """
+    Add {(user_id, coin_id): amount} to UserCoinHoldings with one
+    INSERT ... ON CONFLICT DO UPDATE ... RETURNING per chunk, so the database
+    does the arithmetic and no row is read first. Balances that end at or
+    below zero are removed with one DELETE, only when there are any.
+    Returns {coin_id: (change in holder count, change in total held)} for
+    every coin in `deltas`.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    changes = {coin_id: (0, Decimal(0)) for _, coin_id in deltas}
+    if not deltas:
+        return changes
+
+    meta = UserCoinHoldings._meta
+    amount_field = meta.get_field('amount_held')
+    quote = connection.ops.quote_name
+    table = quote(meta.db_table)
+    user_column, coin_column = quote(meta.get_field('user').column), quote(meta.get_field('coin').column)
+    amount_column, pk_column = quote(amount_field.column), quote(meta.pk.column)
+
+    items = list(deltas.items())
+    emptied = []
+    with connection.cursor() as cursor:
+        for start in range(0, len(items), INSERT_CHUNK):
+            chunk = items[start:start + INSERT_CHUNK]
+            params = []
+            for (user_id, coin_id), delta in chunk:
+                params += [user_id, coin_id, amount_field.get_db_prep_save(delta, connection)]
+            cursor.execute(
+                f"INSERT INTO {table} ({user_column}, {coin_column}, {amount_column}) "
+                f"VALUES {', '.join(['(%s, %s, %s)'] * len(chunk))} "
+                f"ON CONFLICT ({user_column}, {coin_column}) "
+                f"DO UPDATE SET {amount_column} = {table}.{amount_column} + excluded.{amount_column} "
+                f"RETURNING {pk_column}, {user_column}, {coin_column}, {amount_column}",
+                params,
+            )
+            for pk, user_id, coin_id, amount_held in cursor.fetchall():
+                amount_held = Decimal(str(amount_held))
+                # zero balances are deleted, so the row existed iff it was held before
+                before = max(amount_held - deltas[(user_id, coin_id)], 0)
+                after = max(amount_held, 0)
+                holders, held = changes[coin_id]
+                changes[coin_id] = (holders + (after > 0) - (before > 0), held + after - before)
+                if not after:
+                    emptied.append(pk)
+        if emptied:
+            cursor.execute(
+                f"DELETE FROM {table} WHERE {pk_column} IN ({', '.join(['%s'] * len(emptied))})", emptied
+            )
+    return changes
+
+def adjust_holders_counts(changes: dict):
+    """
+    Apply {coin_id: change} to CoinDRCScore.holders_count in one upsert,
+    creating the score rows that do not exist yet.
+    """
+    if not changes:
+        return
+    fields = [field for field in CoinDRCScore._meta.concrete_fields if not field.primary_key]
+    quote = connection.ops.quote_name
+    table = quote(CoinDRCScore._meta.db_table)
+    columns = ", ".join(quote(field.column) for field in fields)
+    holders_column = quote(CoinDRCScore._meta.get_field('holders_count').column)
+    updated_column = quote(CoinDRCScore._meta.get_field('updated_at').column)
+    coin_column = quote(CoinDRCScore._meta.get_field('coin').column)
+    row = "(" + ", ".join(["%s"] * len(fields)) + ")"
+
+    scores = [CoinDRCScore(coin_id=coin_id, holders_count=change) for coin_id, change in changes.items()]
+    with connection.cursor() as cursor:
+        for start in range(0, len(scores), INSERT_CHUNK):
+            chunk = scores[start:start + INSERT_CHUNK]
+            params = [
+                field.get_db_prep_save(field.pre_save(score, add=True), connection)
+                for score in chunk for field in fields
+            ]
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) VALUES {', '.join([row] * len(chunk))} "
+                f"ON CONFLICT ({coin_column}) DO UPDATE SET "
+                f"{holders_column} = {table}.{holders_column} + excluded.{holders_column}, "
+                f"{updated_column} = excluded.{updated_column}",
+                params,
+            )
+
+def adjust_coin_stats(changes: dict, prices: dict | None = None):
+    """
+    Apply {coin_id: (holders, held)} and {coin_id: (last price, highest price, executed_at of the last)}
+    to the denormalized Coin columns in one UPDATE for the whole batch. The
+    holder columns move by their deltas, current_price takes the last execution
+    price unless the coin already has a price from a later trade, and ath the
+    greater of itself and the highest. market_cap is recomputed from the
+    pre-update total_held plus the delta and the resulting price, since every
+    assignment in an UPDATE reads the old row.
+    """
+    changes = {coin_id: change for coin_id, change in changes.items() if any(change)}
+    prices = prices or {}
+    if not changes and not prices:
+        return
+    updates = {}
+    held = Value(Decimal(0), output_field=HELD_FIELD)
+    if changes:
+        holders = Case(
+            *[When(address=coin_id, then=Value(count)) for coin_id, (count, _) in changes.items()],
+            default=Value(0), output_field=IntegerField(),
+        )
+        held = Case(
+            *[When(address=coin_id, then=Value(amount)) for coin_id, (_, amount) in changes.items()],
+            default=Value(Decimal(0)), output_field=HELD_FIELD,
+        )
+        updates.update(holders_count=F('holders_count') + holders, total_held=F('total_held') + held)
+    price = F('current_price')
+    if prices:
+        # only trades at least as recent as the coin's price move it
+        newer = {
+            coin_id: Q(address=coin_id) & (Q(last_price_at__isnull=True) | Q(last_price_at__lte=executed_at))
+            for coin_id, (_, _, executed_at) in prices.items()
+        }
+        price = Case(
+            *[When(newer[coin_id], then=Value(last)) for coin_id, (last, _, _) in prices.items()],
+            default=F('current_price'), output_field=PRICE_FIELD,
+        )
+        priced_at = Case(
+            *[When(newer[coin_id], then=Value(executed_at)) for coin_id, (_, _, executed_at) in prices.items()],
+            default=F('last_price_at'), output_field=DateTimeField(),
+        )
+        highest = Case(
+            *[When(address=coin_id, then=Value(high)) for coin_id, (_, high, _) in prices.items()],
+            default=F('ath'), output_field=PRICE_FIELD,
+        )
+        updates.update(current_price=price, last_price_at=priced_at, ath=Greatest('ath', highest))
+    updates['market_cap'] = (F('total_supply') - F('total_held') - held) * price
+    Coin.objects.filter(address__in=set(changes) | set(prices)).update(**updates)
+
+def batch_prices(trades: list) -> dict:
+    """{coin_id: (last, highest, executed_at of the last)} execution price of the BUY/SELL trades in a batch"""
+    prices = {}
+    for trade in sorted(trades, key=lambda trade: trade.executed_at):
+        price = trade_price(trade.sol_amount, trade.coin_amount) if trade.trade_type in CANDLE_TRADE_TYPES else None
+        if price is None:
+            continue
+        _, high, _ = prices.get(trade.coin_id, (price, price, None))
+        prices[trade.coin_id] = (price, max(high, price), trade.executed_at)
+    return prices
+
+def refresh_prices(coin_ids):
+    """
+    Reset current_price and ath from the candles, after trades were taken
+    out of them: the close of the latest minute and the highest daily high.
+    Coins without candles keep their values.
+    """
+    candles = PriceCandle.objects.filter(coin_id=OuterRef('address'))
+    latest = candles.filter(interval='1m').order_by('-bucket_start')
+    high = candles.filter(interval='1d').order_by('-high').values('high')[:1]
+    price = Coalesce(Subquery(latest.values('close')[:1]), F('current_price'), output_field=PRICE_FIELD)
+    Coin.objects.filter(address__in=coin_ids).update(
+        current_price=price,
+        last_price_at=Coalesce(Subquery(latest.values('closed_at')[:1]), F('last_price_at')),
+        ath=Coalesce(Subquery(high), F('ath'), output_field=PRICE_FIELD),
+        market_cap=(F('total_supply') - F('total_held')) * price,
+    )
+
+def reconcile_coin_stats(coin_ids) -> int:
+    """
+    Recompute total_held, holders_count and market_cap of the given coins
+    from UserCoinHoldings, and the score rows' holder counts. Returns how many
+    coins had drifted.
+
+    The coins are locked before holdings are summed, so a trade applied
+    concurrently either is in the sums or adds its delta after this commits.
+    """
+    with transaction.atomic():
+        coins = list(
+            Coin.objects.select_for_update().filter(address__in=coin_ids)
+            .only('address', 'total_supply', 'current_price', 'total_held', 'holders_count', 'market_cap')
+        )
+        sums = {
+            coin_id: (count, total)
+            for coin_id, count, total in UserCoinHoldings.objects.filter(coin_id__in=coin_ids, amount_held__gt=0)
+            .values('coin_id').annotate(count=Count('id'), total=Sum('amount_held'))
+            .values_list('coin_id', 'count', 'total')
+        }
+        drifted = []
+        for coin in coins:
+            holders_count, total_held = sums.get(coin.address, (0, Decimal(0)))
+            total_held = Decimal(total_held).quantize(Decimal('0.00000001'))
+            # as stored: the column keeps 8 decimal places
+            market_cap = ((coin.total_supply - total_held) * coin.current_price).quantize(Decimal('0.00000001'))
+            if (coin.holders_count, coin.total_held, coin.market_cap) != (holders_count, total_held, market_cap):
+                coin.holders_count, coin.total_held, coin.market_cap = holders_count, total_held, market_cap
+                drifted.append(coin)
+        if drifted:
+            Coin.objects.bulk_update(drifted, ['holders_count', 'total_held', 'market_cap'])
+        update_holders_counts(coin_ids)
+    return len(drifted)
+
+def update_holders_counts(coin_ids):
+    """Recount holders for the given coins from scratch, with one aggregate and one UPDATE"""
+    if not coin_ids:
+        return
+    counts = dict(
+        UserCoinHoldings.objects.filter(coin_id__in=coin_ids)
+        .values('coin_id').annotate(total=Count('id'))
+        .values_list('coin_id', 'total')
+    )
+    CoinDRCScore.objects.filter(coin_id__in=coin_ids).update(
+        holders_count=Case(
+            *[When(coin_id=coin_id, then=Value(counts.get(coin_id, 0))) for coin_id in coin_ids],
+            output_field=IntegerField(),
+        ),
+        updated_at=timezone.now(),
+    )
+
+def _broadcast_trades(trades: list):
+    for trade in trades:
+        broadcast_trade_created(trade)
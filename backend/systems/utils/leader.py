@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.db.models.functions import Now
+
+from systems.models import ListenerLease
+
+logger = logging.getLogger(__name__)
+
+def acquire_lease(name: str, holder: str, ttl: float) -> bool:
+    """
+    Take or renew the named lease for `ttl` seconds. Succeeds if nobody holds
+    it, `holder` already does, or the current holder let it expire. Expiry is
+    compared on the database clock, so replicas with skewed clocks agree.
+    """
+    expires_at = Now() + timedelta(seconds=ttl)
+    with transaction.atomic():
+        taken = ListenerLease.objects.filter(name=name).filter(
+            Q(holder=holder) | Q(expires_at__lte=Now())
+        ).update(holder=holder, expires_at=expires_at, updated_at=Now())
+        if taken:
+            return True
+    try:
+        with transaction.atomic():
+            ListenerLease.objects.create(name=name, holder=holder, expires_at=expires_at)
+        return True
+    except IntegrityError:
+        return False
+
+def release_lease(name: str, holder: str):
+    """Expire the lease now so a standby can take over without waiting out the ttl"""
+    ListenerLease.objects.filter(name=name, holder=holder).update(expires_at=Now())
+
+def default_holder() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+class LeaderElector:
+    """
+    Campaigns for a lease every `interval` seconds (ttl / 3 by default).
+
+    `on_elected()` runs as its own task when this replica takes the lease, so
+    a long catch-up does not hold up renewals. `on_demoted()` is awaited when
+    it loses the lease, after cancelling an unfinished `on_elected()`. A
+    renewal that fails for any reason, including the database being
+    unreachable, demotes straight away: the lease may already have passed to
+    a standby.
+    """
+    def __init__(self, name: str, on_elected=None, on_demoted=None, ttl: float = 10,
+                 interval: float | None = None, holder: str | None = None):
+        self.name = name
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.ttl = ttl
+        self.interval = interval if interval is not None else ttl / 3
+        self.holder = holder or default_holder()
+        self.is_leader = False
+        self.task = None
+        self.election = None
+
+    async def campaign(self) -> bool:
+        """One acquire/renew attempt; returns whether this replica leads afterwards"""
+        try:
+            held = await sync_to_async(acquire_lease)(self.name, self.holder, self.ttl)
+        except Exception as e:
+            logger.error(f"Lease {self.name} could not be renewed: {e}")
+            held = False
+        if held and not self.is_leader:
+            self.is_leader = True
+            logger.info(f"{self.holder} is now the leader for {self.name}")
+            if self.on_elected:
+                self.election = asyncio.create_task(self.on_elected())
+        elif not held and self.is_leader:
+            self.is_leader = False
+            logger.warning(f"{self.holder} lost the lease for {self.name}")
+            if self.election and not self.election.done():
+                self.election.cancel()
+            if self.on_demoted:
+                await self.on_demoted()
+        return self.is_leader
+
+    async def run(self):
+        while True:
+            try:
+                await self.campaign()
+            except Exception as e:
+                logger.error(f"Leader election for {self.name} failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Stop campaigning and hand the lease over"""
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        if self.election and not self.election.done():
+            self.election.cancel()
+        if self.is_leader:
+            self.is_leader = False
+            try:
+                await sync_to_async(release_lease)(self.name, self.holder)
+            except Exception as e:
+                logger.warning(f"Could not release lease {self.name}: {e}")
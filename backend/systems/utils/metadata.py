@@ -0,0 +1,196 @@
+import asyncio
+import json
+import logging
+import os
+import re
+from pathlib import Path
+
+import aiohttp
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+GATEWAYS = [
+    "https://ipfs.io/ipfs/",
+    "https://cloudflare-ipfs.com/ipfs/",
+    "https://gateway.pinata.cloud/ipfs/",
+]
+CACHE_PREFIX = "ipfs_meta:"
+# CIDv0 (Qm...) and CIDv1 base32/base58 hashes; anything else is not cached on disk
+IPFS_HASH = re.compile(r"^[A-Za-z0-9]{20,100}$")
+
+def extract_ipfs_hash(uri: str) -> str:
+    parts = (uri or "").rstrip("/").split("/")
+    if parts:
+        return parts[-1]
+    return ""
+
+def default_cache_dir() -> Path:
+    return Path(getattr(settings, "IPFS_CACHE_DIR", settings.BASE_DIR / "ipfs_cache"))
+
+class MetadataCache:
+    """
+    Content-addressed cache of IPFS metadata. IPFS content never changes for a
+    given hash, so entries are kept forever: in Redis for the other processes
+    and on disk so a restart does not refetch everything.
+    """
+    def __init__(self, directory=None):
+        self.directory = Path(directory) if directory else default_cache_dir()
+
+    def path_for(self, ipfs_hash: str) -> Path | None:
+        if not IPFS_HASH.match(ipfs_hash):
+            return None
+        return self.directory / ipfs_hash[-2:] / f"{ipfs_hash}.json"
+
+    def read_disk(self, ipfs_hash: str):
+        path = self.path_for(ipfs_hash)
+        if path is None or not path.exists():
+            return None
+        try:
+            return json.loads(path.read_text())
+        except (OSError, ValueError) as e:
+            logger.warning(f"Unreadable metadata cache entry {path}: {e}")
+            return None
+
+    def write_disk(self, ipfs_hash: str, metadata: dict):
+        path = self.path_for(ipfs_hash)
+        if path is None:
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(metadata))
+        os.replace(tmp, path)
+
+    async def get(self, ipfs_hash: str):
+        try:
+            metadata = await cache.aget(CACHE_PREFIX + ipfs_hash)
+        except Exception as e:
+            logger.warning(f"Metadata cache lookup failed: {e}")
+            metadata = None
+        if metadata is not None:
+            return metadata
+        metadata = await asyncio.to_thread(self.read_disk, ipfs_hash)
+        if metadata is not None:
+            await self.set_redis(ipfs_hash, metadata)
+        return metadata
+
+    async def set(self, ipfs_hash: str, metadata: dict):
+        await asyncio.to_thread(self.write_disk, ipfs_hash, metadata)
+        await self.set_redis(ipfs_hash, metadata)
+
+    async def set_redis(self, ipfs_hash: str, metadata: dict):
+        try:
+            await cache.aset(CACHE_PREFIX + ipfs_hash, metadata, timeout=None)
+        except Exception as e:
+            logger.warning(f"Metadata cache store failed: {e}")
+
+class MetadataFetcher:
+    """Fetches IPFS metadata over one pooled session, racing every gateway"""
+    def __init__(self, gateways=None, timeout: float = 10, cache=None):
+        self.gateways = gateways or GATEWAYS
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.cache = cache or MetadataCache()
+        self.session = None
+
+    async def get_session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(timeout=self.timeout)
+        return self.session
+
+    async def fetch_from(self, gateway: str, ipfs_hash: str) -> dict:
+        session = await self.get_session()
+        async with session.get(f"{gateway}{ipfs_hash}") as response:
+            if response.status != 200:
+                raise aiohttp.ClientResponseError(
+                    response.request_info, response.history, status=response.status
+                )
+            metadata = await response.json(content_type=None)
+        if not isinstance(metadata, dict):
+            raise ValueError("metadata is not a JSON object")
+        return metadata
+
+    async def fetch(self, ipfs_hash: str):
+        """Cached metadata, or the first gateway to answer; None if all fail"""
+        metadata = await self.cache.get(ipfs_hash)
+        if metadata is not None:
+            return metadata
+
+        tasks = [asyncio.create_task(self.fetch_from(gateway, ipfs_hash)) for gateway in self.gateways]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    metadata = await next_done
+                    break
+                except Exception as e:
+                    logger.info(f"Gateway failed for {ipfs_hash}: {e}")
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        if metadata is not None:
+            await self.cache.set(ipfs_hash, metadata)
+        return metadata
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+class MetadataEnricher:
+    """
+    Background queue of coins waiting for their IPFS metadata. Coins are written
+    straight away; `on_metadata(mint_address, metadata)` is awaited once the
+    metadata arrives.
+    """
+    def __init__(self, fetcher: MetadataFetcher, on_metadata, concurrency: int = 8):
+        self.fetcher = fetcher
+        self.on_metadata = on_metadata
+        self.concurrency = concurrency
+        self.queue = asyncio.Queue()
+        self.tasks = []
+
+    async def start(self):
+        self.tasks = [asyncio.create_task(self.run()) for _ in range(self.concurrency)]
+
+    def submit(self, mint_address: str, uri: str):
+        ipfs_hash = extract_ipfs_hash(uri)
+        if not ipfs_hash:
+            logger.warning(f"Invalid IPFS URI for {mint_address}: {uri}")
+            return
+        self.queue.put_nowait((mint_address, ipfs_hash))
+
+    async def run(self):
+        while True:
+            mint_address, ipfs_hash = await self.queue.get()
+            try:
+                metadata = await self.fetcher.fetch(ipfs_hash)
+                if metadata is None:
+                    logger.warning(f"No gateway returned metadata for {mint_address} ({ipfs_hash})")
+                else:
+                    await self.on_metadata(mint_address, metadata)
+            except Exception as e:
+                logger.error(f"Enrichment failed for {mint_address}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def stop(self, drain: bool = True):
+        if drain:
+            await self.queue.join()
+        for task in self.tasks:
+            task.cancel()
+        await self.fetcher.close()
+
+def metadata_fields(metadata: dict) -> dict:
+    """Coin columns filled from token metadata"""
+    attributes = metadata.get("attributes") or {}
+    if not isinstance(attributes, dict):
+        attributes = {}
+    fields = {
+        "image_url": metadata.get("image"),
+        "description": metadata.get("description"),
+        "discord": attributes.get("discord"),
+        "website": attributes.get("website"),
+        "twitter": attributes.get("twitter"),
+    }
+    return {key: value for key, value in fields.items() if value}
@@ -0,0 +1,277 @@
+import asyncio
+import bisect
+import logging
+import threading
+import time
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# seconds; covers a sub-millisecond decode up to a write stuck behind a lock
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+
+    def key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def samples(self) -> list:
+        """(suffix, label values, extra label, value) for every series"""
+        raise NotImplementedError
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, values, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{format_labels(self.labelnames, values, extra)} {format_value(value)}")
+        return lines
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self.values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(self.key(labels), 0)
+
+    def samples(self):
+        with self.lock:
+            return [("", key, "", value) for key, value in sorted(self.values.items())]
+
+class Gauge(Metric):
+    """
+    Set directly, or computed at scrape time by `function`, which returns a
+    number, or a list of (labels dict, value) when the gauge has labels.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=(), function=None):
+        super().__init__(name, help, labelnames)
+        self.values = {}
+        self.function = function
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[self.key(labels)] = value
+
+    def set_max(self, value: float, **labels):
+        key = self.key(labels)
+        with self.lock:
+            if value > self.values.get(key, float("-inf")):
+                self.values[key] = value
+
+    def get(self, **labels):
+        return self.values.get(self.key(labels))
+
+    def samples(self):
+        if self.function is None:
+            with self.lock:
+                return [("", key, "", value) for key, value in sorted(self.values.items())]
+        try:
+            result = self.function()
+        except Exception as e:
+            logger.warning(f"Gauge {self.name} failed: {e}")
+            return []
+        if result is None:
+            return []
+        if not self.labelnames:
+            return [("", (), "", result)]
+        return [("", self.key(labels), "", value) for labels, value in result]
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per series: [count per bucket (non-cumulative, last is +Inf), sum]
+        self.series = {}
+
+    def observe(self, value: float, **labels):
+        key = self.key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def count(self, **labels) -> int:
+        series = self.series.get(self.key(labels))
+        return sum(series[0]) if series else 0
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for key, (counts, total) in sorted(self.series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    samples.append(("_bucket", key, f'le="{format_value(float(bound))}"', cumulative))
+                samples.append(("_sum", key, "", total))
+                samples.append(("_count", key, "", cumulative))
+        return samples
+
+class MetricsRegistry:
+    """Metrics rendered together in the Prometheus text format"""
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Duplicate metric {metric.name}")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=(), function=None) -> Gauge:
+        return self.register(Gauge(name, help, labelnames, function))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+class ListenerMetrics:
+    """The listener's metrics; the recording methods are safe to call from any thread"""
+    def __init__(self, registry: MetricsRegistry | None = None):
+        self.registry = registry or MetricsRegistry()
+        r = self.registry
+        self.notifications = r.counter(
+            "solana_listener_notifications_total", "Notifications received, by endpoint (or backfill)", ("source",))
+        self.duplicates = r.counter(
+            "solana_listener_duplicate_notifications_total", "Notifications dropped as already seen")
+        self.connects = r.counter(
+            "solana_listener_connects_total", "Successful (re)subscriptions per endpoint", ("endpoint",))
+        self.stale_connections = r.counter(
+            "solana_listener_stale_connections_total", "Connections replaced by the watchdog", ("endpoint", "reason"))
+        self.reconnect_seconds = r.histogram(
+            "solana_listener_reconnect_seconds", "Time from losing a connection to being subscribed again",
+            ("endpoint", "kind"))
+        self.events = r.counter(
+            "solana_listener_events_total", "Decoded program events, by event type", ("event_type",))
+        self.decode_seconds = r.histogram(
+            "solana_listener_decode_seconds", "Time to decode the events of one notification")
+        self.db_write_seconds = r.histogram(
+            "solana_listener_db_write_seconds", "Time to write one event or trade batch", ("kind",))
+        self.end_to_end_seconds = r.histogram(
+            "solana_listener_end_to_end_seconds", "Notification arrival to database commit", ("kind",))
+        self.processed_slot = r.gauge(
+            "solana_listener_processed_slot", "Highest slot written to the database")
+        self.head_slot = r.gauge(
+            "solana_listener_head_slot", "Latest slot reported by the RPC node")
+        r.gauge("solana_listener_slot_lag", "Head slot minus the highest written slot", function=self.slot_lag)
+
+    def slot_lag(self):
+        head, processed = self.head_slot.get(), self.processed_slot.get()
+        if head is None or processed is None:
+            return None
+        return max(head - processed, 0)
+
+    def record_write(self, kind: str, started: float, events: list):
+        """A write that began at perf_counter() `started` committed `events`"""
+        self.db_write_seconds.observe(time.perf_counter() - started, kind=kind)
+        now = time.time()
+        for event in events:
+            received_at = event.get("received_at")
+            if received_at is not None:
+                self.end_to_end_seconds.observe(now - received_at, kind=kind)
+            # processed-commitment slots run ahead of the confirmed head
+            if event.get("slot") is not None and not event.get("provisional"):
+                self.processed_slot.set_max(event["slot"])
+
+    def watch_inbox(self, queue):
+        """Gauges for the listener's NotificationQueue"""
+        r = self.registry
+        r.gauge("solana_listener_inbox_depth", "Notifications read off the socket, not yet processed",
+                function=queue.depth)
+        r.gauge("solana_listener_inbox_oldest_age_seconds", "How long the oldest queued notification has waited",
+                function=queue.oldest_age)
+        r.gauge("solana_listener_inbox_spilled", "Notifications written to the spill file so far",
+                function=lambda: queue.spilled)
+        r.gauge("solana_listener_inbox_dropped", "Notifications dropped because the inbox was full",
+                function=lambda: queue.dropped)
+
+    def watch_dispatcher(self, dispatcher):
+        """Gauges for the per-coin worker queues"""
+        r = self.registry
+        r.gauge("solana_listener_worker_queue_depth", "Events waiting on each DB worker", ("worker",),
+                function=lambda: [({"worker": index}, depth) for index, depth in enumerate(dispatcher.queue_depths())])
+        r.gauge("solana_listener_parked_events", "Events waiting for their coin to be created",
+                function=dispatcher.pending_count)
+
+    async def poll_head_slot(self, rpc, interval: float = 5, commitment: str = "confirmed"):
+        """Keep head_slot current from the RPC node, for the slot lag"""
+        while True:
+            try:
+                self.head_slot.set(await rpc.get_slot(commitment))
+            except Exception as e:
+                logger.warning(f"Could not fetch the head slot: {e}")
+            await asyncio.sleep(interval)
+
+class MetricsServer:
+    """Serves a registry at http://host:port/metrics"""
+    def __init__(self, registry: MetricsRegistry, host: str = "127.0.0.1", port: int = 9108):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.runner = None
+
+    async def metrics(self, request):
+        return web.Response(
+            body=self.registry.render().encode(),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self.metrics)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        try:
+            await site.start()
+        except OSError as e:
+            await self.stop()
+            raise OSError(e.errno, f"Cannot serve metrics on {self.host}:{self.port}: {e.strerror}") from e
+        logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
@@ -0,0 +1,55 @@
+import time
+
+class LogNotification:
+    """A program logs notification, reduced to what the event handlers need"""
+    __slots__ = ("signature", "slot", "logs", "err", "received_at", "program_id", "block_time", "delivery")
+
+    def __init__(self, signature, slot, logs, err=None, received_at=None, program_id=None, block_time=None):
+        self.signature = str(signature) if signature is not None else None
+        self.slot = slot
+        self.logs = list(logs or [])
+        self.err = err
+        self.received_at = received_at if received_at is not None else time.time()
+        # the subscribed program the notification came from, when known
+        self.program_id = str(program_id) if program_id is not None else None
+        # unix time of the block, when known (backfilled transactions); live ones have received_at
+        self.block_time = block_time
+        # set on hand-off when a checkpoint tracks the notification until it is committed
+        self.delivery = None
+
+    def __repr__(self):
+        return f"LogNotification(signature={self.signature!r}, slot={self.slot}, logs={len(self.logs)})"
+
+class SubscriptionMap:
+    """
+    Which program each logsSubscribe subscription on one connection belongs to.
+
+    Subscribe requests are sent one program at a time and the node confirms
+    each with (request id, subscription id). Request ids increase with every
+    request, so sorting the confirmations by request id lines them up with the
+    programs in the order they were subscribed, whatever order they arrive in.
+    """
+    def __init__(self, programs: list):
+        self.programs = [str(program) for program in programs]
+        self.confirmations = []
+        self.by_subscription = {}
+
+    def confirm(self, request_id: int, subscription_id: int):
+        self.confirmations.append((request_id, subscription_id))
+        self.confirmations.sort()
+        self.by_subscription = {
+            subscription: program
+            for program, (_, subscription) in zip(self.programs, self.confirmations)
+        }
+
+    def program_for(self, subscription_id) -> str | None:
+        program = self.by_subscription.get(subscription_id)
+        if program is None and len(self.programs) == 1:
+            return self.programs[0]
+        return program
+
+    def subscription_ids(self) -> list:
+        return list(self.by_subscription)
+
+    def complete(self) -> bool:
+        return len(self.confirmations) >= len(self.programs)
@@ -0,0 +1,47 @@
+import asyncio
+import logging
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+
+from systems.utils.ingest import expired_provisional
+
+logger = logging.getLogger(__name__)
+
+class ProvisionalReconciler:
+    """
+    Periodically finds provisional trades that were never confirmed within
+    `timeout` seconds and hands them to `submit(event_type, signature, event)`
+    as one ProvisionalExpired event per coin. Routing the rollback through the
+    coin's worker queue keeps it ordered with that coin's confirmed trades.
+    """
+    def __init__(self, submit, timeout: float = 60, interval: float = 5, find_expired=None):
+        self.submit = submit
+        self.timeout = timeout
+        self.interval = interval
+        self.find_expired = find_expired or sync_to_async(expired_provisional)
+        self.task = None
+
+    async def scan(self) -> int:
+        """Queue every expired provisional trade; returns how many were queued"""
+        expired = await self.find_expired(timedelta(seconds=self.timeout))
+        for coin_id, signatures in expired.items():
+            await self.submit("ProvisionalExpired", "", {"mint_address": coin_id, "signatures": signatures})
+        return sum(len(signatures) for signatures in expired.values())
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                queued = await self.scan()
+                if queued:
+                    logger.info(f"Rolling back {queued} unconfirmed provisional trades")
+            except Exception as e:
+                logger.error(f"Provisional reconciliation failed: {e}")
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
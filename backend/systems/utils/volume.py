@@ -0,0 +1,55 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import DecimalField, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from systems.models import PriceCandle
+from systems.utils.candles import INTERVAL_SECONDS, bucket_start
+
+# rolling window -> (candle interval it is summed from, number of buckets)
+WINDOWS = {
+    "24h": ("5m", 288),
+    "7d": ("1h", 168),
+    "30d": ("1d", 30),
+}
+
+def window_start(window: str, now=None):
+    """
+    Start of the oldest bucket in the window. The window is the current
+    (partial) bucket plus the ones before it, so it is exact to one bucket.
+    """
+    interval, buckets = WINDOWS[window]
+    now = now or timezone.now()
+    return bucket_start(now, interval) - timedelta(seconds=INTERVAL_SECONDS[interval] * (buckets - 1))
+
+def window_candles(window: str, now=None):
+    interval, _ = WINDOWS[window]
+    return PriceCandle.objects.filter(interval=interval, bucket_start__gte=window_start(window, now))
+
+def rolling_totals(coin_ids, window: str, now=None) -> dict:
+    """
+    {coin_id: (SOL volume, trade count)} over a rolling window, summed from
+    at most a fixed number of candle rows per coin however many trades there
+    were. Coins without trades in the window are (0, 0).
+    """
+    totals = {coin_id: (Decimal(0), 0) for coin_id in coin_ids}
+    for coin_id, volume, trades in (
+        window_candles(window, now).filter(coin_id__in=coin_ids)
+        .values('coin_id').annotate(total_volume=Sum('volume'), total_trades=Sum('trade_count'))
+        .values_list('coin_id', 'total_volume', 'total_trades')
+    ):
+        totals[coin_id] = (volume, trades)
+    return totals
+
+def annotate_rolling(coins, window: str, now=None):
+    """Add volume_<window> and trades_<window> to a Coin queryset, as subqueries of the same SELECT"""
+    candles = window_candles(window, now).filter(coin_id=OuterRef('address')).values('coin_id')
+    volume = candles.annotate(total=Sum('volume')).values('total')[:1]
+    trades = candles.annotate(total=Sum('trade_count')).values('total')[:1]
+    volume_field = DecimalField(max_digits=24, decimal_places=10)
+    return coins.annotate(**{
+        f"volume_{window}": Coalesce(Subquery(volume, output_field=volume_field), Value(Decimal(0)), output_field=volume_field),
+        f"trades_{window}": Coalesce(Subquery(trades, output_field=IntegerField()), Value(0)),
+    })
@@ -9,6 +9,9 @@ from rest_framework.generics import RetrieveUpdateAPIView
 from rest_framework.views import APIView
 from django.db.models import Q
 from django.core.cache import cache
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from datetime import datetime, timezone as dt_timezone
 
 from rest_framework.authtoken.models import Token
 
@@ -16,9 +19,10 @@ from .models import (
     DeveloperScore, 
     TraderScore, 
     CoinDRCScore, 
-    Coin, UserCoinHoldings, Trade, SolanaUser,
+    Coin, UserCoinHoldings, Trade, SolanaUser, PriceCandle,
 )
 
+from .utils.volume import annotate_rolling
 from .serializers import (
     DeveloperScoreSerializer, 
     TraderScoreSerializer, 
@@ -28,10 +32,24 @@ from .serializers import (
     UserCoinHoldingsSerializer, 
     TradeSerializer, 
     SolanaUserSerializer,
+    PriceCandleSerializer,
 )
 
 User = get_user_model()
 
+def parse_time(value):
+    """Unix seconds or an ISO 8601 string -> aware datetime (None if not given)"""
+    if not value:
+        return None
+    try:
+        return datetime.fromtimestamp(float(value), tz=dt_timezone.utc)
+    except (ValueError, OverflowError, OSError):
+        pass
+    moment = parse_datetime(value)
+    if moment is None:
+        raise ValueError(f'Invalid time: {value}')
+    return moment if timezone.is_aware(moment) else timezone.make_aware(moment, dt_timezone.utc)
+
 class RecalculateDailyScoresView(APIView):
     permission_classes = [IsCronjobRequest]
 
@@ -55,10 +73,14 @@ class CoinViewSet(RestrictedViewset):
     """
     API endpoint for Coins
     """
-    queryset = Coin.objects.all()
+    queryset = Coin.objects.select_related('creator')
     serializer_class = CoinSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     lookup_field = 'address'
+
+    def get_queryset(self):
+        # the 24h window moves, so it is computed per request
+        return annotate_rolling(super().get_queryset(), "24h")
     
     @action(detail=False, methods=['get'], url_path='top-coins')
     def top_coins(self, request):
@@ -74,7 +96,7 @@ class CoinViewSet(RestrictedViewset):
         if cached:
             return Response(cached)
 
-        coins = Coin.objects.order_by('-score')[:limit]
+        coins = self.get_queryset().order_by('-score')[:limit]
         serializer = self.get_serializer(coins, many=True)
         cache.set(cache_key, serializer.data, timeout=60)  # cache for 1 minute
 
@@ -96,6 +118,35 @@ class CoinViewSet(RestrictedViewset):
         serializer = TradeSerializer(trades, many=True)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'])
+    def candles(self, request, address=None):
+        """
+        OHLCV candles for a coin, oldest first, read straight from PriceCandle.
+        ?interval= is 1m, 5m, 1h (default) or 1d; ?from= and ?to= are Unix
+        seconds or ISO 8601 times (to is exclusive). Without from, the most
+        recent ?limit= candles (default 500, at most 1000) are returned.
+        """
+        interval = request.query_params.get('interval', '1h')
+        if interval not in dict(PriceCandle.INTERVALS):
+            return Response({'detail': f'Invalid interval, use one of {", ".join(dict(PriceCandle.INTERVALS))}'}, status=400)
+        try:
+            start = parse_time(request.query_params.get('from'))
+            end = parse_time(request.query_params.get('to'))
+            limit = int(request.query_params.get('limit', 500))
+            limit = max(1, min(limit, 1000))
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=400)
+
+        candles = PriceCandle.objects.filter(coin_id=address, interval=interval)
+        if end:
+            candles = candles.filter(bucket_start__lt=end)
+        if start:
+            candles = candles.filter(bucket_start__gte=start).order_by('bucket_start')[:limit]
+        else:
+            candles = reversed(candles.order_by('-bucket_start')[:limit])
+        serializer = PriceCandleSerializer(candles, many=True)
+        return Response(serializer.data)
+
 class UserCoinHoldingsViewSet(RestrictedViewset):
     """
     API endpoint for User Coin Holdings
@@ -188,7 +239,7 @@ class UserViewSet(RestrictedViewset): # check later
     def created_coins(self, request, wallet_address=None):
         """Get all coins created by a specific user"""
         user = self.get_object()
-        coins = user.coins.all()
+        coins = annotate_rolling(user.coins.select_related('creator'), "24h")
         from .serializers import CoinSerializer
         serializer = CoinSerializer(coins, many=True)
         return Response(serializer.data)